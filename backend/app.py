@@ -1,44 +1,189 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room, leave_room
 import os
-import fitz  # PyMuPDF for PDF processing
 from openai import OpenAI
 from dotenv import load_dotenv
 from supabase import create_client, Client
 from functools import wraps
-from datetime import datetime
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import base64
+import hashlib
+import inspect
+import json
+import logging
+import threading
+import time
 import uuid
 
+import log_sink
+from cache import RecentMessages, TTLCache
+from llm_jobs import JobQueue, QueueFull, public_job
+from message_buffer import WriteBehindBuffer, claim_journal
+from message_search import MessageIndex, snippet
+from metrics import Registry, TimedClient
+from pdf_extract import ExtractionCache, content_hash, extract_text
+from pdf_index import DocumentIndex
+from presence import STATUSES, PresenceTracker
+from office import PlayerRegistry, SnapshotBuilder, parse_move
+from office_wire import decode_move, encode_snapshot
+from recurrence import expand_event, parse_datetime, parse_rule
+from scaleout import SLOT_SIZE, make_client_manager, pick_slot
+from summaries import ConversationSummaries
+from serving import ASYNC_MODE, is_evented, run_blocking
+from token_verifier import TokenVerifier
+from typing_indicators import TypingTracker
+
 # Load environment variables
 load_dotenv()
 
+# Logging goes through a queue drained by a background thread (see log_sink.py)
+log_sink.configure(os.getenv('LOG_LEVEL', 'INFO'), os.getenv('LOG_FORMAT', 'text'))
+log = logging.getLogger('office')
+
+# Metrics, served in the Prometheus text format at /metrics
+metrics = Registry()
+http_seconds = metrics.histogram('http_request_duration_seconds', 'HTTP request latency by route',
+                                 ('endpoint', 'method', 'status'))
+socket_event_seconds = metrics.histogram('socketio_event_duration_seconds', 'Socket.IO handler latency by event', ('event',))
+supabase_seconds = metrics.histogram('supabase_request_duration_seconds', 'Supabase call latency', ('table', 'method'))
+openai_seconds = metrics.histogram('openai_request_duration_seconds', 'OpenAI call latency (whole stream for kind=stream)', ('kind',))
+pdf_extract_seconds = metrics.histogram('pdf_extract_duration_seconds', 'PDF text extraction time')
+socket_emits = metrics.counter('socketio_emits_total', 'Socket.IO emits by event', ('event',))
+socket_recipients = metrics.counter('socketio_emit_recipients_total',
+                                    'Sockets on this process an emit was addressed to, by event', ('event',))
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
-CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
-
-# Initialize SocketIO with CORS
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True,
+     expose_headers=['X-Prev-Cursor', 'X-Next-Cursor', 'X-Has-More'])
+
+# Initialize SocketIO with CORS; with SOCKETIO_MESSAGE_QUEUE set, emits and
+# office presence are shared with the other backend processes (see scaleout.py)
+socket_manager = make_client_manager(
+    os.getenv('SOCKETIO_MESSAGE_QUEUE', ''),
+    presence_ttl=float(os.getenv('PRESENCE_TTL', '15'))
+)
+
+def room_size(room, namespace='/'):
+    """Sockets in a room on this process (a sid is its own room; None is everyone)"""
+    return len(socketio.server.manager.rooms.get(namespace, {}).get(room, ()))
+
+def count_emit(event, room=None, namespace='/'):
+    socket_emits.inc(event=event)
+    socket_recipients.inc(room_size(room, namespace), event=event)
+
+class InstrumentedSocketIO(SocketIO):
+    """SocketIO whose event handlers are timed and whose emits are counted"""
+
+    def on(self, message, namespace=None):
+        register = super().on(message, namespace)
+
+        def decorator(handler):
+            signature = inspect.signature(handler)
+
+            # wraps() also exposes the handler's signature; binding first makes a
+            # call socketio would retry with other arguments fail before it is timed
+            @wraps(handler)
+            def timed(*args, **kwargs):
+                signature.bind(*args, **kwargs)
+                with socket_event_seconds.time(event=message):
+                    return handler(*args, **kwargs)
+            register(timed)
+            return handler
+        return decorator
+
+    def emit(self, event, *args, **kwargs):
+        count_emit(event, kwargs.get('to') or kwargs.get('room'), kwargs.get('namespace') or '/')
+        return super().emit(event, *args, **kwargs)
+
+socketio = InstrumentedSocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE, client_manager=socket_manager)
+if socket_manager:
+    log.info(f"Socket.IO message queue: {socket_manager.name}")
+
+def room_counts():
+    """{kind: (rooms, members)} for the rooms on this process"""
+    counts = {}
+    rooms = socketio.server.manager.rooms.get('/', {})
+    for room, members in list(rooms.items()):
+        if room is None or room in members:
+            continue  # everyone, and each socket's own room
+        kind = room.split(':', 1)[0] if ':' in room else ('office' if room.startswith('office') else 'conversation')
+        total = counts.setdefault(kind, [0, 0])
+        total[0] += 1
+        total[1] += len(members)
+    return counts
+
+metrics.gauge('socketio_rooms', 'Socket.IO rooms on this process by kind', ('kind',),
+              callback=lambda: {(kind, ): rooms for kind, (rooms, _) in room_counts().items()})
+metrics.gauge('socketio_room_members', 'Room memberships on this process by kind', ('kind',),
+              callback=lambda: {(kind, ): members for kind, (_, members) in room_counts().items()})
+metrics.gauge('socketio_connected_sockets', 'Sockets connected to this process',
+              callback=lambda: {(): room_size(None)})
+metrics.gauge('log_records_dropped', 'Log records dropped because the log queue was full',
+              callback=lambda: {(): (log_sink.stats() or {}).get('dropped', 0)})
 
 # Initialize Supabase client
 supabase_url = os.getenv('SUPABASE_URL')
 supabase_key = os.getenv('SUPABASE_SERVICE_KEY')
 
 if not supabase_url or not supabase_key:
-    print("WARNING: Supabase credentials not found!")
+    log.warning("Supabase credentials not found!")
     supabase: Client = None
 else:
-    supabase: Client = create_client(supabase_url, supabase_key)
-    print(f"✓ Connected to Supabase: {supabase_url}")
+    supabase: Client = TimedClient(create_client(supabase_url, supabase_key), supabase_seconds)
+    log.info(f"Connected to Supabase: {supabase_url}")
 
 # Initialize OpenAI client
 openai_key = os.getenv('OPENAI_API_KEY')
 if not openai_key:
-    print("WARNING: OPENAI_API_KEY not found!")
+    log.warning("OPENAI_API_KEY not found!")
     openai_client = None
 else:
     openai_client = OpenAI(api_key=openai_key)
-    print("✓ OpenAI client initialized")
+    log.info("OpenAI client initialized")
+
+def _lookup_user_remote(token):
+    """Verify a token by asking Supabase Auth directly"""
+    with supabase_seconds.time(table='auth', method='get_user'):
+        response = supabase.auth.get_user(token)
+    return response.user.id, response.user.email
+
+# Verify JWTs locally when a secret or JWKS URL is configured; Supabase is only
+# called on cache misses without a local key, or every AUTH_REVALIDATE_SECONDS
+# per token to re-check for revocation
+token_verifier = TokenVerifier(
+    _lookup_user_remote,
+    secret=os.getenv('SUPABASE_JWT_SECRET'),
+    jwks_url=os.getenv('SUPABASE_JWKS_URL'),
+    cache_size=int(os.getenv('AUTH_CACHE_SIZE', '10000')),
+    cache_ttl=float(os.getenv('AUTH_CACHE_TTL', '300')),
+    revalidate_after=float(os.getenv('AUTH_REVALIDATE_SECONDS', '300'))
+)
+log.info("Token verification mode: %s", token_verifier.stats()['mode'])
+
+if socket_manager:
+    # a token logged out on one node is refused by every node
+    socket_manager.subscribe('revoked_tokens', lambda payload: token_verifier.revoke(
+        payload['key'], payload['exp']))
+
+# ============================================
+# INSTRUMENTATION
+# ============================================
+
+@app.before_request
+def start_timer():
+    request.environ['office.started'] = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    """Per-route latency; streamed responses are timed up to their first byte"""
+    started = request.environ.get('office.started')
+    if started is not None:
+        http_seconds.observe(time.perf_counter() - started, endpoint=request.endpoint or 'unmatched',
+                             method=request.method, status=response.status_code)
+    return response
 
 # ============================================
 # AUTH MIDDLEWARE
@@ -51,27 +196,25 @@ def require_auth(f):
         auth_header = request.headers.get('Authorization')
 
         if not auth_header or not auth_header.startswith('Bearer '):
-            print("❌ Auth failed: Missing or invalid authorization header")
+            log.warning("Auth failed: Missing or invalid authorization header")
             return jsonify({"error": "Missing or invalid authorization header"}), 401
 
         token = auth_header.split('Bearer ')[1]
 
         try:
-            # Verify JWT token with Supabase by making authenticated request
-            response = supabase.auth.get_user(token)
+            # Verify JWT locally (cached); falls back to Supabase when needed
+            user = token_verifier.verify(token)
 
             # Set user info on request object
-            request.user_id = response.user.id
-            request.user_email = response.user.email
-
-            print(f"✓ Auth success for user: {response.user.email} (ID: {response.user.id})")
-            return f(*args, **kwargs)
+            request.user_id = user['user_id']
+            request.user_email = user['email']
+            request.access_token = token
         except Exception as e:
-            print(f"❌ Auth failed: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            log.warning("Auth failed: %s", e)
             return jsonify({"error": "Invalid or expired token", "details": str(e)}), 401
 
+        return f(*args, **kwargs)
+
     return decorated_function
 
 # ============================================
@@ -140,10 +283,8 @@ def login():
         })
 
         if response.user and response.session:
-            # Get user profile from database
-            user_profile = supabase.table('users').select('*').eq('id', response.user.id).execute()
-
-            profile = user_profile.data[0] if user_profile.data else {
+            # Get user profile (cached)
+            profile = get_user_account(response.user.id) or {
                 "id": response.user.id,
                 "email": response.user.email,
                 "username": response.user.email.split('@')[0]
@@ -167,6 +308,9 @@ def login():
 def logout():
     """Log out the current user"""
     try:
+        key, exp = token_verifier.invalidate(request.access_token)
+        if socket_manager:
+            socket_manager.publish('revoked_tokens', {'key': key, 'exp': exp})
         supabase.auth.sign_out()
         return jsonify({"message": "Logged out successfully"}), 200
     except Exception as e:
@@ -177,41 +321,267 @@ def logout():
 def get_current_user():
     """Get current user profile"""
     try:
-        user_profile = supabase.table('users').select('*').eq('id', request.user_id).execute()
+        profile = get_user_account(request.user_id)
 
-        if user_profile.data:
-            return jsonify(user_profile.data[0]), 200
+        if profile:
+            return jsonify(profile), 200
         else:
             return jsonify({"error": "User not found"}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Profile fields a user may change about themselves
+PROFILE_EDITABLE = ('username', 'full_name', 'avatar_url', 'bio')
+
+@app.route('/auth/me', methods=['PUT', 'PATCH'])
+@require_auth
+def update_current_user():
+    """Update the current user's profile; the cached copies are replaced on every node"""
+    data = request.json or {}
+    changes = {field: data[field] for field in PROFILE_EDITABLE if field in data}
+
+    if not changes:
+        return jsonify({"error": f"Nothing to update; editable fields are {', '.join(PROFILE_EDITABLE)}"}), 400
+    if 'username' in changes and not str(changes['username'] or '').strip():
+        return jsonify({"error": "username cannot be empty"}), 400
+
+    try:
+        result = supabase.table('users').update(changes).eq('id', request.user_id).execute()
+        if not result.data:
+            return jsonify({"error": "User not found"}), 404
+
+        remember_user(result.data[0])
+        return jsonify(result.data[0]), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/users/batch', methods=['POST'])
+@require_auth
+def get_users_batch():
+    """Public profiles for many users in one call: {"ids": [...]} -> {id: profile}
+
+    Unknown ids are left out. Answered from the profile cache, with one query
+    for whatever is missing.
+    """
+    ids = (request.json or {}).get('ids')
+    if not isinstance(ids, list) or not all(isinstance(user_id, str) for user_id in ids):
+        return jsonify({"error": "ids must be a list of user ids"}), 400
+    if len(ids) > USERS_MAX_BATCH:
+        return jsonify({"error": f"At most {USERS_MAX_BATCH} ids per request"}), 400
+
+    try:
+        return jsonify(get_user_profiles(ids)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ============================================
+# CACHED LOOKUPS
+# ============================================
+
+# Public profile fields, embedded as `users` on messages
+PROFILE_FIELDS = ('id', 'username', 'full_name', 'avatar_url')
+PROFILE_COLUMNS = ', '.join(PROFILE_FIELDS)
+USERS_MAX_BATCH = int(os.getenv('USERS_MAX_BATCH', '500'))
+
+# Small pool for overlapping independent Supabase calls within one request
+io_pool = ThreadPoolExecutor(max_workers=int(os.getenv('IO_POOL_SIZE', '8')))
+
+# (conversation_id, user_id) -> bool; the most repeated query in the app
+membership_cache = TTLCache(
+    maxsize=int(os.getenv('MEMBERSHIP_CACHE_SIZE', '50000')),
+    ttl=float(os.getenv('MEMBERSHIP_CACHE_TTL', '300'))
+)
+MEMBERSHIP_NEGATIVE_TTL = float(os.getenv('MEMBERSHIP_NEGATIVE_TTL', '10'))
+# user_id -> public profile, and user_id -> full users row (for /auth/me);
+# both are written through when a profile changes
+profile_cache = TTLCache(
+    maxsize=int(os.getenv('PROFILE_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('PROFILE_CACHE_TTL', '600'))
+)
+account_cache = TTLCache(
+    maxsize=int(os.getenv('PROFILE_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('PROFILE_CACHE_TTL', '600'))
+)
+
+def is_participant(conversation_id, user_id):
+    """Check conversation membership, answering from cache when possible"""
+    key = (conversation_id, user_id)
+    cached = membership_cache.get(key)
+    if cached is not None:
+        return cached
+
+    participant = supabase.table('conversation_participants').select('user_id').eq(
+        'conversation_id', conversation_id
+    ).eq('user_id', user_id).execute()
+
+    is_member = bool(participant.data)
+    # Non-members are cached briefly so a just-added user is not locked out long
+    membership_cache.set(key, is_member, ttl=None if is_member else MEMBERSHIP_NEGATIVE_TTL)
+    return is_member
+
+def remember_membership(conversation_id, user_ids):
+    """Record participants that were just added to a conversation"""
+    for user_id in user_ids:
+        membership_cache.set((conversation_id, user_id), True)
+
+def invalidate_membership(conversation_id, user_id=None):
+    """Forget cached membership for one participant or a whole conversation"""
+    if user_id is not None:
+        membership_cache.pop((conversation_id, user_id))
+    else:
+        membership_cache.evict_if(lambda key: key[0] == conversation_id)
+
+def get_user_profile(user_id):
+    """Public profile fields for a user, cached"""
+    profile = profile_cache.get(user_id)
+    if profile is None:
+        result = supabase.table('users').select(PROFILE_COLUMNS).eq('id', user_id).execute()
+        profile = result.data[0] if result.data else None
+        if profile:
+            profile_cache.set(user_id, profile)
+    return profile
+
+def get_user_profiles(user_ids):
+    """{user_id: public profile} for many users, one query for the cache misses"""
+    profiles = {}
+    missing = []
+    for user_id in dict.fromkeys(user_ids):
+        profile = profile_cache.get(user_id)
+        if profile is None:
+            missing.append(user_id)
+        else:
+            profiles[user_id] = profile
+    if missing:
+        for row in supabase.table('users').select(PROFILE_COLUMNS).in_('id', missing).execute().data:
+            profile_cache.set(row['id'], row)
+            profiles[row['id']] = row
+    return profiles
+
+def attach_profiles(messages):
+    """Embed the sender's profile as `users` on each message (in place)"""
+    profiles = get_user_profiles([m['sender_id'] for m in messages if not m.get('users')])
+    for message in messages:
+        if not message.get('users'):
+            message['users'] = profiles.get(message['sender_id'])
+    return messages
+
+def get_user_account(user_id):
+    """Full users row for the user themselves, cached"""
+    row = account_cache.get(user_id)
+    if row is None:
+        result = supabase.table('users').select('*').eq('id', user_id).execute()
+        row = result.data[0] if result.data else None
+        if row:
+            remember_user(row, publish=False)
+    return row
+
+def remember_user(row, publish=True):
+    """Write a users row through to both caches, and to other nodes when it changed"""
+    account_cache.set(row['id'], row)
+    profile_cache.set(row['id'], {field: row.get(field) for field in PROFILE_FIELDS})
+    if publish and socket_manager:
+        socket_manager.publish('profiles', {'user': row})
+
+if socket_manager:
+    socket_manager.subscribe('profiles', lambda payload: remember_user(payload['user'], publish=False))
+
 # ============================================
 # CONVERSATIONS ROUTES
 # ============================================
 
+# Each user's conversation list with last message and unread counts, updated
+# as messages are sent (sql/get_conversation_summaries.sql builds it in one query)
+conversation_summaries = ConversationSummaries(ttl=float(os.getenv('CONVERSATION_LIST_TTL', '300')))
+summaries_rpc_available = True
+
+def forget_conversation_lists(user_ids, publish=True):
+    for user_id in user_ids:
+        conversation_summaries.forget(user_id)
+    if publish and socket_manager:
+        socket_manager.publish('conversation_lists', {'user_ids': list(user_ids)})
+
+if socket_manager:
+    socket_manager.subscribe('conversation_lists', lambda payload: forget_conversation_lists(
+        payload['user_ids'], publish=False))
+
+def latest_message(conversation_id):
+    """Newest message of a conversation, from the recent-messages cache when possible"""
+    cached = recent_messages.get(conversation_id)
+    if cached and cached[0]:
+        return cached[0][-1]
+    rows = supabase.table('messages').select(
+        'id, content, sender_id, created_at'
+    ).eq('conversation_id', conversation_id).order(
+        'created_at', desc=True
+    ).order('id', desc=True).limit(1).execute().data
+    return attach_profiles(rows)[0] if rows else None
+
+def fetch_conversation_summaries(user_id):
+    """Conversations with last_message, last_activity_at and unread_count, most recent first"""
+    global summaries_rpc_available
+    if summaries_rpc_available:
+        try:
+            return supabase.rpc('get_conversation_summaries', {'p_user_id': user_id}).execute().data
+        except Exception as e:
+            if getattr(e, 'code', None) != 'PGRST202':
+                raise
+            log.warning("get_conversation_summaries RPC not installed, using fallback queries")
+            summaries_rpc_available = False
+
+    result = supabase.table('conversation_participants').select(
+        'conversation_id, conversations(*)'
+    ).eq('user_id', user_id).execute()
+    conversations = [item['conversations'] for item in result.data if item.get('conversations')]
+
+    # Without the SQL install there is no last_read_at, so unread counts start at zero
+    last_messages = io_pool.map(latest_message, [c['id'] for c in conversations])
+    for conversation, message in zip(conversations, last_messages):
+        conversation['last_message'] = message
+        conversation['last_activity_at'] = message['created_at'] if message else conversation.get('created_at')
+        conversation['unread_count'] = 0
+    return sorted(conversations, key=lambda c: c.get('last_activity_at') or '', reverse=True)
+
 @app.route('/conversations', methods=['GET'])
 @require_auth
 def get_conversations():
-    """Get all conversations for the current user"""
-    try:
-        print(f"📨 Fetching conversations for user: {request.user_id}")
+    """Get all conversations for the current user, most recent activity first
 
-        # Get conversations where user is a participant
-        result = supabase.table('conversation_participants').select(
-            'conversation_id, conversations(*)'
-        ).eq('user_id', request.user_id).execute()
+    Each conversation carries `last_message`, `last_activity_at` and the
+    user's `unread_count`.
+    """
+    try:
+        conversations = conversation_summaries.get(request.user_id)
+        if conversations is None:
+            log.debug("Fetching conversations for user: %s", request.user_id)
+            started = conversation_summaries.started()
+            conversations = fetch_conversation_summaries(request.user_id)
+            conversation_summaries.load(request.user_id, conversations, started)
+            log.debug("Returning %d conversations", len(conversations))
+        return jsonify(conversations), 200
+    except Exception as e:
+        log.exception("Error in get_conversations")
+        return jsonify({"error": str(e)}), 500
 
-        print(f"✓ Found {len(result.data)} participant records")
+@app.route('/conversations/<conversation_id>/read', methods=['POST'])
+@require_auth
+def mark_conversation_read(conversation_id):
+    """Reset the current user's unread count for a conversation"""
+    try:
+        if not is_participant(conversation_id, request.user_id):
+            return jsonify({"error": "Not authorized"}), 403
 
-        conversations = [item['conversations'] for item in result.data if item.get('conversations')]
+        try:
+            supabase.table('conversation_participants').update({
+                "last_read_at": datetime.utcnow().isoformat() + 'Z'
+            }).eq('conversation_id', conversation_id).eq('user_id', request.user_id).execute()
+        except Exception as e:
+            # last_read_at only exists once sql/get_conversation_summaries.sql is installed
+            if getattr(e, 'code', None) not in ('PGRST204', '42703'):
+                raise
+        conversation_summaries.mark_read(conversation_id, request.user_id)
 
-        print(f"✓ Returning {len(conversations)} conversations")
-        return jsonify(conversations), 200
+        return jsonify({"conversation_id": conversation_id, "unread_count": 0}), 200
     except Exception as e:
-        print(f"❌ Error in get_conversations: {str(e)}")
-        import traceback
-        traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 @app.route('/conversations/<conversation_id>', methods=['GET'])
@@ -219,12 +589,8 @@ def get_conversations():
 def get_conversation(conversation_id):
     """Get a specific conversation"""
     try:
-        # Verify user is participant
-        participant = supabase.table('conversation_participants').select('*').eq(
-            'conversation_id', conversation_id
-        ).eq('user_id', request.user_id).execute()
-
-        if not participant.data:
+        # Verify user is participant (cached)
+        if not is_participant(conversation_id, request.user_id):
             return jsonify({"error": "Not authorized"}), 403
 
         conversation = supabase.table('conversations').select('*').eq('id', conversation_id).execute()
@@ -269,6 +635,9 @@ def create_conversation():
             ]
             supabase.table('conversation_participants').insert(participants).execute()
 
+        remember_membership(conv_id, [request.user_id, *participant_ids])
+        forget_conversation_lists([request.user_id, *participant_ids])
+
         return jsonify(conversation.data[0]), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -277,28 +646,249 @@ def create_conversation():
 # MESSAGES ROUTES
 # ============================================
 
+MESSAGES_PAGE_SIZE = int(os.getenv('MESSAGES_PAGE_SIZE', '50'))
+MESSAGES_MAX_PAGE_SIZE = int(os.getenv('MESSAGES_MAX_PAGE_SIZE', '200'))
+MESSAGES_MAX_BATCH = int(os.getenv('MESSAGES_MAX_BATCH', '500'))
+
+# Optional write-behind mode: messages are broadcast as soon as they are
+# journaled locally and stored in ordered batches in the background
+MESSAGE_WRITE_BEHIND = os.getenv('MESSAGE_WRITE_BEHIND', '0') == '1'
+
+def store_messages(rows):
+    """Idempotent insert used by the write-behind flusher"""
+    supabase.table('messages').upsert(rows, on_conflict='id', ignore_duplicates=True).execute()
+
+def is_data_error(e):
+    """Postgres data (22xxx) and constraint (23xxx) errors won't succeed on retry"""
+    return str(getattr(e, 'code', '') or '').startswith(('22', '23'))
+
+def report_rejected_message(row, error):
+    socketio.emit('message_failed', {
+        'conversation_id': row['conversation_id'],
+        'message_id': row['id'],
+        'error': str(error)
+    }, room=user_room(row['sender_id']))
+
+def message_journal_path(slot):
+    """Journal of worker slot n: MESSAGE_JOURNAL (default data/message_journal.log), then .1, .2, ..."""
+    path = os.getenv('MESSAGE_JOURNAL', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'message_journal.log'))
+    if slot:
+        root, ext = os.path.splitext(path)
+        path = f"{root}.{slot}{ext}"
+    return path
+
+message_buffer = None
+if MESSAGE_WRITE_BEHIND:
+    # each worker process takes its own journal so none replays another's rows
+    message_buffer = claim_journal(lambda journal_path: WriteBehindBuffer(
+        store_messages,
+        journal_path,
+        batch_size=int(os.getenv('MESSAGE_FLUSH_BATCH', '100')),
+        flush_interval=float(os.getenv('MESSAGE_FLUSH_INTERVAL', '0.05')),
+        fsync=os.getenv('MESSAGE_JOURNAL_FSYNC', '0') == '1',
+        is_permanent=is_data_error,
+        on_reject=report_rejected_message
+    ), message_journal_path).start()
+    log.info("Write-behind message persistence enabled (journal %s)", message_buffer.journal_path)
+
+def insert_messages(rows):
+    """Store message rows (or queue them in write-behind mode); returns them with ids"""
+    if message_buffer:
+        return message_buffer.append(rows)
+    return supabase.table('messages').insert(rows).execute().data
+
+# Newest messages of active conversations, so opening one doesn't hit the database
+RECENT_MESSAGES = int(os.getenv('RECENT_MESSAGES', '200'))
+recent_messages = RecentMessages(
+    per_conversation=RECENT_MESSAGES,
+    max_bytes=int(os.getenv('RECENT_MESSAGES_MAX_MB', '32')) * 1024 * 1024
+)
+
+def remember_recent(conversation_id, messages, publish=True):
+    """Keep cached history and conversation lists current after a send (on every node)"""
+    messages = [{k: v for k, v in m.items() if k != 'client_id'} for m in messages]
+    recent_messages.append(conversation_id, messages)
+    conversation_summaries.record(conversation_id, messages[-1])
+    index_messages(messages)
+    if publish and socket_manager:
+        socket_manager.publish('recent_messages', {'conversation_id': conversation_id, 'messages': messages})
+
+if socket_manager:
+    socket_manager.subscribe('recent_messages', lambda payload: remember_recent(
+        payload['conversation_id'], payload['messages'], publish=False))
+
+def fill_recent(conversation_id):
+    """Load the newest RECENT_MESSAGES messages into the cache"""
+    version = recent_messages.version(conversation_id)
+    rows = supabase.table('messages').select('*').eq('conversation_id', conversation_id).order(
+        'created_at', desc=True
+    ).order('id', desc=True).limit(RECENT_MESSAGES + 1).execute().data
+    complete = len(rows) <= RECENT_MESSAGES
+    rows = rows[:RECENT_MESSAGES]
+    rows.reverse()
+    if message_buffer:
+        rows, _ = merge_pending(conversation_id, rows, False, RECENT_MESSAGES * 2, None)
+    attach_profiles(rows)
+    recent_messages.load(conversation_id, rows, complete, version)
+    return rows, complete
+
+def cached_page(conversation_id, limit, before):
+    """(rows, has_more) for the newest page, or an older one still in memory; None to ask the database"""
+    if limit > RECENT_MESSAGES:
+        return None
+    cached = recent_messages.get(conversation_id)
+    if cached is None:
+        if before:
+            return None
+        cached = fill_recent(conversation_id)
+    messages, complete = cached
+
+    if before:
+        messages = [m for m in messages if (m['created_at'], m['id']) < tuple(before)]
+    if len(messages) > limit:
+        return messages[-limit:], True
+    if complete:
+        return messages, False
+    return None if before else (messages, True)
+
+def merge_pending(conversation_id, rows, has_more, limit, after):
+    """Add write-behind messages that are not stored yet to the newest page"""
+    if after and has_more:
+        return rows, has_more  # they belong on a later page
+
+    def key(message):
+        return (message['created_at'], message['id'])
+
+    stored = {row['id'] for row in rows}
+    pending = [
+        message for message in message_buffer.pending(lambda row: row['conversation_id'] == conversation_id)
+        if message['id'] not in stored and (not after or key(message) > tuple(after))
+    ]
+    if not pending:
+        return rows, has_more
+
+    attach_profiles(pending)
+    merged = sorted(rows + pending, key=key)
+    has_more = has_more or len(merged) > limit
+    return (merged[:limit] if after else merged[-limit:]), has_more
+
+def encode_cursor(message):
+    """Opaque keyset cursor for a message: (created_at, id)"""
+    raw = f"{message['created_at']}|{message['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on malformed input"""
+    try:
+        created_at, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+        uuid.UUID(message_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return created_at, message_id
+
+def _keyset_filter(op, created_at, message_id):
+    """PostgREST filter for rows strictly before/after (created_at, id)"""
+    return f'created_at.{op}."{created_at}",and(created_at.eq."{created_at}",id.{op}.{message_id})'
+
 @app.route('/conversations/<conversation_id>/messages', methods=['GET'])
 @require_auth
 def get_messages(conversation_id):
-    """Get messages for a conversation"""
+    """Get a page of messages for a conversation
+
+    Query params (all optional):
+      limit  - page size (default MESSAGES_PAGE_SIZE)
+      before - cursor; return the page of older messages
+      after  - cursor; return the page of newer messages
+      since  - message id; return messages newer than it
+
+    Without a cursor the most recent page is returned. Messages are always in
+    ascending order; X-Prev-Cursor / X-Next-Cursor / X-Has-More headers carry
+    the cursors for the neighbouring pages.
+    """
     try:
-        # Verify user is participant
-        participant = supabase.table('conversation_participants').select('*').eq(
-            'conversation_id', conversation_id
-        ).eq('user_id', request.user_id).execute()
+        limit = min(max(int(request.args.get('limit', MESSAGES_PAGE_SIZE)), 1), MESSAGES_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
 
-        if not participant.data:
-            return jsonify({"error": "Not authorized"}), 403
+    before = request.args.get('before')
+    after = request.args.get('after')
+    since = request.args.get('since')
 
-        # Get messages with sender info
-        messages = supabase.table('messages').select(
-            '*, users(id, username, full_name, avatar_url)'
-        ).eq('conversation_id', conversation_id).order('created_at', desc=False).execute()
+    if sum(1 for arg in (before, after, since) if arg) > 1:
+        return jsonify({"error": "Use only one of before, after or since"}), 400
 
-        return jsonify(messages.data), 200
+    try:
+        before = decode_cursor(before) if before else None
+        after = decode_cursor(after) if after else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if since:
+        # ids are uuid columns; anything else would come back as a Postgres type error
+        try:
+            uuid.UUID(since)
+        except ValueError:
+            return jsonify({"error": "since must be a message id"}), 400
+
+    try:
+        # Verify user is participant (cached)
+        if not is_participant(conversation_id, request.user_id):
+            return jsonify({"error": "Not authorized"}), 403
+
+        if not (after or since):
+            page = cached_page(conversation_id, limit, before)
+            if page is not None:
+                return page_response(*page)
+
+        if since:
+            last_seen = supabase.table('messages').select('id, created_at').eq(
+                'id', since
+            ).eq('conversation_id', conversation_id).execute().data
+            if not last_seen and message_buffer:
+                last_seen = message_buffer.pending(lambda row: row['id'] == since and row['conversation_id'] == conversation_id)
+            if not last_seen:
+                return jsonify({"error": "Unknown message id for since"}), 400
+            after = (last_seen[0]['created_at'], last_seen[0]['id'])
+
+        # One row past the page to detect more; sender info comes from the profile cache
+        query = supabase.table('messages').select('*').eq('conversation_id', conversation_id)
+
+        if after:
+            query = query.or_(_keyset_filter('gt', *after))
+            query = query.order('created_at', desc=False).order('id', desc=False)
+        else:
+            if before:
+                query = query.or_(_keyset_filter('lt', *before))
+            query = query.order('created_at', desc=True).order('id', desc=True)
+
+        rows = query.limit(limit + 1).execute().data
+        has_more = len(rows) > limit
+        rows = attach_profiles(rows[:limit])
+        if not after:
+            rows.reverse()
+        if message_buffer and not before:
+            rows, has_more = merge_pending(conversation_id, rows, has_more, limit, after)
+
+        return page_response(rows, has_more)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def page_response(rows, has_more):
+    response = jsonify(rows)
+    response.headers['X-Has-More'] = 'true' if has_more else 'false'
+    if rows:
+        response.headers['X-Prev-Cursor'] = encode_cursor(rows[0])
+        response.headers['X-Next-Cursor'] = encode_cursor(rows[-1])
+    return response, 200
+
+def sender_profile(user_id, sender_future):
+    """Profile from a lookup started alongside an insert; the message is stored
+    by then, so a failed lookup falls back to a bare {'id'} instead of raising"""
+    try:
+        return sender_future.result() or {'id': user_id}
+    except Exception as e:
+        log.warning("No profile for sender %s: %s", user_id, e)
+        return {'id': user_id}
+
 @app.route('/conversations/<conversation_id>/messages', methods=['POST'])
 @require_auth
 def send_message(conversation_id):
@@ -308,35 +898,254 @@ def send_message(conversation_id):
 
     if not content:
         return jsonify({"error": "Message content is required"}), 400
+    if not isinstance(content, str):
+        return jsonify({"error": "Message content must be a string"}), 400
 
     try:
-        # Verify user is participant
-        participant = supabase.table('conversation_participants').select('*').eq(
-            'conversation_id', conversation_id
-        ).eq('user_id', request.user_id).execute()
-
-        if not participant.data:
+        # Verify user is participant (cached)
+        if not is_participant(conversation_id, request.user_id):
             return jsonify({"error": "Not authorized"}), 403
 
-        # Insert message
-        message = supabase.table('messages').insert({
+        # Resolve sender info while the insert is in flight
+        sender = profile_cache.get(request.user_id)
+        sender_future = None if sender else io_pool.submit(get_user_profile, request.user_id)
+
+        # Insert message (or queue it in write-behind mode); returns the row
+        message = insert_messages([{
             "conversation_id": conversation_id,
             "sender_id": request.user_id,
             "content": content
-        }).execute()
+        }])[0]
 
-        # Get message with sender info
-        message_with_sender = supabase.table('messages').select(
-            '*, users(id, username, full_name, avatar_url)'
-        ).eq('id', message.data[0]['id']).execute()
+        message['users'] = sender if sender else sender_profile(request.user_id, sender_future)
+        remember_recent(conversation_id, [message])
 
-        # Emit WebSocket event to conversation room
+        # Emit WebSocket event to conversation room as soon as the row exists
         socketio.emit('new_message', {
             'conversation_id': conversation_id,
-            'message': message_with_sender.data[0]
+            'message': message
         }, room=conversation_id)
+        typing_tracker.stop(conversation_id, request.user_id)
+
+        return jsonify(message), 201
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def ingest_messages(user_id, items):
+    """Validate, authorize and insert many messages in one round trip
+
+    items are {conversation_id, content, client_id?}; a malformed item
+    raises ValueError for the whole batch. Returns (messages, rejected) where
+    rejected lists {index, client_id, error} for items in conversations the
+    user is not part of; each room gets a single `new_messages` event.
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError("messages must be a non-empty list")
+    if len(items) > MESSAGES_MAX_BATCH:
+        raise ValueError(f"At most {MESSAGES_MAX_BATCH} messages per batch")
+
+    rejected = []
+    accepted = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"messages[{index}] must be an object")
+        content = item.get('content') or item.get('text')
+        if not isinstance(item.get('conversation_id'), str) or not item['conversation_id']:
+            raise ValueError(f"messages[{index}]: conversation_id is required")
+        if not isinstance(content, str) or not content:
+            raise ValueError(f"messages[{index}]: content must be a non-empty string")
+        accepted.append((index, item, content))
+
+    # One membership check per conversation (cached), run side by side on misses
+    conversation_ids = list({item['conversation_id'] for _, item, _ in accepted})
+    allowed = dict(zip(conversation_ids, io_pool.map(lambda c: is_participant(c, user_id), conversation_ids)))
+
+    rows = []
+    pending = []
+    for index, item, content in accepted:
+        if allowed[item['conversation_id']]:
+            rows.append({"conversation_id": item['conversation_id'], "sender_id": user_id, "content": content})
+            pending.append((index, item.get('client_id')))
+        else:
+            rejected.append({'index': index, 'client_id': item.get('client_id'), 'error': "Not authorized"})
+
+    if not rows:
+        return [], rejected
+
+    sender = profile_cache.get(user_id)
+    sender_future = None if sender else io_pool.submit(get_user_profile, user_id)
+
+    # Single multi-row insert; rows come back in the order they were sent
+    messages = insert_messages(rows)
+    sender = sender if sender else sender_profile(user_id, sender_future)
+
+    by_room = {}
+    for message, (index, client_id) in zip(messages, pending):
+        message['users'] = sender
+        if client_id is not None:
+            message['client_id'] = client_id
+        by_room.setdefault(message['conversation_id'], []).append(message)
+
+    for conversation_id, room_messages in by_room.items():
+        remember_recent(conversation_id, room_messages)
+        socketio.emit('new_messages', {
+            'conversation_id': conversation_id,
+            'messages': room_messages
+        }, room=conversation_id)
+        typing_tracker.stop(conversation_id, user_id)
+
+    rejected.sort(key=lambda r: r['index'])
+    return messages, rejected
+
+@app.route('/messages/batch', methods=['POST'])
+@require_auth
+def send_messages_batch():
+    """Send many messages, possibly to several conversations, in one request"""
+    data = request.json or {}
+    try:
+        messages, rejected = ingest_messages(request.user_id, data.get('messages'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify(message_with_sender.data[0]), 201
+    if messages:
+        status = 201
+    else:
+        status = 403 if any(r['error'] == "Not authorized" for r in rejected) else 400
+    return jsonify({"messages": messages, "rejected": rejected}), status
+
+# ============================================
+# SEARCH
+# ============================================
+
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '20'))
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_BACKFILL = os.getenv('SEARCH_BACKFILL', '1') == '1'
+
+# In-memory inverted index over message content (see message_search.py).
+# Sends are indexed as they happen; history from before startup is indexed
+# in the background, split at search_cutoff so nothing is indexed twice.
+message_index = MessageIndex()
+search_cutoff = datetime.now(timezone.utc) if SEARCH_BACKFILL else None
+search_backfill = {'state': 'off', 'indexed': 0}
+
+def index_messages(messages):
+    if search_cutoff is not None:
+        messages = [m for m in messages if parse_datetime(m['created_at']) >= search_cutoff]
+    message_index.add(messages)
+
+def backfill_search_index():
+    """Index messages stored before startup, oldest first, in keyset pages"""
+    batch = int(os.getenv('SEARCH_BACKFILL_BATCH', '1000'))
+    cutoff = search_cutoff.isoformat()
+    try:
+        if message_buffer:
+            message_buffer.flush_now()  # journaled messages replayed at startup
+        last = None
+        while True:
+            query = supabase.table('messages').select('id, conversation_id, content, created_at').lt('created_at', cutoff)
+            if last:
+                query = query.or_(_keyset_filter('gt', *last))
+            rows = query.order('created_at', desc=False).order('id', desc=False).limit(batch).execute().data
+            search_backfill['indexed'] += message_index.add(rows)
+            if len(rows) < batch:
+                break
+            last = (rows[-1]['created_at'], rows[-1]['id'])
+            time.sleep(0)  # let requests run between pages
+        search_backfill['state'] = 'done'
+        log.info("Search index built from %d stored messages", search_backfill['indexed'])
+    except Exception:
+        search_backfill['state'] = 'failed'
+        log.exception("Search backfill failed")
+
+if supabase and SEARCH_BACKFILL:
+    search_backfill['state'] = 'running'
+    socketio.start_background_task(backfill_search_index)
+
+def user_conversation_ids(user_id):
+    """Ids of the conversations a user belongs to, from their cached list when possible"""
+    conversations = conversation_summaries.get(user_id)
+    if conversations is not None:
+        return [conversation['id'] for conversation in conversations]
+    rows = supabase.table('conversation_participants').select('conversation_id').eq('user_id', user_id).execute().data
+    return [row['conversation_id'] for row in rows]
+
+def load_search_hits(hits):
+    """Message rows (with sender info) for a page of hits, keyed by id"""
+    wanted = {hit['message_id'] for hit in hits}
+    found = {}
+    for conversation_id in {hit['conversation_id'] for hit in hits}:
+        cached = recent_messages.get(conversation_id)
+        for message in (cached[0] if cached else ()):
+            if message['id'] in wanted:
+                found[message['id']] = message
+
+    missing = list(wanted - found.keys())
+    if missing:
+        rows = supabase.table('messages').select('*').in_('id', missing).execute().data
+        found.update((row['id'], row) for row in rows)
+
+    if message_buffer and len(found) < len(wanted):
+        for message in message_buffer.pending(lambda row: row['id'] in wanted and row['id'] not in found):
+            found[message['id']] = message
+    attach_profiles(list(found.values()))
+    return found
+
+@app.route('/search', methods=['GET'])
+@require_auth
+def search_messages():
+    """Search message content across the current user's conversations
+
+    Query params:
+      q               - search text; every word must match (required)
+      conversation_id - only search this conversation
+      order           - relevance (default) or recent
+      limit, offset   - page size (default SEARCH_PAGE_SIZE) and position
+    """
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', SEARCH_PAGE_SIZE)), 1), SEARCH_MAX_PAGE_SIZE)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+    order = request.args.get('order', 'relevance')
+    if order not in ('relevance', 'recent'):
+        return jsonify({"error": "order must be relevance or recent"}), 400
+
+    try:
+        conversation_id = request.args.get('conversation_id')
+        if conversation_id:
+            if not is_participant(conversation_id, request.user_id):
+                return jsonify({"error": "Not authorized"}), 403
+            scope = [conversation_id]
+        else:
+            scope = user_conversation_ids(request.user_id)
+
+        started = time.perf_counter()
+        hits, total, capped = message_index.search(query, scope, limit, offset, order)
+        took_ms = (time.perf_counter() - started) * 1000
+
+        messages = load_search_hits(hits) if hits else {}
+        results = []
+        for hit in hits:
+            message = messages.get(hit['message_id'])
+            if message is None:
+                continue  # rejected by the database after it was indexed
+            text, highlights = snippet(message['content'], query)
+            results.append(dict(message, score=hit['score'], snippet=text, highlights=highlights))
+
+        return jsonify({
+            "results": results,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "has_more": offset + len(hits) < total,
+            "partial": capped or search_backfill['state'] == 'running',
+            "took_ms": round(took_ms, 2)
+        }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -344,39 +1153,80 @@ def send_message(conversation_id):
 # EVENTS/CALENDAR ROUTES
 # ============================================
 
+# Set to False once we learn the get_user_events RPC (sql/get_user_events.sql)
+# is not installed, so later requests go straight to the fallback queries
+events_rpc_available = True
+
+def fetch_user_events(user_id, window_start=None, window_end=None):
+    """Events the user created or attends that may overlap the window"""
+    global events_rpc_available
+
+    if events_rpc_available:
+        try:
+            return supabase.rpc('get_user_events', {
+                'p_user_id': user_id,
+                'p_from': window_start.isoformat() if window_start else None,
+                'p_to': window_end.isoformat() if window_end else None
+            }).execute().data
+        except Exception as e:
+            if getattr(e, 'code', None) != 'PGRST202':
+                raise
+            log.warning("get_user_events RPC not installed, using fallback queries")
+            events_rpc_available = False
+
+    # Fallback: both lookups filtered server-side and issued concurrently
+    created = supabase.table('events').select('*').eq('created_by', user_id)
+    attending = supabase.table('event_attendees').select('events!inner(*)').eq('user_id', user_id)
+    if window_end:
+        created = created.lt('start_time', window_end.isoformat())
+        attending = attending.lt('events.start_time', window_end.isoformat())
+    if window_start:
+        # like the RPC: recurring series can start before the window and still recur inside it
+        overlaps = f'end_time.gt."{window_start.isoformat()}",recurrence.not.is.null'
+        created = created.or_(overlaps)
+        attending = attending.or_(overlaps, reference_table='events')
+
+    created_future = io_pool.submit(created.execute)
+    attending_rows = attending.execute().data
+
+    events = {event['id']: event for event in created_future.result().data}
+    for item in attending_rows:
+        if item.get('events'):
+            events.setdefault(item['events']['id'], item['events'])
+    return sorted(events.values(), key=lambda event: event['start_time'])
+
 @app.route('/events', methods=['GET'])
 @require_auth
 def get_events():
-    """Get all events for the current user"""
+    """Get events for the current user
+
+    Optional `from` / `to` ISO timestamps limit the result to a window, in
+    which recurring events are expanded into individual occurrences.
+    Responses carry an ETag so unchanged windows return 304.
+    """
     try:
-        print(f"📅 Fetching events for user: {request.user_id}")
-
-        # Get events created by user or where user is attendee
-        events = supabase.table('events').select('*').eq('created_by', request.user_id).execute()
-        print(f"✓ Found {len(events.data)} events created by user")
-
-        # Also get events where user is an attendee
-        attendee_events = supabase.table('event_attendees').select(
-            'events(*)'
-        ).eq('user_id', request.user_id).execute()
-        print(f"✓ Found {len(attendee_events.data)} events as attendee")
-
-        all_events = events.data + [item['events'] for item in attendee_events.data if item.get('events')]
-
-        # Remove duplicates
-        seen = set()
-        unique_events = []
-        for event in all_events:
-            if event and event['id'] not in seen:
-                seen.add(event['id'])
-                unique_events.append(event)
-
-        print(f"✓ Returning {len(unique_events)} unique events")
-        return jsonify(unique_events), 200
+        window_start = parse_datetime(request.args['from']) if request.args.get('from') else None
+        window_end = parse_datetime(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({"error": "from/to must be ISO 8601 timestamps"}), 400
+
+    try:
+        events = fetch_user_events(request.user_id, window_start, window_end)
+
+        occurrences = []
+        for event in events:
+            try:
+                occurrences.extend(expand_event(event, window_start, window_end))
+            except (ValueError, KeyError) as e:
+                # one malformed stored rule shouldn't take down the whole calendar
+                log.warning("Skipping event %s: %s", event.get('id'), e)
+
+        response = jsonify(occurrences)
+        response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
     except Exception as e:
-        print(f"❌ Error in get_events: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error in get_events")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/events', methods=['POST'])
@@ -388,6 +1238,12 @@ def create_event():
     if not data.get('title') or not data.get('start') or not data.get('end'):
         return jsonify({"error": "Title, start, and end are required"}), 400
 
+    if data.get('recurrence'):
+        try:
+            parse_rule(data['recurrence'])
+        except (ValueError, KeyError) as e:
+            return jsonify({"error": f"Invalid recurrence: {str(e)}"}), 400
+
     try:
         # Convert start/end to proper format if needed
         start_time = data.get('start')
@@ -399,7 +1255,8 @@ def create_event():
             "start_time": start_time,
             "end_time": end_time,
             "location": data.get('location'),
-            "created_by": request.user_id
+            "created_by": request.user_id,
+            **({"recurrence": data['recurrence']} if data.get('recurrence') else {})
         }).execute()
 
         # Add attendees if provided
@@ -419,18 +1276,144 @@ def create_event():
 # PDF CHATBOT ROUTES (Keep existing functionality)
 # ============================================
 
+# session_id -> {'user_id', 'pdf_name', 'doc_hash', 'index'}; text stays server-side
+pdf_sessions = TTLCache(
+    maxsize=int(os.getenv('PDF_SESSION_LIMIT', '200')),
+    ttl=float(os.getenv('PDF_SESSION_TTL', '7200'))
+)
+PDF_TOP_K = int(os.getenv('PDF_TOP_K', '4'))
+PDF_CHUNK_SIZE = int(os.getenv('PDF_CHUNK_SIZE', '1200'))
+PDF_PARALLEL_PAGES = int(os.getenv('PDF_PARALLEL_PAGES', '40'))
+
+# Extracted text and summaries keyed by SHA-256 of the PDF bytes, so the same
+# file (e.g. data/Onboarding.pdf) is never extracted or summarized twice
+pdf_cache = ExtractionCache(os.getenv(
+    'PDF_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'pdf_cache')
+), max_bytes=int(float(os.getenv('PDF_CACHE_MAX_MB', '512')) * 1024 * 1024))
+pdf_indexes = TTLCache(maxsize=int(os.getenv('PDF_INDEX_LIMIT', '50')), ttl=float(os.getenv('PDF_SESSION_TTL', '7200')))
+
+def user_room(user_id):
+    """Socket.IO room every authenticated socket of a user joins"""
+    return f"user:{user_id}"
+
+def push_job_result(job):
+    """Notify the user's sockets that a background LLM job finished"""
+    socketio.emit('job_done', public_job(job), room=user_room(job['user_id']))
+
+# All model calls go through this queue: bounded concurrency, a rate limit and
+# a result cache keyed by (document hash, question)
+llm_jobs = JobQueue(
+    max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', '4')),
+    rate_per_minute=int(os.getenv('LLM_RATE_PER_MINUTE', '60')),
+    max_pending=int(os.getenv('LLM_MAX_PENDING', '100')),
+    result_cache_size=int(os.getenv('LLM_RESULT_CACHE_SIZE', '1000')),
+    result_ttl=float(os.getenv('LLM_RESULT_TTL', '3600')),
+    on_complete=push_job_result
+)
+
 def extract_text_from_pdf(pdf_data):
-    """Extract text from PDF"""
-    text = ""
-    with fitz.open(stream=pdf_data, filetype="pdf") as doc:
-        for page in doc:
-            text += page.get_text("text") + "\n"
-    return text
+    """Extract text from PDF (large documents are split across processes)"""
+    # process pools don't mix with a monkey-patched standard library
+    threshold = float('inf') if is_evented() else PDF_PARALLEL_PAGES
+    with pdf_extract_seconds.time():
+        return run_blocking(extract_text, pdf_data, parallel_threshold=threshold)
+
+def get_document_index(digest, pdf_text):
+    """Chunk index for a document, shared by every session on the same file"""
+    index = pdf_indexes.get(digest)
+    if index is None:
+        index = run_blocking(DocumentIndex, pdf_text, chunk_size=PDF_CHUNK_SIZE)
+        pdf_indexes.set(digest, index)
+    return index
+
+def summary_prompt(index):
+    """Summarize from excerpts spread over the whole document"""
+    return [
+        {"role": "system", "content": "You are a helpful assistant that summarizes documents."},
+        {"role": "user", "content": f"Summarize this document:\n\n{index.overview(8000)}"}
+    ]
+
+def question_prompt(question, index):
+    """Only the most relevant excerpts are sent to the model"""
+    return [
+        {"role": "system", "content": "You are a helpful assistant that answers questions based on documents."},
+        {"role": "user", "content": f"Based on these excerpts from the document, answer: {question}\n\nExcerpts:\n{index.context_for(question, PDF_TOP_K)}"}
+    ]
+
+def complete(messages, max_tokens, temperature):
+    """Blocking chat completion; call through llm_jobs"""
+    with openai_seconds.time(kind='complete'):
+        response = openai_client.chat.completions.create(
+            model="gpt-4o",
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+    return response.choices[0].message.content
+
+def answer_cache_key(doc_hash, question):
+    return ('answer', doc_hash, " ".join(question.lower().split()))
+
+def wants_async():
+    """Clients opt into a background job with ?async=1"""
+    return str(request.args.get('async')).lower() in ('1', 'true', 'yes')
+
+def wants_stream():
+    """Clients opt into streaming with ?stream=1 (or a `stream` form/JSON field)"""
+    value = request.args.get('stream') or request.form.get('stream')
+    if value is None and request.is_json:
+        value = (request.get_json(silent=True) or {}).get('stream')
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def sse(event, data):
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(frames):
+    return Response(stream_with_context(frames), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # don't let a proxy buffer the stream
+    })
+
+def stream_completion(messages, max_tokens, temperature, result_key, cache_key=None, on_complete=None):
+    """Yield SSE `token` frames as the model produces them, then a `done` frame"""
+    cached = llm_jobs.results.get(cache_key) if cache_key is not None else None
+    if cached is not None:
+        # one token frame so clients that only render tokens still show it
+        yield sse('token', {'text': cached})
+        yield sse('done', {result_key: cached, 'cached': True})
+        return
+
+    try:
+        # Streams count against the same concurrency and rate limits as jobs
+        with llm_jobs.slot(), openai_seconds.time(kind='stream'):
+            stream = openai_client.chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True
+            )
+            parts = []
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield sse('token', {'text': delta})
+
+        text = "".join(parts)
+        if cache_key is not None:
+            llm_jobs.results.set(cache_key, text)
+        if on_complete:
+            on_complete(text)
+        yield sse('done', {result_key: text})
+    except Exception as e:
+        yield sse('error', {'error': f"Error: {str(e)}"})
 
 @app.route("/upload_pdf", methods=["POST"])
 @require_auth
 def upload_pdf():
-    """Upload PDF and generate summary"""
+    """Upload PDF and generate summary (streamed as SSE with ?stream=1)"""
     if not openai_client:
         return jsonify({"error": "OpenAI API key not configured"}), 500
 
@@ -439,93 +1422,181 @@ def upload_pdf():
         return jsonify({"error": "No file uploaded"}), 400
 
     try:
-        # Extract text
-        pdf_text = extract_text_from_pdf(pdf_file.read())
+        pdf_data = pdf_file.read()
+        digest = content_hash(pdf_data)
+        cached = pdf_cache.get(digest) or {}
+
+        # Extract text (skipped for files we have seen before)
+        pdf_text = cached.get('text')
+        if pdf_text is None:
+            pdf_text = extract_text_from_pdf(pdf_data)
+            if pdf_text.strip():
+                pdf_cache.set(digest, text=pdf_text)
 
         if not pdf_text or len(pdf_text.strip()) == 0:
             return jsonify({"error": "Could not extract text from PDF"}), 400
 
-        # Generate summary
-        summary_response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that summarizes documents."},
-                {"role": "user", "content": f"Summarize this document:\n\n{pdf_text[:8000]}"}
-            ],
-            max_tokens=200,
-            temperature=0.5
-        )
-        summary = summary_response.choices[0].message.content
+        index = get_document_index(digest, pdf_text)
 
-        # Store in session (could also store in Supabase)
+        # Keep the chunk index server-side; questions only send the session id
         session_id = str(uuid.uuid4())
+        pdf_sessions.set(session_id, {
+            'user_id': request.user_id,
+            'pdf_name': pdf_file.filename,
+            'doc_hash': digest,
+            'index': index
+        })
 
-        return jsonify({
+        result = {
             "message": "PDF uploaded successfully",
             "session_id": session_id,
-            "summary": summary,
             "pdf_name": pdf_file.filename,
-            "pdf_text": pdf_text  # Include for Q&A
-        }), 200
-
+            "chunks": len(index)
+        }
+        summary = cached.get('summary')
+
+        def summarize():
+            text = complete(summary_prompt(index), 200, 0.5)
+            pdf_cache.set(digest, summary=text)
+            return text
+
+        if wants_stream():
+            def frames():
+                yield sse('meta', result)
+                if summary is not None:
+                    yield sse('done', {'summary': summary})
+                else:
+                    yield from stream_completion(
+                        summary_prompt(index), 200, 0.5, 'summary', cache_key=('summary', digest),
+                        on_complete=lambda text: pdf_cache.set(digest, summary=text)
+                    )
+            return sse_response(frames())
+
+        if summary is None and wants_async():
+            job = llm_jobs.submit(request.user_id, 'summary', summarize, cache_key=('summary', digest))
+            return jsonify({**result, "job_id": job['id'], "status": job['status'], "summary": job['result']}), 202
+
+        if summary is None:
+            summary = llm_jobs.run(request.user_id, 'summary', summarize, cache_key=('summary', digest))
+
+        return jsonify({**result, "summary": summary}), 200
+
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429
     except Exception as e:
         return jsonify({"error": f"Error processing PDF: {str(e)}"}), 500
 
 @app.route("/ask_question", methods=["POST"])
 @require_auth
 def ask_question():
-    """Ask a question about uploaded PDF"""
+    """Ask a question about uploaded PDF (streamed as SSE with ?stream=1)"""
     if not openai_client:
         return jsonify({"error": "OpenAI API not configured"}), 500
 
     data = request.json
     question = data.get("question")
-    pdf_context = data.get("pdf_text", "")
+    session_id = data.get("session_id")
 
     if not question:
         return jsonify({"error": "No question provided"}), 400
 
+    if session_id:
+        session = pdf_sessions.get(session_id)
+        if not session or session['user_id'] != request.user_id:
+            return jsonify({"error": "PDF session not found or expired, please upload the PDF again"}), 404
+        index = session['index']
+        doc_hash = session['doc_hash']
+    elif data.get("pdf_text"):
+        # Older clients post the document text back with every question
+        index = DocumentIndex(data["pdf_text"], chunk_size=PDF_CHUNK_SIZE)
+        doc_hash = content_hash(data["pdf_text"].encode())
+    else:
+        return jsonify({"error": "No session_id provided"}), 400
+
+    cache_key = answer_cache_key(doc_hash, question)
+
+    if wants_stream():
+        return sse_response(stream_completion(question_prompt(question, index), 300, 0.7, 'answer', cache_key=cache_key))
+
     try:
-        messages = [
-            {"role": "system", "content": "You are a helpful assistant that answers questions based on documents."},
-            {"role": "user", "content": f"Based on this document, answer: {question}\n\nDocument:\n{pdf_context[:8000]}"}
-        ]
+        def generate_answer():
+            return complete(question_prompt(question, index), 300, 0.7)
 
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            max_tokens=300,
-            temperature=0.7
-        )
+        if wants_async():
+            job = llm_jobs.submit(request.user_id, 'answer', generate_answer, cache_key=cache_key)
+            return jsonify({"job_id": job['id'], "status": job['status'], "answer": job['result']}), 202
 
-        answer = response.choices[0].message.content
+        answer = llm_jobs.run(request.user_id, 'answer', generate_answer, cache_key=cache_key)
         return jsonify({"answer": answer}), 200
 
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429
     except Exception as e:
         return jsonify({"error": f"Error: {str(e)}"}), 500
 
+@app.route("/jobs/<job_id>", methods=["GET"])
+@require_auth
+def get_job(job_id):
+    """Poll a background LLM job (results are also pushed as `job_done`)"""
+    job = llm_jobs.get(job_id)
+    if not job or job['user_id'] != request.user_id:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(public_job(job)), 200
+
 # ============================================
 # WEBSOCKET EVENTS
 # ============================================
 
+# sid -> user_id for sockets that authenticated with an access token
+socket_users = {}
+
+def authenticate_socket(token):
+    """Attach the token's user to the current socket; returns the user_id or None"""
+    if not token:
+        return None
+    try:
+        user_id = token_verifier.verify(token)['user_id']
+    except Exception as e:
+        log.warning("Socket auth failed: %s", e)
+        return None
+    socket_users[request.sid] = user_id
+    join_room(user_room(user_id))
+    user_presence.connect(request.sid, user_id)
+    ensure_presence_loop()
+    return user_id
+
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     """Handle client connection"""
-    print(f'Client connected: {request.sid}')
-    emit('connected', {'data': 'Connected to WebSocket'})
+    log.debug("Client connected: %s", request.sid)
+    if auth:
+        authenticate_socket(auth.get('token'))
+    emit('connected', {'data': 'Connected to WebSocket', 'heartbeat_interval': PRESENCE_HEARTBEAT_INTERVAL})
 
 @socketio.on('disconnect')
-def handle_disconnect():
-    """Handle client disconnection"""
-    print(f'Client disconnected: {request.sid}')
+def handle_disconnect(reason=None):
+    """Handle client disconnection: chat, presence and the office"""
+    socket_users.pop(request.sid, None)
+    typing_tracker.drop_sid(request.sid)
+    user_presence.disconnect(request.sid)
+    player = remove_player(request.sid)
+    if player is not None:
+        log.debug("%s disconnected", player.username)
+        emit('player_left', {'sid': request.sid}, room='office', broadcast=True)
+    log.debug("Client disconnected: %s", request.sid)
 
 @socketio.on('join_conversation')
 def handle_join_conversation(data):
-    """Join a conversation room"""
+    """Join a conversation room (participants only)"""
     conversation_id = data.get('conversation_id')
     if conversation_id:
+        user_id = socket_users.get(request.sid) or authenticate_socket(data.get('token'))
+        if not user_id or not is_participant(conversation_id, user_id):
+            emit('error', {'event': 'join_conversation', 'conversation_id': conversation_id, 'error': 'Not authorized'})
+            return
+
         join_room(conversation_id)
-        print(f'Client {request.sid} joined conversation {conversation_id}')
+        log.debug("Client %s joined conversation %s", request.sid, conversation_id)
         emit('joined_conversation', {'conversation_id': conversation_id})
 
 @socketio.on('leave_conversation')
@@ -534,21 +1605,61 @@ def handle_leave_conversation(data):
     conversation_id = data.get('conversation_id')
     if conversation_id:
         leave_room(conversation_id)
-        print(f'Client {request.sid} left conversation {conversation_id}')
+        log.debug("Client %s left conversation %s", request.sid, conversation_id)
+
+@socketio.on('send_messages')
+def handle_send_messages(data):
+    """Socket twin of POST /messages/batch; the ack carries the same body"""
+    user_id = socket_users.get(request.sid) or authenticate_socket((data or {}).get('token'))
+    if not user_id:
+        emit('error', {'event': 'send_messages', 'error': 'Not authenticated'})
+        return {'error': 'Not authenticated'}
+    try:
+        messages, rejected = ingest_messages(user_id, (data or {}).get('messages'))
+    except Exception as e:
+        emit('error', {'event': 'send_messages', 'error': str(e)})
+        return {'error': str(e)}
+    return {'messages': messages, 'rejected': rejected}
+
+# Typing state per (conversation, user); rooms get one `typing_update` per
+# TYPING_INTERVAL with who started and who stopped
+TYPING_INTERVAL = float(os.getenv('TYPING_INTERVAL', '0.5'))
+typing_tracker = TypingTracker(idle_timeout=float(os.getenv('TYPING_IDLE_TIMEOUT', '5')))
+_typing_loop = None
+_typing_loop_lock = threading.Lock()
+
+def typing_flush_loop():
+    """Emit coalesced typing updates and expire idle typers"""
+    while True:
+        try:
+            for conversation_id, update in typing_tracker.flush().items():
+                socketio.emit('typing_update', update, room=conversation_id)
+        except Exception as e:
+            log.error("Typing flush failed: %s", e)
+        socketio.sleep(TYPING_INTERVAL)
+
+def ensure_typing_loop():
+    global _typing_loop
+    with _typing_loop_lock:
+        if _typing_loop is None:
+            _typing_loop = socketio.start_background_task(typing_flush_loop)
 
 @socketio.on('typing')
 def handle_typing(data):
-    """Broadcast typing indicator"""
+    """Record that a user started (or, with `typing: false`, stopped) typing"""
     conversation_id = data.get('conversation_id')
-    user_id = data.get('user_id')
-    username = data.get('username')
+    user_id = socket_users.get(request.sid)
+    if not user_id:
+        return {'error': 'Not authenticated'}
 
     if conversation_id:
-        emit('user_typing', {
-            'conversation_id': conversation_id,
-            'user_id': user_id,
-            'username': username
-        }, room=conversation_id, include_self=False)
+        if not is_participant(conversation_id, user_id):
+            return {'error': 'Not authorized'}
+        ensure_typing_loop()
+        if data.get('typing', True):
+            typing_tracker.start(conversation_id, user_id, data.get('username'), request.sid)
+        else:
+            typing_tracker.stop(conversation_id, user_id)
 
 # ============================================
 # HEALTH CHECK
@@ -560,73 +1671,331 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "supabase": "connected" if supabase else "not configured",
-        "openai": "connected" if openai_client else "not configured"
+        "openai": "connected" if openai_client else "not configured",
+        "auth_cache": token_verifier.stats(),
+        "llm_jobs": llm_jobs.stats(),
+        "message_buffer": message_buffer.stats() if message_buffer else None,
+        "recent_messages": recent_messages.stats(),
+        "conversation_lists": conversation_summaries.stats(),
+        "profiles": profile_cache.stats(),
+        "presence": user_presence.stats(),
+        "search_index": dict(message_index.stats(), backfill=search_backfill['state']),
+        "logs": log_sink.stats()
     }), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Latency histograms and counters in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # ============================================
 # 3D OFFICE / MULTIPLAYER EVENTS
 # ============================================
 
-# Store connected players in memory
-connected_players = {}
+# Players in the office, by sid and by user_id (see office.PlayerRegistry)
+connected_players = PlayerRegistry()
+
+# Moves are coalesced and broadcast as one snapshot per tick; with an area of
+# interest each player only gets nearby players at the full rate
+OFFICE_TICK_RATE = float(os.getenv('OFFICE_TICK_RATE', '15'))
+office_snapshots = SnapshotBuilder(
+    aoi_radius=float(os.getenv('OFFICE_AOI_RADIUS', '0')),
+    far_every=int(os.getenv('OFFICE_FAR_EVERY', '5'))
+)
+_office_ticker = None
+_office_ticker_lock = threading.Lock()
+
+# Across processes each node announces its players and online users every
+# PRESENCE_INTERVAL seconds and owns one block of binary player indexes
+PRESENCE_INTERVAL = float(os.getenv('PRESENCE_INTERVAL', '5'))
+NODE_SLOT = os.getenv('NODE_SLOT')
+_node_slot = None
+if socket_manager and float(os.getenv('OFFICE_AOI_RADIUS', '0')):
+    log.warning("OFFICE_AOI_RADIUS only filters players connected to the same process")
+
+def encode_binary_snapshot(snapshot):
+    index_of = {}
+    entries = []
+    for entry in snapshot['p']:
+        player = connected_players.get(entry[0])
+        if player is not None:
+            index_of[entry[0]] = player.index
+            entries.append(entry)
+    return encode_snapshot(snapshot['t'], entries, index_of)
+
+def emit_snapshot(sid, snapshot):
+    """Send a snapshot to one client (or the whole office for sid None) in its encoding"""
+    if sid is None:
+        socketio.emit('players_snapshot', snapshot, room='office:json')
+        # binary clients may be connected to another node
+        if connected_players.binary_count or socket_manager:
+            socketio.emit('players_snapshot_bin', encode_binary_snapshot(snapshot), room='office:binary')
+        return
+    player = connected_players.get(sid)
+    if player is not None and player.binary:
+        socketio.emit('players_snapshot_bin', encode_binary_snapshot(snapshot), room=sid)
+    else:
+        socketio.emit('players_snapshot', snapshot, room=sid)
+
+def announce_presence():
+    """Tell the other nodes which players are connected here"""
+    if socket_manager:
+        version, users = user_presence.local_statuses()
+        socket_manager.announce({
+            'slot': _node_slot,
+            'players': connected_players.snapshot(),
+            'users': users,
+            'users_version': version
+        })
+
+def expire_presence():
+    """Drop players whose node stopped announcing, for this node's clients"""
+    for player in socket_manager.presence.expire():
+        count_emit('player_left', 'office')
+        socket_manager.emit_local('player_left', {'sid': player['sid']}, room='office')
+
+def office_roster():
+    """Players on this node plus those announced by the others"""
+    roster = connected_players.snapshot()
+    if socket_manager:
+        roster = roster + socket_manager.presence.players()
+    return roster
+
+def claim_node_slot():
+    """Pick this node's block of player indexes before the first player joins"""
+    global _node_slot
+    if _node_slot is None and socket_manager and not len(connected_players):
+        _node_slot = pick_slot(socket_manager.presence.slots(),
+                               int(NODE_SLOT) if NODE_SLOT else None)
+        connected_players.set_index_range(_node_slot * SLOT_SIZE, (_node_slot + 1) * SLOT_SIZE)
+
+def office_tick_loop():
+    """Emit `players_snapshot`s of who moved, OFFICE_TICK_RATE times a second"""
+    interval = 1.0 / OFFICE_TICK_RATE
+    while True:
+        started = time.monotonic()
+        try:
+            for sid, snapshot in office_snapshots.build(connected_players).items():
+                emit_snapshot(sid, snapshot)
+        except Exception as e:
+            log.error("Office tick failed: %s", e)
+        socketio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+def ensure_office_ticker():
+    """Start the tick loop the first time someone enters the office"""
+    global _office_ticker
+    with _office_ticker_lock:
+        if _office_ticker is None:
+            _office_ticker = socketio.start_background_task(office_tick_loop)
+
+def remove_player(sid):
+    """Drop a player from the office; returns its record or None"""
+    player = connected_players.remove(sid)
+    if player is not None:
+        office_snapshots.forget(sid)
+        announce_presence()
+    return player
 
 @socketio.on('join_office')
 def handle_join_office(data):
-    """Player joins the 3D office"""
+    """Player joins the 3D office
+
+    Pass `encoding: 'binary'` to receive `players_snapshot_bin` packets and
+    send packed `player_move`s; the reply `office_welcome` confirms the
+    encoding and the player's index.
+    """
     user_id = data.get('user_id')
     username = data.get('username')
     
     if user_id:
-        connected_players[request.sid] = {
-            'user_id': user_id,
-            'username': username,
-            'position': {'x': 0, 'y': 1, 'z': 0},
-            'rotation': 0,
-            'sid': request.sid
-        }
+        if not username:
+            try:
+                username = (get_user_profile(user_id) or {}).get('username')
+            except Exception as e:
+                log.warning("No profile for office player %s: %s", user_id, e)
+        remove_player(request.sid)
+        if request.sid in socket_users:
+            # only authenticated sockets count towards their user's presence
+            user_presence.connect(request.sid, socket_users[request.sid])
+            ensure_presence_loop()
+        encoding = 'binary' if data.get('encoding') == 'binary' else 'json'
+        claim_node_slot()
+        player = connected_players.add(request.sid, user_id, username, binary=encoding == 'binary')
+        announce_presence()
         
         join_room('office')
-        print(f'👤 {username} joined the office (sid: {request.sid})')
+        leave_room('office:json')
+        leave_room('office:binary')
+        join_room(f'office:{encoding}')
+        ensure_office_ticker()
+        emit('office_welcome', {'encoding': encoding, 'index': player.index})
+        log.debug("%s joined the office (sid: %s)", username, request.sid)
         
         # Send current players to the new player
-        emit('current_players', list(connected_players.values()))
+        emit('current_players', office_roster())
         
         # Notify others about the new player
-        emit('player_joined', connected_players[request.sid], room='office', include_self=False)
+        emit('player_joined', player.to_dict(), room='office', include_self=False)
 
 @socketio.on('leave_office')
 def handle_leave_office():
     """Player leaves the 3D office"""
-    if request.sid in connected_players:
-        player = connected_players[request.sid]
-        print(f'👋 {player["username"]} left the office')
-        del connected_players[request.sid]
+    player = remove_player(request.sid)
+    if player is not None:
+        log.debug("%s left the office", player.username)
         
         leave_room('office')
+        leave_room('office:json')
+        leave_room('office:binary')
         emit('player_left', {'sid': request.sid}, room='office')
 
 @socketio.on('player_move')
 def handle_player_move(data):
-    """Update player position"""
+    """Update player position (broadcast on the next office tick)"""
     if request.sid in connected_players:
-        connected_players[request.sid]['position'] = data.get('position', {})
-        connected_players[request.sid]['rotation'] = data.get('rotation', 0)
-        
-        # Broadcast to all other players in the office
-        emit('player_moved', {
-            'sid': request.sid,
-            'position': data.get('position'),
-            'rotation': data.get('rotation')
-        }, room='office', include_self=False)
+        if isinstance(data, (bytes, bytearray)):
+            try:
+                pose = decode_move(data)
+            except ValueError as e:
+                return {'error': str(e)}
+        elif isinstance(data, dict):
+            pose = parse_move(data)
+        else:
+            return {'error': 'player_move must be an object or packed bytes'}
+        if connected_players.move(request.sid, *pose):
+            office_snapshots.mark_moved(request.sid)
 
-@socketio.on('disconnect')
-def handle_disconnect_office():
-    """Handle player disconnect"""
-    if request.sid in connected_players:
-        player = connected_players[request.sid]
-        print(f'🔌 {player["username"]} disconnected')
-        del connected_players[request.sid]
-        emit('player_left', {'sid': request.sid}, room='office', broadcast=True)
+# ============================================
+# PRESENCE
+# ============================================
+
+# Clients send `heartbeat` every PRESENCE_HEARTBEAT_INTERVAL seconds; a socket
+# that stays silent for PRESENCE_HEARTBEAT_TTL counts as gone (see presence.py)
+PRESENCE_HEARTBEAT_INTERVAL = float(os.getenv('PRESENCE_HEARTBEAT_INTERVAL', '20'))
+PRESENCE_FLUSH_INTERVAL = float(os.getenv('PRESENCE_FLUSH_INTERVAL', '1'))
+PRESENCE_MAX_WATCH = int(os.getenv('PRESENCE_MAX_WATCH', '1000'))
+user_presence = PresenceTracker(ttl=float(os.getenv('PRESENCE_HEARTBEAT_TTL', '60')))
+# user_id -> ids of everyone sharing a conversation with them; kept short so a
+# new conversation's members become visible soon
+presence_contacts = TTLCache(
+    maxsize=int(os.getenv('PRESENCE_CONTACTS_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('PRESENCE_CONTACTS_TTL', '60'))
+)
+_presence_loop = None
+_presence_loop_lock = threading.Lock()
+
+if socket_manager:
+    socket_manager.subscribe('user_presence', lambda payload: user_presence.merge_remote(
+        payload['node'], payload['version'], payload['users']))
+
+def emit_presence_update(sid, statuses):
+    """Send one subscriber its coalesced changes; subscribers are always local"""
+    if socket_manager:
+        count_emit('presence_update', sid)
+        socket_manager.emit_local('presence_update', {'users': statuses}, room=sid)
+    else:
+        socketio.emit('presence_update', {'users': statuses}, room=sid)
+
+def presence_loop():
+    """Expire silent sockets and push status changes, every PRESENCE_FLUSH_INTERVAL"""
+    announced = 0.0
+    while True:
+        started = time.monotonic()
+        try:
+            user_presence.expire()
+            if socket_manager and started - announced >= PRESENCE_INTERVAL:
+                announced = started
+                announce_presence()
+                expire_presence()
+                user_presence.sync_remote({
+                    host_id: (state.get('users_version', 0), state.get('users'))
+                    for host_id, state in socket_manager.presence.nodes().items()
+                })
+            updates, changes = user_presence.flush()
+            for sid, statuses in updates.items():
+                emit_presence_update(sid, statuses)
+            if changes and socket_manager:
+                socket_manager.publish('user_presence', {
+                    'node': socket_manager.host_id, 'version': user_presence.version, 'users': changes
+                })
+        except Exception as e:
+            log.error("Presence flush failed: %s", e)
+        socketio.sleep(max(0.0, PRESENCE_FLUSH_INTERVAL - (time.monotonic() - started)))
+
+def ensure_presence_loop():
+    global _presence_loop
+    with _presence_loop_lock:
+        if _presence_loop is None:
+            _presence_loop = socketio.start_background_task(presence_loop)
+
+@socketio.on('heartbeat')
+def handle_heartbeat(data=None):
+    """Keep this socket's user online; `status` may be online, away or busy"""
+    status = (data or {}).get('status')
+    if status is not None and status not in STATUSES:
+        return {'error': f"status must be one of {', '.join(STATUSES)}"}
+    if not user_presence.heartbeat(request.sid, status):
+        # expired after missed heartbeats, or never registered
+        user_id = socket_users.get(request.sid)
+        if not user_id:
+            return {'error': 'Not authenticated'}
+        user_presence.connect(request.sid, user_id, status or 'online')
+        ensure_presence_loop()
+    return {'ok': True}
+
+def presence_contacts_of(user_id):
+    """Ids of the users whose presence user_id may see: those they share a conversation with"""
+    contacts = presence_contacts.get(user_id)
+    if contacts is None:
+        conversation_ids = user_conversation_ids(user_id)
+        rows = supabase.table('conversation_participants').select('user_id').in_(
+            'conversation_id', conversation_ids
+        ).execute().data if conversation_ids else []
+        contacts = frozenset(row['user_id'] for row in rows) | {user_id}
+        presence_contacts.set(user_id, contacts)
+    return contacts
+
+@socketio.on('subscribe_presence')
+def handle_subscribe_presence(data):
+    """Watch users' status; the ack carries their current status and later
+    changes arrive as `presence_update` {users: {user_id: status}}
+
+    Only users sharing a conversation with the caller can be watched; other
+    ids are left out of the ack.
+    """
+    viewer_id = socket_users.get(request.sid)
+    if not viewer_id:
+        return {'error': 'Not authenticated'}
+    user_ids = (data or {}).get('user_ids')
+    if not isinstance(user_ids, list) or not all(isinstance(user_id, str) for user_id in user_ids):
+        return {'error': 'user_ids must be a list of user ids'}
+    contacts = presence_contacts_of(viewer_id)
+    user_ids = [user_id for user_id in user_ids if user_id in contacts]
+    if user_presence.watch_count(request.sid) + len(user_ids) > PRESENCE_MAX_WATCH:
+        return {'error': f'At most {PRESENCE_MAX_WATCH} users per socket'}
+    ensure_presence_loop()
+    return {'users': user_presence.watch(request.sid, user_ids)}
+
+@socketio.on('unsubscribe_presence')
+def handle_unsubscribe_presence(data=None):
+    """Stop watching some users, or everyone when user_ids is omitted"""
+    user_presence.unwatch(request.sid, (data or {}).get('user_ids'))
+
+@app.route('/presence', methods=['GET'])
+@require_auth
+def get_presence():
+    """Current status of users: ?user_ids=a,b,c -> {user_id: status}
+
+    Like subscribe_presence, ids that share no conversation with the caller
+    are left out.
+    """
+    user_ids = [user_id for user_id in request.args.get('user_ids', '').split(',') if user_id]
+    if not user_ids:
+        return jsonify({"error": "user_ids is required"}), 400
+    if len(user_ids) > PRESENCE_MAX_WATCH:
+        return jsonify({"error": f"At most {PRESENCE_MAX_WATCH} users per request"}), 400
+    contacts = presence_contacts_of(request.user_id)
+    return jsonify(user_presence.statuses([user_id for user_id in user_ids if user_id in contacts])), 200
 
 # ============================================
 # RUN SERVER
@@ -640,6 +2009,8 @@ if __name__ == "__main__":
     print(f"✓ CORS enabled for all origins")
     print(f"✓ WebSocket enabled")
     print("="*50 + "\n")
+    if is_evented():
+        log.warning(f"ASYNC_MODE={ASYNC_MODE} needs the standard library patched first; start with serve.py")
 
-    # Run with SocketIO
+    # Development server; production runs serve.py
     socketio.run(app, debug=True, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True)
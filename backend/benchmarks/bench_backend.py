@@ -0,0 +1,387 @@
+"""
+Load and latency benchmark for the backend, against in-process fakes
+
+    python benchmarks/bench_backend.py                    # run and compare with benchmarks/baseline.json
+    python benchmarks/bench_backend.py --save-baseline    # run and record the result as the new baseline
+    python benchmarks/bench_backend.py --clients 100 --ops 300 --db-latency 0.005
+
+Imports app.py with `supabase` and `openai_client` replaced by the fakes in
+fake_services.py, seeded from the repo's demo data, each with an injected
+latency per call. Then --clients simulated users, each with a Flask test
+client and an authenticated Socket.IO test client that joined its
+conversations and the office, are driven by --threads worker threads taking
+turns between their clients. Each client performs --ops operations drawn
+from MIX with its own random seed, so every run does the same work. (One
+thread per client mostly measures GIL hand-offs between busy threads, and
+varies a lot from run to run.)
+Requests go through the full Flask / Flask-SocketIO handler stack but not
+over the network (benchmarks/load_sockets.py covers real sockets).
+
+Reports throughput, p50/p99 latency per operation, database calls per
+operation and memory. Compared with the baseline, a p50 that grew or
+throughput that fell by more than --tolerance, a p99 that grew by more
+than --tail-tolerance (tails are noisier), more errors or database calls
+per operation, or more memory growth is flagged as a regression and the
+exit status is 1. Latencies must also have grown by at least 1 ms.
+Baselines are only comparable when recorded on the same machine with the
+same settings.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from fake_services import FakeOpenAI, FakeSupabase, seed  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# operation -> relative weight
+MIX = {
+    'list_conversations': 8,
+    'get_messages': 15,
+    'send_message': 5,
+    'send_messages': 10,
+    'typing': 20,
+    'player_move': 25,
+    'search': 6,
+    'events': 4,
+    'users_batch': 4,
+    'ask_question': 1,
+}
+
+SEARCH_TERMS = ['api', 'design', 'tests', 'review', 'sprint planning', 'tonight', 'deadline', 'finalize the api']
+QUESTIONS = ['What is this document about?', 'Who should I contact first?', 'What are the main steps?',
+             'Summarize the key dates.', 'What tools are mentioned?']
+
+
+def rss_mb():
+    """Current resident memory of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def load_app(args):
+    """Import app.py configured for the fakes, whatever the local .env says"""
+    os.environ.update({
+        'SUPABASE_URL': '', 'SUPABASE_SERVICE_KEY': '', 'SUPABASE_JWT_SECRET': '', 'SUPABASE_JWKS_URL': '',
+        'OPENAI_API_KEY': '', 'SOCKETIO_MESSAGE_QUEUE': '', 'ASYNC_MODE': 'threading',
+        'MESSAGE_WRITE_BEHIND': '0', 'LOG_LEVEL': 'WARNING',
+        'LLM_RATE_PER_MINUTE': '1000000',
+        'PDF_CACHE_DIR': tempfile.mkdtemp(prefix='bench-pdf-cache-'),
+    })
+    import app
+    from metrics import TimedClient
+
+    fake_db = FakeSupabase(latency=args.db_latency, jitter=args.jitter, seed=args.seed)
+    app.supabase = TimedClient(fake_db, app.supabase_seconds)
+    app.openai_client = FakeOpenAI(latency=args.llm_latency, token_latency=args.token_latency)
+    return app, fake_db
+
+
+class Client:
+    """One simulated user: REST and Socket.IO test clients plus what it may touch"""
+
+    def __init__(self, app, n, user, conversations, users, seed):
+        self.app = app
+        self.n = n
+        self.user = user
+        self.conversations = conversations
+        self.users = users
+        self.rng = random.Random(seed * 100003 + n)
+        self.http = app.app.test_client()
+        self.headers = {'Authorization': f"Bearer {user['id']}"}
+        self.sio = app.socketio.test_client(app.app, auth={'token': user['id']})
+        for conversation_id in conversations:
+            self.sio.emit('join_conversation', {'conversation_id': conversation_id})
+        self.sio.emit('join_office', {'user_id': user['id'], 'username': user['username']})
+        self.session_id = None
+        self.received = 0
+
+    def drain(self):
+        self.received += len(self.sio.get_received())
+
+    def upload(self, pdf_path):
+        with open(pdf_path, 'rb') as f:
+            response = self.http.post('/upload_pdf', headers=self.headers,
+                                      data={'file': (f, os.path.basename(pdf_path))})
+        self.session_id = (response.get_json() or {}).get('session_id')
+
+    def text(self):
+        return f"load test message {self.rng.randrange(10 ** 6)} about the api design"
+
+    # Each operation returns True on success
+
+    def list_conversations(self):
+        return self.http.get('/conversations', headers=self.headers).status_code == 200
+
+    def get_messages(self):
+        conversation_id = self.rng.choice(self.conversations)
+        return self.http.get(f'/conversations/{conversation_id}/messages?limit=50', headers=self.headers).status_code == 200
+
+    def send_message(self):
+        conversation_id = self.rng.choice(self.conversations)
+        response = self.http.post(f'/conversations/{conversation_id}/messages', headers=self.headers,
+                                  json={'content': self.text()})
+        return response.status_code < 300
+
+    def send_messages(self):
+        conversation_id = self.rng.choice(self.conversations)
+        ack = self.sio.emit('send_messages', {'messages': [
+            {'conversation_id': conversation_id, 'content': self.text(), 'client_id': f'{self.n}-{self.rng.random()}'}
+        ]}, callback=True)
+        return isinstance(ack, dict) and 'error' not in ack and not ack.get('rejected')
+
+    def typing(self):
+        self.sio.emit('typing', {'conversation_id': self.rng.choice(self.conversations),
+                                 'typing': self.rng.random() < 0.8})
+        return True
+
+    def player_move(self):
+        self.sio.emit('player_move', {
+            'position': {'x': self.rng.uniform(-20, 20), 'y': 1.0, 'z': self.rng.uniform(-20, 20)},
+            'rotation': self.rng.uniform(-3.14, 3.14)
+        })
+        return True
+
+    def search(self):
+        response = self.http.get('/search', headers=self.headers, query_string={'q': self.rng.choice(SEARCH_TERMS)})
+        return response.status_code == 200
+
+    def events(self):
+        return self.http.get('/events', headers=self.headers).status_code == 200
+
+    def users_batch(self):
+        ids = [user['id'] for user in self.rng.sample(self.users, min(10, len(self.users)))]
+        return self.http.post('/users/batch', headers=self.headers, json={'ids': ids}).status_code == 200
+
+    def ask_question(self):
+        # a fresh suffix so the answer cache doesn't hide the model call
+        question = f"{self.rng.choice(QUESTIONS)} ({self.rng.randrange(10 ** 6)})"
+        response = self.http.post('/ask_question', headers=self.headers,
+                                  json={'question': question, 'session_id': self.session_id})
+        return response.status_code == 200
+
+
+def build_clients(app, seeded, args):
+    users = seeded['users']
+    participants = app.supabase.table('conversation_participants').select('conversation_id, user_id').execute().data
+    memberships = {}
+    for row in participants:
+        memberships.setdefault(row['user_id'], []).append(row['conversation_id'])
+
+    clients = [Client(app, n, users[n % len(users)], memberships[users[n % len(users)]['id']], users, args.seed)
+               for n in range(args.clients)]
+    # one PDF session per user, through the fake model
+    pdf_path = os.path.join(BACKEND_DIR, 'data', 'Onboarding.pdf')
+    sessions = {}
+    for client in clients:
+        if client.user['id'] not in sessions:
+            client.upload(pdf_path)
+            sessions[client.user['id']] = client.session_id
+        client.session_id = sessions[client.user['id']]
+    return clients
+
+
+def run_worker(work, warmup, barrier, samples, errors):
+    """Take turns between (client, plan) pairs, one operation each"""
+    for step in range(warmup):
+        for client, plan in work:
+            getattr(client, plan[step])()
+            client.drain()
+    barrier.wait()
+    for step in range(warmup, max(len(plan) for _, plan in work)):
+        for client, plan in work:
+            name = plan[step]
+            started = time.perf_counter()
+            try:
+                ok = getattr(client, name)()
+            except Exception:
+                ok = False
+            samples.append((name, time.perf_counter() - started))
+            if not ok:
+                errors[name] = errors.get(name, 0) + 1
+            client.drain()
+
+
+def run(args):
+    app, fake_db = load_app(args)
+    rss_before_seed = rss_mb()
+    seeded = seed(fake_db, history=args.history)
+    if app.search_cutoff is not None:
+        app.search_backfill['state'] = 'running'
+        app.backfill_search_index()
+
+    clients = build_clients(app, seeded, args)
+    names = list(MIX)
+    weights = [MIX[name] for name in names]
+    plans = [client.rng.choices(names, weights, k=args.warmup + args.ops) for client in clients]
+
+    workers = max(1, min(args.threads, len(clients)))
+    work = list(zip(clients, plans))
+    barrier = threading.Barrier(workers + 1)
+    samples = [[] for _ in range(workers)]
+    errors = [{} for _ in range(workers)]
+    threads = [threading.Thread(target=run_worker, args=(work[i::workers], args.warmup, barrier, samples[i], errors[i]),
+                                daemon=True)
+               for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    rss_start = rss_mb()
+    db_calls = fake_db.calls
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    db_calls = fake_db.calls - db_calls
+    rss_end = rss_mb()
+
+    by_operation = {}
+    for worker_samples in samples:
+        for name, seconds in worker_samples:
+            by_operation.setdefault(name, []).append(seconds)
+    total = sum(len(values) for values in by_operation.values())
+    operations = {}
+    for name in names:
+        values = sorted(by_operation.get(name, ()))
+        if not values:
+            continue
+        operations[name] = {
+            'count': len(values),
+            'errors': sum(worker_errors.get(name, 0) for worker_errors in errors),
+            'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+            'mean_ms': round(sum(values) / len(values) * 1000, 3),
+        }
+
+    for client in clients:
+        client.sio.disconnect()
+    return {
+        'settings': {key: getattr(args, key) for key in
+                     ('clients', 'threads', 'ops', 'warmup', 'history', 'db_latency', 'jitter', 'llm_latency', 'token_latency', 'seed')},
+        'python': sys.version.split()[0],
+        'duration_s': round(elapsed, 3),
+        'operations_total': total,
+        'throughput_ops_s': round(total / elapsed, 1),
+        'db_calls_per_op': round(db_calls / total, 3),
+        'events_received': sum(client.received for client in clients),
+        'memory_mb': {
+            'seeded': round(rss_start - rss_before_seed, 1),
+            'start': round(rss_start, 1),
+            'end': round(rss_end, 1),
+            'peak': round(peak_rss_mb(), 1),
+        },
+        'operations': operations,
+    }
+
+
+def compare(result, baseline, tolerance, tail_tolerance):
+    """Regressions of result against baseline, as readable lines"""
+    regressions = []
+    for name, current in result['operations'].items():
+        previous = baseline['operations'].get(name)
+        if not previous:
+            continue
+        for key, allowed in (('p50_ms', tolerance), ('p99_ms', tail_tolerance)):
+            if current[key] > previous[key] * (1 + allowed) and current[key] - previous[key] >= 1.0:
+                regressions.append(f"{name} {key}: {previous[key]} -> {current[key]}")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{name} errors: {previous['errors']} -> {current['errors']}")
+    if result['throughput_ops_s'] < baseline['throughput_ops_s'] * (1 - tolerance):
+        regressions.append(f"throughput: {baseline['throughput_ops_s']} -> {result['throughput_ops_s']} ops/s")
+    if result['db_calls_per_op'] > baseline['db_calls_per_op'] * 1.05:
+        regressions.append(f"db calls per op: {baseline['db_calls_per_op']} -> {result['db_calls_per_op']}")
+    grown, was = result['memory_mb']['end'] - result['memory_mb']['start'], \
+        baseline['memory_mb']['end'] - baseline['memory_mb']['start']
+    if grown > max(was * (1 + tolerance), was + 5):
+        regressions.append(f"memory growth during run: {was:.1f} -> {grown:.1f} MB")
+    return regressions
+
+
+def report(result):
+    print(f"{result['operations_total']} operations from {result['settings']['clients']} clients "
+          f"in {result['duration_s']:.2f}s: {result['throughput_ops_s']} ops/s, "
+          f"{result['db_calls_per_op']} db calls/op, {result['events_received']} socket events received")
+    memory = result['memory_mb']
+    print(f"memory: {memory['start']} MB at start, {memory['end']} MB at end, {memory['peak']} MB peak "
+          f"({memory['seeded']} MB for seeded data and clients)")
+    print(f"\n{'operation':<20}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for name, stats in result['operations'].items():
+        print(f"{name:<20}{stats['count']:>7}{stats['errors']:>8}{stats['p50_ms']:>10.2f}"
+              f"{stats['p99_ms']:>10.2f}{stats['mean_ms']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=8, help='worker threads driving the clients')
+    parser.add_argument('--ops', type=int, default=200, help='measured operations per client')
+    parser.add_argument('--warmup', type=int, default=10, help='unmeasured operations per client first')
+    parser.add_argument('--history', type=int, default=200, help='seeded messages per conversation')
+    parser.add_argument('--db-latency', type=float, default=0.002, help='seconds per Supabase request')
+    parser.add_argument('--jitter', type=float, default=0.5, help='+/- fraction of the Supabase latency')
+    parser.add_argument('--llm-latency', type=float, default=0.2, help='seconds to the first model token')
+    parser.add_argument('--token-latency', type=float, default=0.002, help='seconds per model token')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='write the result to --baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown of p50 and throughput')
+    parser.add_argument('--tail-tolerance', type=float, default=1.0, help='allowed relative slowdown of p99')
+    parser.add_argument('--json', help='also write the result to this file')
+    args = parser.parse_args()
+
+    result = run(args)
+    report(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(result, f, indent=2)
+            f.write('\n')
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; record one with --save-baseline")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['settings'] != result['settings']:
+        print(f"\nBaseline was recorded with different settings ({baseline['settings']}); not compared")
+        return 0
+    regressions = compare(result, baseline, args.tolerance, args.tail_tolerance)
+    if regressions:
+        print(f"\nREGRESSIONS against {args.baseline} (tolerance {args.tolerance:.0%}, p99 {args.tail_tolerance:.0%}):")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"\nNo regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
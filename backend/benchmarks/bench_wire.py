@@ -0,0 +1,103 @@
+"""
+Compare bytes per second and encoding CPU for office movement payloads
+
+    python benchmarks/bench_wire.py [--players 100] [--client-rate 10] [--tick-rate 15]
+
+Three strategies are measured from the point of view of one receiving client:
+  legacy   - one JSON `player_moved` per client move, re-broadcast immediately
+  json     - one JSON `players_snapshot` per tick (office.SnapshotBuilder)
+  binary   - one packed `players_snapshot_bin` per tick (office_wire)
+
+Sizes are of the Socket.IO packets as they go on the wire (event name and
+framing included); binary packets count the placeholder header plus the
+attachment.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from office import quantize  # noqa: E402
+from office_wire import encode_snapshot  # noqa: E402
+
+
+def socketio_text_packet(event, data):
+    return '42' + json.dumps([event, data], separators=(',', ':'))
+
+
+def socketio_binary_packet(event, payload):
+    header = '451-' + json.dumps([event, {'_placeholder': True, 'num': 0}], separators=(',', ':'))
+    return len(header) + len(payload)
+
+
+def make_players(count):
+    players = {}
+    for i in range(count):
+        sid = ''.join(random.choices('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_', k=20))
+        players[sid] = {
+            'index': i,
+            'position': {'x': random.uniform(-20, 20), 'y': 1.0, 'z': random.uniform(-20, 20)},
+            'rotation': random.uniform(-3.14, 3.14),
+        }
+    return players
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=100)
+    parser.add_argument('--client-rate', type=float, default=10.0, help='moves per second sent by each client')
+    parser.add_argument('--tick-rate', type=float, default=15.0)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    players = make_players(args.players)
+    sid, player = next(iter(players.items()))
+    others = args.players - 1
+
+    # legacy: every move of every other player arrives as its own packet
+    def legacy():
+        return socketio_text_packet('player_moved', {
+            'sid': sid, 'position': player['position'], 'rotation': player['rotation']
+        })
+
+    legacy_packet, legacy_cpu = timed(legacy, args.repeat)
+    legacy_rate = min(args.client_rate, 1000.0)
+    legacy_bps = len(legacy_packet) * others * legacy_rate
+    legacy_cpu_s = legacy_cpu * args.players * legacy_rate
+
+    # tick snapshots where every player moved since the last tick (worst case)
+    entries = [[s, *quantize(p['position'], p['rotation'])] for s, p in players.items()]
+    index_of = {s: p['index'] for s, p in players.items()}
+    tick_rate = min(args.tick_rate, args.client_rate) if args.client_rate else args.tick_rate
+
+    json_packet, json_cpu = timed(lambda: socketio_text_packet('players_snapshot', {'t': 1, 'p': entries}), args.repeat)
+    binary_payload, binary_cpu = timed(lambda: encode_snapshot(1, entries, index_of), args.repeat)
+    binary_size = socketio_binary_packet('players_snapshot_bin', binary_payload)
+
+    rows = [
+        ('legacy per-move JSON', legacy_bps, legacy_cpu_s),
+        ('tick JSON snapshot', len(json_packet) * tick_rate, json_cpu * tick_rate),
+        ('tick binary snapshot', binary_size * tick_rate, binary_cpu * tick_rate),
+    ]
+
+    print(f"{args.players} players, clients send {args.client_rate:g} moves/s, tick {args.tick_rate:g} Hz "
+          f"(effective {tick_rate:g} Hz when clients are slower)\n")
+    print(f"{'strategy':<24}{'bytes/s per client':>20}{'encode CPU ms/s':>18}")
+    for name, bps, cpu in rows:
+        print(f"{name:<24}{bps:>20,.0f}{cpu * 1000:>18.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,481 @@
+"""
+In-process stand-ins for Supabase and OpenAI, for benchmarks
+
+`FakeSupabase` answers the PostgREST query-builder calls app.py makes
+(select/insert/update/delete with eq, in_, lt/gt, or_ keyset filters,
+order, limit and embedded relations such as `conversations(*)`) from
+in-memory tables, after sleeping for a configurable latency per request.
+`FakeOpenAI` does the same for chat completions, streamed or not.
+
+`seed()` fills the tables from the repo's demo data: the users in
+seed_data.py (read with ast, since that script talks to Supabase on import)
+and data/conversations.json, data/messages.json and data/events.json.
+"""
+
+import ast
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from postgrest.exceptions import APIError
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BACKEND_DIR, 'data')
+
+# uuid5 namespace so seeded ids are the same on every run
+SEED_NAMESPACE = uuid.UUID('6f1f3c2e-4d2b-4c4a-9a57-0d1d0c0ffee0')
+
+# relation -> foreign key on the embedding table, where it isn't <relation>_id
+FOREIGN_KEYS = {'users': 'sender_id'}
+
+
+def seeded_id(*parts):
+    return str(uuid.uuid5(SEED_NAMESPACE, ':'.join(map(str, parts))))
+
+
+def timestamp(value=None):
+    """ISO timestamps in one fixed format, so they also sort as strings"""
+    return (value or datetime.now(timezone.utc)).isoformat(timespec='microseconds')
+
+
+def _comparable(value):
+    if isinstance(value, str) and len(value) >= 19 and value[4] == '-' and value[10] in 'T ':
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+    return value
+
+
+def _matches(row, column, op, value):
+    if op == 'or':
+        return any(_matches(row, *condition) for condition in value)
+    if op.startswith('not.'):
+        return not _matches(row, column, op[4:], value)
+    if '.' in column:
+        relation, column = column.split('.', 1)
+        row = row.get(relation) or {}
+    field = row.get(column)
+    if op == 'eq':
+        return str(field) == str(value)
+    if op == 'neq':
+        return str(field) != str(value)
+    if op == 'is':
+        return field is None if value == 'null' else str(field).lower() == value
+    if op == 'in':
+        return str(field) in value
+    if field is None:
+        return False
+    field, value = _comparable(field), _comparable(value)
+    return {'lt': field < value, 'lte': field <= value, 'gt': field > value, 'gte': field >= value}[op]
+
+
+def _parse_columns(columns):
+    """(plain columns or None for all, [(relation, inner)]) from a select string"""
+    plain, embeds = [], []
+    depth, current = 0, ''
+    for char in columns + ',':
+        if char == ',' and depth == 0:
+            part = current.strip()
+            current = ''
+            if not part:
+                continue
+            if '(' in part:
+                name = part.split('(', 1)[0]
+                embeds.append((name.split('!')[0], name.endswith('!inner')))
+            else:
+                plain.append(part)
+            continue
+        depth += char == '('
+        depth -= char == ')'
+        current += char
+    return (None if not plain or '*' in plain else plain), embeds
+
+
+class FakeDatabase:
+    """Tables of row dicts with hash indexes built on first use per column"""
+
+    def __init__(self):
+        self.tables = {}
+        self._indexes = {}  # (table, column) -> {str(value): [rows]}
+        self.lock = threading.RLock()
+
+    def rows(self, table):
+        return self.tables.setdefault(table, [])
+
+    def lookup(self, table, column, values):
+        index = self._indexes.get((table, column))
+        if index is None:
+            index = self._indexes[(table, column)] = {}
+            for row in self.rows(table):
+                index.setdefault(str(row.get(column)), []).append(row)
+        found = []
+        for value in values:
+            found.extend(index.get(str(value), ()))
+        return found
+
+    def insert(self, table, rows):
+        self.rows(table).extend(rows)
+        for (indexed_table, column), index in self._indexes.items():
+            if indexed_table == table:
+                for row in rows:
+                    index.setdefault(str(row.get(column)), []).append(row)
+
+    def reindex(self, table):
+        for key in [key for key in self._indexes if key[0] == table]:
+            del self._indexes[key]
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.columns = '*'
+        self.filters = []
+        self.keysets = []
+        self.orders = []
+        self.row_limit = None
+        self.operation = 'select'
+        self.payload = None
+
+    def select(self, columns='*', **kwargs):
+        self.columns = columns
+        return self
+
+    def insert(self, payload, **kwargs):
+        self.operation, self.payload = 'insert', payload
+        return self
+
+    def upsert(self, payload, **kwargs):
+        self.operation, self.payload = 'upsert', payload
+        return self
+
+    def update(self, payload, **kwargs):
+        self.operation, self.payload = 'update', payload
+        return self
+
+    def delete(self, **kwargs):
+        self.operation = 'delete'
+        return self
+
+    def _filter(self, column, op, value):
+        self.filters.append((column, op, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, 'eq', value)
+
+    def neq(self, column, value):
+        return self._filter(column, 'neq', value)
+
+    def in_(self, column, values):
+        return self._filter(column, 'in', {str(value) for value in values})
+
+    def lt(self, column, value):
+        return self._filter(column, 'lt', value)
+
+    def lte(self, column, value):
+        return self._filter(column, 'lte', value)
+
+    def gt(self, column, value):
+        return self._filter(column, 'gt', value)
+
+    def gte(self, column, value):
+        return self._filter(column, 'gte', value)
+
+    def or_(self, expression, reference_table=None):
+        if ',and(' in expression:
+            # the (created_at, id) keyset filter app.py builds
+            head, tail = expression.split(',and(', 1)
+            _, op, created_at = head.split('.', 2)
+            message_id = tail.rstrip(')').rsplit('.', 1)[1]
+            self.keysets.append((op, _comparable(created_at.strip('"')), message_id))
+            return self
+        # otherwise a flat list of column.op.value conditions, e.g. recurrence.not.is.null
+        conditions = []
+        for condition in expression.split(','):
+            column, op, value = condition.split('.', 2)
+            if op == 'not':
+                negated, value = value.split('.', 1)
+                op = f'not.{negated}'
+            if reference_table:
+                column = f'{reference_table}.{column}'
+            conditions.append((column, op, value.strip('"')))
+        self.filters.append((None, 'or', conditions))
+        return self
+
+    def order(self, column, desc=False, **kwargs):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count, **kwargs):
+        self.row_limit = count
+        return self
+
+    def execute(self):
+        self.client.wait()
+        db = self.client.db
+        with db.lock:
+            if self.operation in ('insert', 'upsert'):
+                return SimpleNamespace(data=self._insert(db))
+            rows = self._select(db)
+            if self.operation == 'update':
+                for row in rows:
+                    row.update(self.payload)
+                db.reindex(self.table)
+                return SimpleNamespace(data=[dict(row) for row in rows])
+            if self.operation == 'delete':
+                doomed = {id(row) for row in rows}
+                db.tables[self.table] = [row for row in db.rows(self.table) if id(row) not in doomed]
+                db.reindex(self.table)
+                return SimpleNamespace(data=[dict(row) for row in rows])
+            return SimpleNamespace(data=self._project(db, rows))
+
+    def _insert(self, db):
+        items = self.payload if isinstance(self.payload, list) else [self.payload]
+        rows = []
+        for item in items:
+            row = dict(item)
+            row.setdefault('id', str(uuid.uuid4()))
+            row.setdefault('created_at', timestamp())
+            rows.append(row)
+        new = []
+        for row in rows:
+            existing = db.lookup(self.table, 'id', [row['id']]) if self.operation == 'upsert' else None
+            if existing:
+                existing[0].update(row)
+            else:
+                new.append(row)
+        db.insert(self.table, new)
+        return [dict(row) for row in rows]
+
+    def _select(self, db):
+        filters = list(self.filters)
+        # narrow by an indexed equality filter before scanning
+        indexed = next((f for f in filters if f[1] in ('eq', 'in') and '.' not in (f[0] or '.')), None)
+        if indexed is not None:
+            filters.remove(indexed)
+            values = indexed[2] if indexed[1] == 'in' else [indexed[2]]
+            rows = db.lookup(self.table, indexed[0], values)
+        else:
+            rows = db.rows(self.table)
+
+        _, embeds = _parse_columns(self.columns)
+        dotted = [c for column, op, value in filters for c in ([column] if op != 'or' else [c[0] for c in value])]
+        if any(column.split('.')[0] in dict(embeds) for column in dotted if column and '.' in column):
+            rows = [self._embed(db, row, embeds) for row in rows]
+        rows = [row for row in rows if all(_matches(row, *f) for f in filters)]
+        for op, created_at, message_id in self.keysets:
+            if op == 'lt':
+                rows = [row for row in rows if (_comparable(row['created_at']), row['id']) < (created_at, message_id)]
+            else:
+                rows = [row for row in rows if (_comparable(row['created_at']), row['id']) > (created_at, message_id)]
+        for column, desc in reversed(self.orders):
+            rows = sorted(rows, key=lambda row: (row.get(column) is None, _comparable(row.get(column))), reverse=desc)
+        if self.row_limit is not None:
+            rows = rows[:self.row_limit]
+        return rows
+
+    def _embed(self, db, row, embeds):
+        row = dict(row)
+        for relation, _ in embeds:
+            key = FOREIGN_KEYS.get(relation, relation.rstrip('s') + '_id')
+            found = db.lookup(relation, 'id', [row.get(key)])
+            row[relation] = dict(found[0]) if found else None
+        return row
+
+    def _project(self, db, rows):
+        columns, embeds = _parse_columns(self.columns)
+        result = []
+        for row in rows:
+            if embeds and not all(relation in row for relation, _ in embeds):
+                row = self._embed(db, row, embeds)
+            if any(inner and not row.get(relation) for relation, inner in embeds):
+                continue
+            out = dict(row) if columns is None else {column: row.get(column) for column in columns}
+            for relation, _ in embeds:
+                out[relation] = row.get(relation)
+            result.append(out)
+        return result
+
+
+class FakeAuth:
+    def __init__(self, client):
+        self.client = client
+
+    def get_user(self, token):
+        """Access tokens are user ids"""
+        self.client.wait()
+        found = self.client.db.lookup('users', 'id', [token])
+        if not found:
+            raise Exception('Invalid token')
+        return SimpleNamespace(user=SimpleNamespace(id=found[0]['id'], email=found[0].get('email')))
+
+    def sign_out(self):
+        pass
+
+
+class FakeSupabase:
+    """Supabase client stand-in; every request sleeps latency +/- jitter (fraction) seconds"""
+
+    def __init__(self, latency=0.0, jitter=0.0, seed=0):
+        self.db = FakeDatabase()
+        self.latency = latency
+        self.jitter = jitter
+        self.auth = FakeAuth(self)
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency * self._random.uniform(1 - self.jitter, 1 + self.jitter)
+        if delay:
+            time.sleep(delay)
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, function, params=None, **kwargs):
+        # the optional SQL installs are absent, so app.py uses its fallback queries
+        raise APIError({'code': 'PGRST202', 'message': f'Could not find the function public.{function}',
+                        'hint': None, 'details': None})
+
+
+class FakeOpenAI:
+    """OpenAI client stand-in: `latency` seconds to the first token, then one word per `token_latency`"""
+
+    def __init__(self, latency=0.0, token_latency=0.0, words=40):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.words = words
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _reply(self, messages):
+        words = ' '.join(message['content'] for message in messages).split()
+        count = min(self.words, len(words)) or 1
+        return [(words[i] if words else 'ok') + ' ' for i in range(count)]
+
+    def create(self, model=None, messages=(), stream=False, **kwargs):
+        self.calls += 1
+        words = self._reply(messages)
+        time.sleep(self.latency)
+        if stream:
+            return self._stream(words)
+        time.sleep(self.token_latency * len(words))
+        message = SimpleNamespace(content=''.join(words).strip())
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    def _stream(self, words):
+        for word in words:
+            time.sleep(self.token_latency)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+
+
+def load_demo_users(path=os.path.join(BACKEND_DIR, 'seed_data.py')):
+    """The `demo_users` list from seed_data.py, without running the script"""
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, 'id', None) == 'demo_users' for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise ValueError(f'No demo_users in {path}')
+
+
+def _load_json(name):
+    with open(os.path.join(DATA_DIR, name)) as f:
+        return json.load(f)
+
+
+def seed(supabase, history=200, now=None):
+    """Fill the fake's tables from the demo data; returns {'users': [...], 'conversations': [...]}
+
+    Every conversation is padded to `history` messages by cycling its
+    messages.json texts, one minute apart and ending an hour before `now`.
+    All users also share one team conversation, so sends fan out to everyone.
+    """
+    now = now or datetime.now(timezone.utc)
+    users = {}
+
+    def add_user(username, full_name, email=None, bio=None):
+        key = username.lower()
+        if key not in users:
+            users[key] = {
+                'id': seeded_id('user', key),
+                'username': key,
+                'full_name': full_name,
+                'email': email or f'{key}@office.io',
+                'avatar_url': None,
+                'bio': bio,
+                'created_at': timestamp(now - timedelta(days=30))
+            }
+        return users[key]
+
+    for demo in load_demo_users():
+        add_user(demo['username'], demo['full_name'], demo['email'], demo.get('bio'))
+    owner = _load_json('user.json')
+    add_user(owner['userId'], owner.get('name', owner['userId']))
+
+    def user_for(name):
+        return add_user(name.split()[0] if ' ' in name else name, name)
+
+    conversations, participants, messages = [], [], []
+    texts_by_conversation = _load_json('messages.json')
+    all_texts = [m['text'] for thread in texts_by_conversation.values() for m in thread]
+
+    def add_conversation(key, kind, name, members, thread):
+        conversation = {
+            'id': seeded_id('conversation', key), 'type': kind, 'name': name, 'description': None,
+            'created_by': members[0]['id'], 'created_at': timestamp(now - timedelta(days=30))
+        }
+        conversations.append(conversation)
+        participants.extend({'id': seeded_id('participant', key, m['id']), 'conversation_id': conversation['id'],
+                             'user_id': m['id'], 'created_at': conversation['created_at']} for m in members)
+        thread = thread or [{'text': text, 'senderId': members[i % len(members)]['username']}
+                            for i, text in enumerate(all_texts)]
+        start = now - timedelta(hours=1, minutes=history)
+        for i in range(history):
+            item = thread[i % len(thread)]
+            sender = users.get(item['senderId'].lower()) or user_for(item['senderId'])
+            if sender not in members:
+                sender = members[i % len(members)]
+            messages.append({
+                'id': seeded_id('message', key, i), 'conversation_id': conversation['id'], 'sender_id': sender['id'],
+                'content': item['text'], 'created_at': timestamp(start + timedelta(minutes=i))
+            })
+
+    for key, conversation in _load_json('conversations.json').items():
+        members = [user_for(name) for name in conversation['participants']]
+        add_conversation(key, conversation['type'], conversation['name'], members, texts_by_conversation.get(key))
+    add_conversation('team', 'team', 'Engineering Team', list(users.values()), None)
+
+    events, attendees = [], []
+    for i, event in enumerate(_load_json('events.json')):
+        creator = users[owner['userId'].lower()]
+        row = {
+            'id': event['id'], 'title': event['title'], 'description': event.get('description'),
+            'start_time': timestamp(now + timedelta(days=1, hours=i)),
+            'end_time': timestamp(now + timedelta(days=1, hours=i + 1)),
+            'location': event.get('person'), 'created_by': creator['id'], 'created_at': timestamp(now)
+        }
+        events.append(row)
+        attendees.extend({'id': seeded_id('attendee', row['id'], u['id']), 'event_id': row['id'],
+                          'user_id': u['id'], 'status': 'accepted'} for u in users.values())
+
+    db = supabase.db
+    with db.lock:
+        db.insert('users', list(users.values()))
+        db.insert('conversations', conversations)
+        db.insert('conversation_participants', participants)
+        db.insert('messages', messages)
+        db.insert('events', events)
+        db.insert('event_attendees', attendees)
+    return {'users': list(users.values()), 'conversations': conversations}
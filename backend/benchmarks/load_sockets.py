@@ -0,0 +1,139 @@
+"""
+How many concurrent Socket.IO connections one backend instance holds
+
+    ASYNC_MODE=gevent python serve.py            # in one terminal
+    python benchmarks/load_sockets.py --sockets 2000 --rate 200 --hold 30
+
+Opens WebSocket connections at --rate per second, joins each one to the 3D
+office, keeps them answering pings for --hold seconds and reports how many
+stayed up, the connect-to-welcome latency, and how many snapshots arrived.
+With --movers N the first N clients also send a player_move every 100 ms so
+the tick loop has work to fan out. Every join is broadcast to everyone already
+in the office, so --idle (connect only, no join) isolates raw socket capacity.
+
+Speaks Engine.IO v4 / Socket.IO v5 directly, so the only dependency is the
+`websockets` package.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+
+try:
+    import websockets
+except ImportError:
+    sys.exit("pip install websockets to run the load test")
+
+
+class Stats:
+    def __init__(self):
+        self.connected = 0
+        self.failed = 0
+        self.dropped = 0
+        self.snapshots = 0
+        self.latencies = []
+        self.errors = {}
+
+    def error(self, e):
+        key = type(e).__name__
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+
+async def move(ws):
+    while True:
+        position = {'x': random.uniform(-20, 20), 'y': 1, 'z': random.uniform(-20, 20)}
+        await ws.send('42' + json.dumps(['player_move', {'position': position, 'rotation': 0}]))
+        await asyncio.sleep(0.1)
+
+
+async def session(ws, n, stats, started, mover, state, idle):
+    mover_task = None
+    try:
+        async for packet in ws:
+            if packet == '2':
+                await ws.send('3')             # pong
+            elif packet.startswith('0{'):
+                await ws.send('40')            # engine.io open -> socket.io connect
+            elif packet.startswith('40') and idle:
+                stats.latencies.append(time.monotonic() - started)
+                stats.connected += 1
+                state['joined'] = True
+            elif packet.startswith('40'):
+                await ws.send('42' + json.dumps(['join_office', {'user_id': f'load-{n}', 'username': f'load-{n}'}]))
+            elif packet.startswith('42["office_welcome"'):
+                stats.latencies.append(time.monotonic() - started)
+                stats.connected += 1
+                state['joined'] = True
+                if mover:
+                    mover_task = asyncio.create_task(move(ws))
+            elif packet.startswith('42["players_snapshot"'):
+                stats.snapshots += 1
+    finally:
+        if mover_task:
+            mover_task.cancel()
+
+
+async def client(url, n, stats, hold_until, mover, idle):
+    started = time.monotonic()
+    state = {'joined': False}
+    try:
+        async with websockets.connect(url, open_timeout=30, ping_interval=None, max_queue=None) as ws:
+            try:
+                await asyncio.wait_for(session(ws, n, stats, started, mover, state, idle), hold_until - time.monotonic())
+            except asyncio.TimeoutError:
+                return
+            raise ConnectionError("server closed the socket")
+    except Exception as e:
+        stats.error(e)
+        if state['joined']:
+            stats.dropped += 1
+        else:
+            stats.failed += 1
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='ws://127.0.0.1:5000/socket.io/?EIO=4&transport=websocket')
+    parser.add_argument('--sockets', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=100, help='new connections per second')
+    parser.add_argument('--hold', type=float, default=20, help='seconds to keep sockets open after the ramp')
+    parser.add_argument('--movers', type=int, default=10)
+    parser.add_argument('--idle', action='store_true', help='connect without joining the office')
+    args = parser.parse_args()
+
+    stats = Stats()
+    ramp = args.sockets / args.rate
+    hold_until = time.monotonic() + ramp + args.hold
+    tasks = []
+    for n in range(args.sockets):
+        tasks.append(asyncio.create_task(client(args.url, n, stats, hold_until, n < args.movers, args.idle)))
+        await asyncio.sleep(1 / args.rate)
+
+    while time.monotonic() < hold_until:
+        await asyncio.sleep(5)
+        print(f"  {stats.connected} joined, {stats.failed} failed, {stats.dropped} dropped")
+    await asyncio.gather(*tasks)
+
+    print(f"\n{'sockets':>10} {'joined':>8} {'failed':>8} {'dropped':>8} {'p50 ms':>8} {'p99 ms':>8} {'snapshots':>10}")
+    print(f"{args.sockets:>10} {stats.connected:>8} {stats.failed:>8} {stats.dropped:>8} "
+          f"{percentile(stats.latencies, 50) * 1000:>8.1f} {percentile(stats.latencies, 99) * 1000:>8.1f} "
+          f"{stats.snapshots:>10}")
+    if stats.latencies:
+        print(f"mean join latency {statistics.mean(stats.latencies) * 1000:.1f} ms")
+    if stats.errors:
+        print("errors:", ", ".join(f"{k} x{v}" for k, v in sorted(stats.errors.items())))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,200 @@
+"""
+Small in-process caches shared by the backend
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a TTL"""
+
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return a live entry (refreshing its LRU position) or default"""
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Store a value, evicting the least recently used entry when full"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Remove an entry and return its value if it was still live"""
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+        if item is _MISSING or item[1] <= time.monotonic():
+            return default
+        return item[0]
+
+    def evict_if(self, predicate):
+        """Remove every entry whose key matches predicate(key)"""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            return item is not _MISSING and item[1] > time.monotonic()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Counters for the /health endpoint"""
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class RecentMessages:
+    """Newest messages of the busiest conversations, within a memory budget
+
+    Each cached conversation holds up to `per_conversation` messages in
+    ascending order; conversations are evicted least recently used first once
+    the estimated size of everything cached exceeds `max_bytes`.
+    """
+
+    def __init__(self, per_conversation=200, max_bytes=32 * 1024 * 1024):
+        self.per_conversation = per_conversation
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._data = OrderedDict()  # conversation_id -> {'messages', 'sizes', 'complete'}
+        self._writes = {}           # conversation_id -> writes seen while not cached
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(message):
+        # rough: serialized length plus per-object overhead
+        return len(json.dumps(message, default=str)) + 200
+
+    def get(self, conversation_id):
+        """(messages, complete) or None; complete means nothing older exists"""
+        with self._lock:
+            entry = self._data.get(conversation_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(conversation_id)
+            self.hits += 1
+            return list(entry['messages']), entry['complete']
+
+    def version(self, conversation_id):
+        """Token to pass to load(), taken before reading from the database"""
+        with self._lock:
+            return (self._epoch, self._writes.get(conversation_id, 0))
+
+    def load(self, conversation_id, messages, complete, version):
+        """Cache the newest messages read from the database
+
+        Skipped if a message was appended since `version` was taken, since the
+        read may not include it.
+        """
+        with self._lock:
+            if version != (self._epoch, self._writes.get(conversation_id, 0)):
+                return False
+            self._writes.pop(conversation_id, None)
+            self._drop(conversation_id)
+            complete = complete and len(messages) <= self.per_conversation
+            messages = messages[-self.per_conversation:]
+            sizes = [self._size(m) for m in messages]
+            self._data[conversation_id] = {'messages': messages, 'sizes': sizes, 'complete': complete}
+            self.bytes += sum(sizes)
+            self._shrink()
+            return True
+
+    def append(self, conversation_id, messages):
+        """Add newly sent messages to a cached conversation"""
+        with self._lock:
+            entry = self._data.get(conversation_id)
+            if entry is None:
+                if len(self._writes) > 10000:
+                    self._writes.clear()
+                    self._epoch += 1
+                self._writes[conversation_id] = self._writes.get(conversation_id, 0) + 1
+                return
+            known = {m['id'] for m in entry['messages'][-len(messages) * 2:]}
+            for message in messages:
+                if message['id'] in known:
+                    continue
+                size = self._size(message)
+                entry['messages'].append(message)
+                entry['sizes'].append(size)
+                self.bytes += size
+            overflow = len(entry['messages']) - self.per_conversation
+            if overflow > 0:
+                self.bytes -= sum(entry['sizes'][:overflow])
+                del entry['messages'][:overflow]
+                del entry['sizes'][:overflow]
+                entry['complete'] = False
+            self._data.move_to_end(conversation_id)
+            self._shrink()
+
+    def invalidate(self, conversation_id):
+        with self._lock:
+            self._drop(conversation_id)
+            self._writes[conversation_id] = self._writes.get(conversation_id, 0) + 1
+
+    def _drop(self, conversation_id):
+        entry = self._data.pop(conversation_id, None)
+        if entry is not None:
+            self.bytes -= sum(entry['sizes'])
+
+    def _shrink(self):
+        while self.bytes > self.max_bytes and self._data:
+            _, entry = self._data.popitem(last=False)
+            self.bytes -= sum(entry['sizes'])
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "conversations": len(self._data),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
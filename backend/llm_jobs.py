@@ -0,0 +1,161 @@
+"""
+Bounded background execution for LLM calls
+
+Model calls are submitted as jobs to a fixed-size worker pool behind a token
+bucket rate limiter, so a burst of uploads queues up instead of becoming a
+burst of parallel OpenAI requests. Finished results are kept in an LRU/TTL
+cache keyed by the caller (e.g. document hash + question).
+"""
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from cache import TTLCache
+
+log = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised when too many jobs are already waiting"""
+
+
+class RateLimiter:
+    """Token bucket; acquire() blocks until a call is allowed"""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or max(1, rate_per_minute // 10))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class JobQueue:
+    """Run LLM calls with bounded concurrency, rate limiting and a result cache"""
+
+    def __init__(self, max_concurrency=4, rate_per_minute=60, max_pending=100,
+                 result_cache_size=1000, result_ttl=3600.0, job_ttl=3600.0, on_complete=None):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.on_complete = on_complete
+        self.limiter = RateLimiter(rate_per_minute) if rate_per_minute else None
+        self.results = TTLCache(maxsize=result_cache_size, ttl=result_ttl)
+        self.jobs = TTLCache(maxsize=max(max_pending * 10, 1000), ttl=job_ttl)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='llm')
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+
+    @contextmanager
+    def slot(self):
+        """Hold one unit of model concurrency (also used by streaming calls)"""
+        with self._slots:
+            if self.limiter:
+                self.limiter.acquire()
+            yield
+
+    def submit(self, user_id, kind, fn, cache_key=None, notify=True):
+        """Queue fn() and return the job record immediately
+
+        on_complete is called when the job finishes if notify is set.
+        """
+        job = {
+            'id': str(uuid.uuid4()),
+            'user_id': user_id,
+            'kind': kind,
+            'status': 'queued',
+            'result': None,
+            'error': None,
+            'cached': False,
+            'created_at': time.time(),
+            'finished_at': None,
+            'notify': notify
+        }
+
+        cached = self.results.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            job.update(status='done', result=cached, cached=True, finished_at=time.time())
+            self.jobs.set(job['id'], job)
+            return job
+
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise QueueFull("Too many requests are waiting for the model, try again shortly")
+            self.pending += 1
+
+        self.jobs.set(job['id'], job)
+        job['future'] = self._executor.submit(self._run, job, fn, cache_key)
+        return job
+
+    def run(self, user_id, kind, fn, cache_key=None, timeout=None):
+        """Submit and wait; returns the result or raises the job's error"""
+        job = self.submit(user_id, kind, fn, cache_key, notify=False)
+        if job['status'] == 'done':
+            return job['result']
+        return job['future'].result(timeout=timeout)
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def stats(self):
+        return {
+            'max_concurrency': self.max_concurrency,
+            'pending': self.pending,
+            'completed': self.completed,
+            'failed': self.failed,
+            'result_cache': self.results.stats()
+        }
+
+    def _run(self, job, fn, cache_key):
+        try:
+            # An identical job may have finished while this one was queued
+            result = self.results.get(cache_key) if cache_key is not None else None
+            if result is not None:
+                job['cached'] = True
+            else:
+                job['status'] = 'running'
+                with self.slot():
+                    result = fn()
+                if cache_key is not None:
+                    self.results.set(cache_key, result)
+            job.update(status='done', result=result)
+            return result
+        except Exception as e:
+            job.update(status='error', error=str(e))
+            raise
+        finally:
+            job['finished_at'] = time.time()
+            with self._lock:
+                self.pending -= 1
+                if job['status'] == 'done':
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            if self.on_complete and job['notify']:
+                try:
+                    self.on_complete(job)
+                except Exception:
+                    log.exception("Job completion callback failed")
+
+
+def public_job(job):
+    """Job fields safe to return to the client"""
+    return {key: job[key] for key in ('id', 'kind', 'status', 'result', 'error', 'cached', 'created_at', 'finished_at')}
@@ -0,0 +1,75 @@
+"""
+Non-blocking log output
+
+Log calls only put the record on a bounded in-memory queue; a background
+listener formats it and writes it to stdout, so handlers never wait on the
+terminal or the platform's log collector. If the writer falls behind and the
+queue fills up, new records are dropped and counted instead of blocking.
+
+LOG_FORMAT=json writes one JSON object per line for log pipelines.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'message': record.getMessage()  # tracebacks are already appended by QueueHandler
+        }
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the caller"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler = None
+_listener = None
+
+
+def configure(level='INFO', fmt='text', max_queue=10000):
+    """Route the root logger through the queue; safe to call more than once"""
+    global _handler, _listener
+    if _handler is not None:
+        return _handler
+
+    output = logging.StreamHandler(sys.stdout)
+    if fmt == 'json':
+        output.setFormatter(JSONFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    _handler = DroppingQueueHandler(queue.Queue(maxsize=max_queue))
+    _listener = QueueListener(_handler.queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)  # drain what is queued on shutdown
+
+    root = logging.getLogger()
+    root.handlers = [_handler]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    return _handler
+
+
+def stats():
+    if _handler is None:
+        return None
+    return {'queued': _handler.queue.qsize(), 'dropped': _handler.dropped}
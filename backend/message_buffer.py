@@ -0,0 +1,227 @@
+"""
+Write-behind persistence for chat messages
+
+A message is acknowledged once it has an id, a sequence number and a line in
+the local journal; a background flusher then writes pending messages to the
+database in small ordered batches, retrying with backoff. On restart the
+journal is replayed, so anything acknowledged but not yet stored is written
+again (inserts are idempotent on the id).
+
+Journal lines are JSON:
+    {"op": "add", "seq": 12, "row": {...}}   message accepted
+    {"op": "done", "seq": 12}                everything up to seq 12 is stored
+
+A journal belongs to one process at a time: it is held with an exclusive
+lock on `<journal>.lock`, so worker processes each need their own (see
+claim_journal).
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: no locking, run a single process
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+
+class JournalLocked(RuntimeError):
+    """Raised when another process already writes to the journal"""
+
+
+def _lock_journal(journal_path):
+    """Exclusively lock journal_path for this process; returns the open lock file"""
+    lock_file = open(journal_path + '.lock', 'a')
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise JournalLocked(f"{journal_path} is in use by another process")
+    return lock_file
+
+
+class WriteBehindBuffer:
+    """Ordered, journaled queue of rows waiting to be inserted"""
+
+    def __init__(self, flush_fn, journal_path, batch_size=100, flush_interval=0.05,
+                 max_backoff=30.0, fsync=False, is_permanent=None, on_reject=None):
+        # flush_fn(rows) must store all rows or raise; it may be called again with rows it already stored
+        self.flush_fn = flush_fn
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.fsync = fsync
+        # is_permanent(exc) -> True for errors retrying won't fix (bad data); such rows are set aside
+        self.is_permanent = is_permanent or (lambda exc: False)
+        self.on_reject = on_reject
+        self.rejected_path = journal_path + '.rejected'
+
+        self.seq = 0
+        self.flushed = 0
+        self.failures = 0
+        self.last_error = None
+        self._pending = []   # [(seq, row)] in seq order
+        self._cond = threading.Condition()
+        self._thread = None
+
+        directory = os.path.dirname(journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock_file = _lock_journal(journal_path)
+        self._recover()
+        self._journal = open(journal_path, 'a', encoding='utf-8')
+
+    def _recover(self):
+        """Reload rows that were journaled but never confirmed as stored"""
+        done = 0
+        added = []
+        try:
+            with open(self.journal_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn write from a crash
+                    self.seq = max(self.seq, entry.get('seq', 0))
+                    if entry.get('op') == 'add':
+                        added.append((entry['seq'], entry['row']))
+                    elif entry.get('op') == 'done':
+                        done = max(done, entry['seq'])
+        except FileNotFoundError:
+            return
+        self._pending = [(seq, row) for seq, row in added if seq > done]
+        if self._pending:
+            log.info("Replaying %d journaled messages", len(self._pending))
+
+    def _write(self, entry):
+        self._journal.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def append(self, rows):
+        """Journal and queue rows; returns copies with id, created_at and seq filled in"""
+        accepted = []
+        with self._cond:
+            for row in rows:
+                self.seq += 1
+                row = dict(row)
+                row.setdefault('id', str(uuid.uuid4()))
+                row.setdefault('created_at', datetime.now(timezone.utc).isoformat())
+                self._write({'op': 'add', 'seq': self.seq, 'row': row})
+                self._pending.append((self.seq, row))
+                accepted.append(dict(row, seq=self.seq))
+            self._cond.notify()
+        return accepted
+
+    def pending(self, predicate=None):
+        """Rows accepted but not yet stored, oldest first"""
+        with self._cond:
+            return [dict(row, seq=seq) for seq, row in self._pending if predicate is None or predicate(row)]
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='message-flusher', daemon=True)
+            self._thread.start()
+        return self
+
+    def flush_now(self, timeout=5.0):
+        """Wait until everything queued so far is stored (or timeout)"""
+        deadline = time.monotonic() + timeout
+        target = self.seq
+        while time.monotonic() < deadline:
+            with self._cond:
+                if not self._pending or self._pending[0][0] > target:
+                    return True
+            time.sleep(self.flush_interval)
+        return False
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'seq': self.seq,
+            'flushed': self.flushed,
+            'failures': self.failures,
+            'last_error': self.last_error
+        }
+
+    def _run(self):
+        backoff = 0.0
+        isolate = False  # after a data error, write rows one at a time to find the bad one
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # let a burst accumulate into one batch
+            time.sleep(backoff or self.flush_interval)
+
+            with self._cond:
+                batch = self._pending[:1 if isolate else self.batch_size]
+            try:
+                self.flush_fn([row for _, row in batch])
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                if self.is_permanent(e):
+                    if len(batch) > 1:
+                        isolate = True
+                        continue
+                    self._reject(batch[0], e)
+                    self._confirm(batch)
+                    continue
+                backoff = min(self.max_backoff, max(backoff * 2, 0.5))
+                log.error("Message flush failed, retrying in %.1fs: %s", backoff, e)
+                continue
+
+            backoff = 0.0
+            isolate = False
+            self.flushed += len(batch)
+            self._confirm(batch)
+
+    def _confirm(self, batch):
+        with self._cond:
+            del self._pending[:len(batch)]
+            if self._pending:
+                self._write({'op': 'done', 'seq': batch[-1][0]})
+            else:
+                # nothing outstanding: start a fresh journal that only remembers the sequence
+                self._journal.close()
+                tmp_path = self.journal_path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(json.dumps({'op': 'done', 'seq': self.seq}) + '\n')
+                os.replace(tmp_path, self.journal_path)
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def _reject(self, item, error):
+        seq, row = item
+        log.error("Dropping message %s after a permanent error: %s", row.get('id'), error)
+        with open(self.rejected_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'seq': seq, 'row': row, 'error': str(error)}) + '\n')
+        if self.on_reject:
+            try:
+                self.on_reject(row, error)
+            except Exception:
+                log.exception("Reject callback failed")
+
+
+def claim_journal(make_buffer, path_for_slot, slots=64):
+    """Build a buffer on the first journal no other process holds
+
+    path_for_slot(n) names journal n; a restarted worker takes over a free
+    slot and replays what its predecessor left unstored there.
+    """
+    for slot in range(slots):
+        try:
+            return make_buffer(path_for_slot(slot))
+        except JournalLocked:
+            continue
+    raise JournalLocked(f"All {slots} message journals are in use")
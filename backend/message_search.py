@@ -0,0 +1,244 @@
+"""
+Full-text search over chat messages
+
+An inverted index kept in memory and updated as messages are sent. Postings
+are sharded by conversation, so a search only touches the conversations the
+user belongs to and never reads message rows: matching and BM25 ranking run
+on the index alone, and only the page of hits is loaded to build snippets.
+
+Per message the index keeps its id, timestamp and length in flat arrays
+(26 bytes); postings are (message, term frequency) pairs in
+`array('I')` buckets, or a single packed int for a term seen once in a
+conversation, which is the common case.
+"""
+
+import heapq
+import math
+import threading
+import uuid
+from array import array
+
+from pdf_index import TOKEN_RE, tokenize
+from recurrence import parse_datetime
+
+
+def _pack_id(message_id):
+    try:
+        return uuid.UUID(message_id).bytes
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def _position(bucket, doc):
+    """Index of the first pair in an interleaved (doc, tf) bucket whose doc is >= doc"""
+    lo, hi = 0, len(bucket) // 2
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if bucket[mid * 2] < doc:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _lookup(bucket, doc):
+    """Term frequency of doc in a bucket, 0 if absent"""
+    i = _position(bucket, doc) * 2
+    return bucket[i + 1] if i < len(bucket) and bucket[i] == doc else 0
+
+
+def _expand(bucket):
+    if type(bucket) is int:
+        return (bucket >> 16, bucket & 0xFFFF)
+    return bucket
+
+
+def snippet(content, query, width=160):
+    """(text, [[start, end], ...]) around the first matched query term, with highlight offsets"""
+    terms = set(tokenize(query))
+    spans = [match.span() for match in TOKEN_RE.finditer(content.lower()) if match.group() in terms]
+    if not spans:
+        return content[:width], []
+
+    start = max(0, spans[0][0] - width // 4)
+    if start:
+        # don't cut a word in half
+        space = content.rfind(' ', 0, start)
+        start = space + 1 if space >= 0 and start - space < 20 else start
+    end = min(len(content), start + width)
+    text = content[start:end]
+    highlights = [[s - start, e - start] for s, e in spans if s >= start and e <= end]
+    if start:
+        text = '…' + text
+        highlights = [[s + 1, e + 1] for s, e in highlights]
+    if end < len(content):
+        text += '…'
+    return text, highlights
+
+
+class MessageIndex:
+    """Incremental inverted index over message content, sharded by conversation"""
+
+    def __init__(self, k1=1.2, b=0.75, max_candidates=10000):
+        self.k1 = k1
+        self.b = b
+        self.max_candidates = max_candidates
+        self._conversations = {}     # conversation_id -> shard number
+        self._shards = []            # shard -> {term: doc << 16 | tf, or array('I') of doc, tf, doc, tf, ...}
+        self._vocabulary = {}        # one shared str per term across shards
+        self._shard_docs = array('I')  # documents per shard
+        self._ids = bytearray()      # 16 bytes per doc (uuid)
+        self._odd_ids = {}           # doc -> id for ids that aren't uuids
+        self._doc_time = array('d')  # created_at, epoch seconds
+        self._doc_len = array('H')
+        self._total_len = 0
+        self._lock = threading.Lock()
+
+    def add(self, messages):
+        """Index messages ({id, conversation_id, content, created_at}); returns how many were added"""
+        added = 0
+        with self._lock:
+            for message in messages:
+                content = message.get('content')
+                if not content or not message.get('id') or not message.get('conversation_id'):
+                    continue
+                terms = {}
+                for term in tokenize(content):
+                    terms[term] = terms.get(term, 0) + 1
+                if not terms:
+                    continue
+
+                shard = self._conversations.get(message['conversation_id'])
+                if shard is None:
+                    shard = self._conversations[message['conversation_id']] = len(self._shards)
+                    self._shards.append({})
+                    self._shard_docs.append(0)
+
+                doc = len(self._doc_len)
+                packed = _pack_id(message['id'])
+                if packed is None:
+                    self._odd_ids[doc] = message['id']
+                    packed = bytes(16)
+                self._ids += packed
+                self._doc_time.append(parse_datetime(message['created_at']).timestamp() if message.get('created_at') else 0.0)
+                length = min(sum(terms.values()), 0xFFFF)
+                self._doc_len.append(length)
+                self._total_len += length
+                self._shard_docs[shard] += 1
+
+                postings = self._shards[shard]
+                for term, tf in terms.items():
+                    bucket = postings.get(term)
+                    if bucket is None:
+                        # most (conversation, term) pairs occur once: keep those as one int
+                        postings[self._vocabulary.setdefault(term, term)] = doc << 16 | min(tf, 0xFFFF)
+                    elif type(bucket) is int:
+                        postings[term] = array('I', (bucket >> 16, bucket & 0xFFFF, doc, tf))
+                    else:
+                        bucket.append(doc)
+                        bucket.append(tf)
+                added += 1
+        return added
+
+    def search(self, query, conversation_ids, limit=20, offset=0, order='relevance'):
+        """(hits, total, capped) for messages in conversation_ids containing every query term
+
+        hits are {message_id, conversation_id, score} for the requested page,
+        best match first (or newest first with order='recent'). Postings are in
+        indexing order, so when a conversation has more than max_candidates
+        messages with the rarest term only the most recent ones are considered;
+        capped is True and total then only counts those.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return [], 0, False
+
+        window = self.max_candidates * 2
+        capped = False
+        with self._lock:
+            shards = [(cid, self._conversations[cid]) for cid in set(conversation_ids) if cid in self._conversations]
+            docs = sum(self._shard_docs[shard] for _, shard in shards)
+            if not docs:
+                return [], 0, False
+
+            matched = {}  # doc -> conversation_id
+            matches = []  # (docs, [(term, {doc: tf})]) per conversation
+            df = dict.fromkeys(terms, 0)
+            for conversation_id, shard in shards:
+                postings = self._shards[shard]
+                buckets = {term: _expand(postings.get(term)) for term in terms}
+                for term, bucket in buckets.items():
+                    if bucket:
+                        df[term] += len(bucket) // 2
+                if not all(buckets.values()):
+                    continue  # every term is required
+
+                # start from the newest postings of the rarest term, then narrow by the others
+                rarest, *others = sorted(terms, key=lambda term: len(buckets[term]))
+                bucket = buckets[rarest]
+                if len(bucket) > window:
+                    bucket = bucket[-window:]
+                    capped = True
+                tfs = dict(zip(bucket[::2], bucket[1::2]))
+                found = tfs.keys()
+                freqs = [(rarest, tfs)]
+                for term in others:
+                    bucket = buckets[term]
+                    if len(bucket) > 64 * len(found):
+                        tfs = {doc: tf for doc in found for tf in (_lookup(bucket, doc),) if tf}
+                    else:
+                        bucket = bucket[_position(bucket, min(found)) * 2:]
+                        tfs = dict(zip(bucket[::2], bucket[1::2]))
+                    found = found & tfs.keys()
+                    freqs.append((term, tfs))
+                    if not found:
+                        break
+                if found:
+                    matched.update(dict.fromkeys(found, conversation_id))
+                    matches.append((found, freqs))
+
+            total = len(matched)
+            if not total:
+                return [], 0, capped
+
+            doc_time = self._doc_time
+            if order == 'recent':
+                ranked = heapq.nlargest(offset + limit, matched, key=doc_time.__getitem__)
+                page = [(doc, 0.0) for doc in ranked[offset:]]
+            else:
+                idf = {term: math.log(1 + (docs - n + 0.5) / (n + 0.5)) for term, n in df.items()}
+                k1 = self.k1
+                base = k1 * (1 - self.b)
+                per_len = k1 * self.b * len(self._doc_len) / (self._total_len or 1)
+                doc_len = self._doc_len
+                scores = dict.fromkeys(matched, 0.0)
+                for found, freqs in matches:
+                    for term, tfs in freqs:
+                        weight = idf[term] * (k1 + 1)
+                        for doc in found:
+                            tf = tfs[doc]
+                            scores[doc] += weight * tf / (tf + base + per_len * doc_len[doc])
+                ranked = heapq.nlargest(offset + limit, scores, key=lambda doc: (round(scores[doc], 6), doc_time[doc]))
+                page = [(doc, scores[doc]) for doc in ranked[offset:]]
+
+            hits = [{
+                'message_id': self._message_id(doc),
+                'conversation_id': matched[doc],
+                'score': round(score, 4)
+            } for doc, score in page]
+        return hits, total, capped
+
+    def _message_id(self, doc):
+        if doc in self._odd_ids:
+            return self._odd_ids[doc]
+        return str(uuid.UUID(bytes=bytes(self._ids[doc * 16:doc * 16 + 16])))
+
+    def stats(self):
+        return {
+            'messages': len(self._doc_len),
+            'conversations': len(self._shards),
+            'terms': sum(len(postings) for postings in self._shards)
+        }
+
+    def __len__(self):
+        return len(self._doc_len)
@@ -0,0 +1,235 @@
+"""
+In-process metrics in the Prometheus text format
+
+Counters, gauges and histograms with labels, kept in memory and rendered by
+`Registry.render()` for a `/metrics` endpoint. No client library needed;
+each observation is a dict lookup and a few additions under a lock.
+
+    requests = registry.histogram('http_request_duration_seconds', 'Latency', ('endpoint',))
+    with requests.time(endpoint='get_messages'):
+        ...
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers cache hits (sub-millisecond) up to model calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}")
+        return tuple(labels[name] for name in self.labels)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}' for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """A value that is set, or computed by a callback when scraped"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        super().__init__(name, documentation, labels)
+        # callback() -> {label values tuple: value}
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        if self.callback is not None:
+            items = list(self.callback().items())
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return self.header() + [
+            f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}' for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # per-bucket counts (last one is +Inf), sum
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][slot] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block took, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self, **labels):
+        """(count, sum, per-bucket counts) for one label set"""
+        with self._lock:
+            series = self._values.get(self._key(labels))
+            if series is None:
+                return 0, 0.0, [0] * (len(self.buckets) + 1)
+            return sum(series[0]), series[1], list(series[0])
+
+    def render(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        lines = self.header()
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, [("le", _format_value(bound))])} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Named metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=(), callback=None):
+        return self._add(Gauge(name, documentation, labels, callback))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f'# {metric.name} unavailable: {_escape(e)}')
+        return '\n'.join(lines) + '\n'
+
+
+class TimedQuery:
+    """Wraps a query builder (Supabase/PostgREST) so `execute()` is timed
+
+    Builder methods return wrapped builders, so chains like
+    `.select(...).eq(...).order(...)` keep working unchanged.
+    """
+
+    __slots__ = ('_query', '_histogram', '_labels')
+    METHODS = ('select', 'insert', 'upsert', 'update', 'delete')
+
+    def __init__(self, query, histogram, labels):
+        self._query = query
+        self._histogram = histogram
+        self._labels = labels
+
+    def __getattr__(self, name):
+        attr = getattr(self._query, name)
+        if not callable(attr):
+            return attr
+        labels = dict(self._labels, method=name) if name in self.METHODS else self._labels
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return TimedQuery(result, self._histogram, labels) if hasattr(result, 'execute') else result
+        return call
+
+    def execute(self):
+        with self._histogram.time(**self._labels):
+            return self._query.execute()
+
+
+class TimedClient:
+    """Supabase client whose table and RPC queries are timed by a histogram
+    labelled (table, method); everything else passes through"""
+
+    def __init__(self, client, histogram):
+        self._client = client
+        self._histogram = histogram
+
+    def table(self, name):
+        return TimedQuery(self._client.table(name), self._histogram, {'table': name, 'method': 'select'})
+
+    def rpc(self, function, *args, **kwargs):
+        return TimedQuery(self._client.rpc(function, *args, **kwargs), self._histogram,
+                          {'table': f'rpc:{function}', 'method': 'rpc'})
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
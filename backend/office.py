@@ -0,0 +1,305 @@
+"""
+Server-side state for the 3D office
+
+Player moves are only recorded when they arrive; a fixed-rate tick then sends
+one batched snapshot containing just the players whose quantized pose changed
+since the previous tick. Bandwidth therefore follows the tick rate rather than
+each client's frame rate.
+
+With an area-of-interest radius, each client gets its own snapshot: players
+within the radius (found through a uniform grid) at the full tick rate, the
+rest only every few ticks or not at all.
+
+Player state lives in a PlayerRegistry of __slots__ records indexed by sid
+and user_id, so moves update floats in place instead of allocating dicts.
+"""
+
+import math
+import threading
+
+# Positions are sent in centimetres and rotation in milliradians
+POSITION_SCALE = 100
+ROTATION_SCALE = 1000
+
+
+def _number(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def quantize(position, rotation):
+    """(x, y, z, rotation) as small integers"""
+    position = position or {}
+    return (
+        round(_number(position.get('x')) * POSITION_SCALE),
+        round(_number(position.get('y'), 1.0) * POSITION_SCALE),
+        round(_number(position.get('z')) * POSITION_SCALE),
+        round(_number(rotation) * ROTATION_SCALE),
+    )
+
+
+def parse_move(data):
+    """JSON player_move ({'position': {...}, 'rotation': r}) -> (x, y, z, rotation)"""
+    position = data.get('position') or {}
+    return (
+        _number(position.get('x')),
+        _number(position.get('y'), 1.0),
+        _number(position.get('z')),
+        _number(data.get('rotation')),
+    )
+
+
+class IndexAllocator:
+    """Hands out small integer player indexes in [start, stop), reusing freed ones"""
+
+    def __init__(self, start=0, stop=0x10000):
+        self._free = []
+        self._next = start
+        self._stop = stop
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            if self._next >= self._stop:
+                raise RuntimeError("Too many players for 16-bit indexes")
+            self._next += 1
+            return self._next - 1
+
+    def release(self, index):
+        with self._lock:
+            self._free.append(index)
+
+
+class Player:
+    """One avatar in the office"""
+
+    __slots__ = ('sid', 'user_id', 'username', 'index', 'binary', 'x', 'y', 'z', 'rotation')
+
+    def __init__(self, sid, user_id, username, index, binary=False):
+        self.sid = sid
+        self.user_id = user_id
+        self.username = username
+        self.index = index
+        self.binary = binary
+        self.x, self.y, self.z = 0.0, 1.0, 0.0
+        self.rotation = 0.0
+
+    def pose(self):
+        """Quantized (x, y, z, rotation)"""
+        return (
+            round(self.x * POSITION_SCALE),
+            round(self.y * POSITION_SCALE),
+            round(self.z * POSITION_SCALE),
+            round(self.rotation * ROTATION_SCALE),
+        )
+
+    def to_dict(self):
+        """Wire representation used by current_players / player_joined"""
+        return {
+            'user_id': self.user_id,
+            'username': self.username,
+            'position': {'x': self.x, 'y': self.y, 'z': self.z},
+            'rotation': self.rotation,
+            'sid': self.sid,
+            'index': self.index,
+        }
+
+
+class PlayerRegistry:
+    """Thread-safe store of office players, indexed by sid and by user_id"""
+
+    def __init__(self):
+        self._by_sid = {}
+        self._by_user = {}
+        self._indexes = IndexAllocator()
+        self._lock = threading.Lock()
+        self._roster = None  # cached to_dict() list, reset on join/leave/move
+        self.binary_count = 0
+
+    def __contains__(self, sid):
+        return sid in self._by_sid
+
+    def __len__(self):
+        return len(self._by_sid)
+
+    def get(self, sid):
+        return self._by_sid.get(sid)
+
+    def set_index_range(self, start, stop):
+        """Restrict player indexes to [start, stop); only while the office is empty"""
+        with self._lock:
+            if self._by_sid:
+                raise RuntimeError("Cannot change the index range while players are connected")
+            self._indexes = IndexAllocator(start, stop)
+
+    def for_user(self, user_id):
+        """All players (tabs) belonging to a user"""
+        with self._lock:
+            return [self._by_sid[sid] for sid in self._by_user.get(user_id, ())]
+
+    def add(self, sid, user_id, username, binary=False):
+        """Register a player, replacing any previous record for the same sid"""
+        self.remove(sid)
+        player = Player(sid, user_id, username, self._indexes.acquire(), binary)
+        with self._lock:
+            self._by_sid[sid] = player
+            self._by_user.setdefault(user_id, set()).add(sid)
+            self.binary_count += binary
+            self._roster = None
+        return player
+
+    def remove(self, sid):
+        """Drop a player; returns its record or None"""
+        with self._lock:
+            player = self._by_sid.pop(sid, None)
+            if player is None:
+                return None
+            sids = self._by_user.get(player.user_id)
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self._by_user[player.user_id]
+            self.binary_count -= player.binary
+            self._roster = None
+        self._indexes.release(player.index)
+        return player
+
+    def move(self, sid, x, y, z, rotation):
+        """Update a pose in place; returns False for unknown sids"""
+        player = self._by_sid.get(sid)
+        if player is None:
+            return False
+        with self._lock:
+            player.x, player.y, player.z, player.rotation = x, y, z, rotation
+            self._roster = None
+        return True
+
+    def poses(self):
+        """{sid: quantized pose} for every player"""
+        with self._lock:
+            players = list(self._by_sid.values())
+        return {player.sid: player.pose() for player in players}
+
+    def snapshot(self):
+        """List of player dicts for current_players, rebuilt only after changes"""
+        roster = self._roster
+        if roster is None:
+            with self._lock:
+                roster = self._roster = [player.to_dict() for player in self._by_sid.values()]
+        return roster
+
+
+class SpatialGrid:
+    """Uniform grid over the floor plane (x, z) for radius queries"""
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def _cell(self, x, z):
+        return (math.floor(x / self.cell_size), math.floor(z / self.cell_size))
+
+    def rebuild(self, poses):
+        """poses: sid -> (x, y, z, rotation)"""
+        self.cells = {}
+        for sid, pose in poses.items():
+            self.cells.setdefault(self._cell(pose[0], pose[2]), []).append(sid)
+
+    def nearby(self, poses, x, z, radius):
+        """Sids within radius of (x, z); radius must not exceed cell_size"""
+        cx, cz = self._cell(x, z)
+        radius_sq = radius * radius
+        found = []
+        for dx in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                for sid in self.cells.get((cx + dx, cz + dz), ()):
+                    pose = poses[sid]
+                    if (pose[0] - x) ** 2 + (pose[2] - z) ** 2 <= radius_sq:
+                        found.append(sid)
+        return found
+
+
+class SnapshotBuilder:
+    """Collects moved players between ticks and emits only changed poses"""
+
+    def __init__(self, aoi_radius=0.0, far_every=0):
+        # aoi_radius in scene units; 0 sends every change to everyone
+        self.aoi_radius = aoi_radius * POSITION_SCALE
+        # players outside the radius are refreshed every `far_every` ticks (0 = never)
+        self.far_every = far_every
+        self.grid = SpatialGrid(self.aoi_radius) if aoi_radius else None
+        self._moved = set()
+        self._last_sent = {}
+        self._far_pending = {}
+        self._lock = threading.Lock()
+        self.tick = 0
+
+    def mark_moved(self, sid):
+        with self._lock:
+            self._moved.add(sid)
+
+    def forget(self, sid):
+        with self._lock:
+            self._moved.discard(sid)
+            self._last_sent.pop(sid, None)
+            self._far_pending.pop(sid, None)
+
+    def _changed(self, players):
+        """Advance the tick and return {sid: pose} for players whose pose changed"""
+        with self._lock:
+            moved, self._moved = self._moved, set()
+        self.tick += 1
+
+        changed = {}
+        for sid in moved:
+            player = players.get(sid)
+            if player is None:
+                continue
+            pose = player.pose()
+            if self._last_sent.get(sid) == pose:
+                continue
+            self._last_sent[sid] = pose
+            changed[sid] = pose
+        return changed
+
+    def build(self, players):
+        """Per-client snapshots for this tick: {sid or None: snapshot}
+
+        A snapshot is {'t': tick, 'p': [[sid, x, y, z, rot], ...]}. Without an
+        area of interest the single snapshot is keyed by None (whole room).
+        `players` is the PlayerRegistry.
+        """
+        changed = self._changed(players)
+
+        if not self.grid:
+            if not changed:
+                return {}
+            return {None: {'t': self.tick, 'p': [[sid, *pose] for sid, pose in changed.items()]}}
+
+        self._far_pending.update(changed)
+        far_tick = self.far_every and self.tick % self.far_every == 0
+        if not changed and not (far_tick and self._far_pending):
+            return {}
+
+        poses = players.poses()
+        self.grid.rebuild(poses)
+
+        far = {}
+        if far_tick:
+            far, self._far_pending = self._far_pending, {}
+
+        snapshots = {}
+        for receiver, (x, _, z, _) in poses.items():
+            near = self.grid.nearby(poses, x, z, self.aoi_radius)
+            entries = [[sid, *changed[sid]] for sid in near if sid in changed and sid != receiver]
+            if far:
+                near_set = set(near)
+                entries.extend([sid, *pose] for sid, pose in far.items()
+                               if sid not in near_set and sid != receiver and sid in poses)
+            if entries:
+                snapshots[receiver] = {'t': self.tick, 'p': entries}
+        return snapshots
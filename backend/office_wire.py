@@ -0,0 +1,59 @@
+"""
+Compact binary encoding for office movement
+
+Clients that ask for `encoding: 'binary'` on join_office get snapshots as
+packed bytes instead of JSON, with a small per-player index in place of the
+sid string:
+
+    snapshot  = <u8 version> <u32 tick> <u16 count> entry*count
+    entry     = <u16 index> <i16 x_cm> <i16 y_cm> <i16 z_cm> <i16 rotation_mrad>
+
+A binary `player_move` from the client is a single pose:
+
+    move      = <i16 x_cm> <i16 y_cm> <i16 z_cm> <i16 rotation_mrad>
+
+All values are little-endian. Coordinates use the same fixed-point units as
+the JSON snapshots (see office.quantize), which cover +/-327 m at 1 cm.
+"""
+
+import struct
+
+from office import POSITION_SCALE, ROTATION_SCALE
+
+WIRE_VERSION = 1
+
+HEADER = struct.Struct('<BIH')
+ENTRY = struct.Struct('<Hhhhh')
+MOVE = struct.Struct('<hhhh')
+
+INT16_MIN, INT16_MAX = -32768, 32767
+
+
+def _clamp(value):
+    return INT16_MIN if value < INT16_MIN else INT16_MAX if value > INT16_MAX else value
+
+
+def encode_snapshot(tick, entries, index_of):
+    """Pack [[sid, x, y, z, rot], ...]; index_of maps sid -> player index"""
+    parts = [HEADER.pack(WIRE_VERSION, tick & 0xFFFFFFFF, len(entries))]
+    pack = ENTRY.pack
+    for sid, x, y, z, rotation in entries:
+        parts.append(pack(index_of[sid], _clamp(x), _clamp(y), _clamp(z), _clamp(rotation)))
+    return b''.join(parts)
+
+
+def decode_snapshot(payload):
+    """Inverse of encode_snapshot: (tick, [[index, x, y, z, rot], ...])"""
+    version, tick, count = HEADER.unpack_from(payload)
+    if version != WIRE_VERSION:
+        raise ValueError(f"Unsupported wire version {version}")
+    entries = [list(entry) for entry in ENTRY.iter_unpack(payload[HEADER.size:HEADER.size + count * ENTRY.size])]
+    return tick, entries
+
+
+def decode_move(payload):
+    """Binary player_move -> (x, y, z, rotation) in scene units"""
+    if len(payload) < MOVE.size:
+        raise ValueError(f"player_move needs {MOVE.size} bytes, got {len(payload)}")
+    x, y, z, rotation = MOVE.unpack(bytes(payload[:MOVE.size]))
+    return x / POSITION_SCALE, y / POSITION_SCALE, z / POSITION_SCALE, rotation / ROTATION_SCALE
@@ -0,0 +1,131 @@
+"""
+PDF text extraction with a process pool and an on-disk content-hash cache
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF for PDF processing
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: forking a multithreaded server can copy a held lock into the
+            # child. Spawned workers re-import the main module (serve.py guards its startup)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _extract_pages(pdf_data, start, stop):
+    """Text of pages [start, stop); runs in a worker process"""
+    with fitz.open(stream=pdf_data, filetype="pdf") as doc:
+        return [doc[i].get_text("text") for i in range(start, stop)]
+
+
+def iter_page_text(pdf_data):
+    """Yield the text of each page in order without holding the whole document"""
+    with fitz.open(stream=pdf_data, filetype="pdf") as doc:
+        for page in doc:
+            yield page.get_text("text")
+
+
+def extract_text(pdf_data, parallel_threshold=40, workers=None):
+    """Extract all text; documents with many pages are split across processes"""
+    with fitz.open(stream=pdf_data, filetype="pdf") as doc:
+        page_count = doc.page_count
+
+    if page_count < parallel_threshold:
+        pages = list(iter_page_text(pdf_data))
+    else:
+        workers = workers or os.cpu_count() or 1
+        step = -(-page_count // workers)
+        pool = _get_pool(workers)
+        futures = [
+            pool.submit(_extract_pages, pdf_data, start, min(start + step, page_count))
+            for start in range(0, page_count, step)
+        ]
+        pages = [text for future in futures for text in future.result()]
+
+    return "\n".join(pages) + "\n" if pages else ""
+
+
+def content_hash(pdf_data):
+    return hashlib.sha256(pdf_data).hexdigest()
+
+
+class ExtractionCache:
+    """Extracted text and summary per PDF, stored as <sha256>.json
+
+    When the entries outgrow max_bytes, the least recently used ones (by
+    mtime, which get() refreshes) are deleted.
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()  # serializes read-merge-write within the process
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, digest):
+        path = self._path(digest)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def set(self, digest, **fields):
+        """Merge fields (e.g. text=..., summary=...) into the cached entry"""
+        with self._lock:
+            entry = self.get(digest) or {}
+            entry.update(fields)
+            # a unique temp file per write, so concurrent writers never share one
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f"{digest}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(entry, f)
+                os.replace(tmp_path, self._path(digest))
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+            if self.max_bytes:
+                self._prune()
+        return entry
+
+    def _prune(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for item in os.scandir(self.directory):
+            if item.name.endswith(".json"):
+                try:
+                    stat = item.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, item.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
@@ -0,0 +1,107 @@
+"""
+Lexical retrieval over uploaded PDFs
+
+Extracted text is split into overlapping chunks and indexed with BM25 so a
+question only sends the few most relevant chunks to the model, instead of
+the first few thousand characters of the document.
+"""
+
+import math
+import re
+from collections import Counter
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have how i in is it its of on or that the
+this to was what when where which who why will with you your do does can
+""".split())
+
+
+def tokenize(text):
+    """Lowercased word tokens without stopwords"""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def chunk_text(text, size=1200, overlap=200):
+    """Split text into ~size character chunks on word boundaries"""
+    words = text.split()
+    chunks = []
+    current = []
+    length = 0
+
+    for word in words:
+        current.append(word)
+        length += len(word) + 1
+        if length >= size:
+            chunks.append(" ".join(current))
+            # carry the tail over so sentences spanning a boundary stay findable
+            tail = []
+            tail_length = 0
+            for prev in reversed(current):
+                if tail_length + len(prev) + 1 > overlap:
+                    break
+                tail.append(prev)
+                tail_length += len(prev) + 1
+            current = tail[::-1]
+            length = tail_length
+
+    if current and (not chunks or length > overlap):
+        chunks.append(" ".join(current))
+    return chunks
+
+
+class DocumentIndex:
+    """BM25 index over the chunks of one document"""
+
+    def __init__(self, text, chunk_size=1200, overlap=200, k1=1.5, b=0.75):
+        self.chunks = chunk_text(text, chunk_size, overlap)
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(chunk)) for chunk in self.chunks]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        # term -> list of chunk indexes containing it
+        self.postings = {}
+        for i, tf in enumerate(self.term_freqs):
+            for term in tf:
+                self.postings.setdefault(term, []).append(i)
+
+        n = len(self.chunks)
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def search(self, query, k=4):
+        """Return [(score, chunk_index)] for the top-k chunks, best first"""
+        scores = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i in self.postings[term]:
+                tf = self.term_freqs[i][term]
+                norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[i] / self.avg_length)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+        return sorted(((score, i) for i, score in scores.items()), reverse=True)[:k]
+
+    def context_for(self, query, k=4):
+        """Top-k chunks joined in document order, falling back to the opening chunks"""
+        hits = sorted(i for _, i in self.search(query, k)) or list(range(min(k, len(self.chunks))))
+        return "\n\n".join(f"[Excerpt {i + 1}]\n{self.chunks[i]}" for i in hits)
+
+    def overview(self, max_chars=8000):
+        """Chunks spread evenly across the document, within a character budget"""
+        if not self.chunks:
+            return ""
+        per_chunk = max(len(chunk) for chunk in self.chunks)
+        count = max(1, min(len(self.chunks), max_chars // per_chunk))
+        step = len(self.chunks) / count
+        picked = [self.chunks[int(i * step)] for i in range(count)]
+        return "\n\n".join(picked)[:max_chars]
@@ -0,0 +1,281 @@
+"""
+Who is online, across tabs, sockets and backend processes
+
+A user is online while any of their sockets is, with the strongest status
+any of them reports (busy > online > away). Sockets stay alive by sending
+heartbeats; each heartbeat re-arms the socket on a timing wheel, so expiring
+silent sockets costs O(1) per socket instead of a scan of everyone online.
+Other processes' users are merged in per node.
+
+Status changes are coalesced between flushes and only delivered to the
+sockets that subscribed to the users concerned.
+"""
+
+import math
+import threading
+import time
+
+STATUSES = ('busy', 'online', 'away')  # strongest first
+OFFLINE = 'offline'
+_RANK = {status: rank for rank, status in enumerate(STATUSES)}
+
+
+def strongest(statuses):
+    """Combined status of several sockets or nodes"""
+    return min(statuses, key=_RANK.__getitem__, default=OFFLINE)
+
+
+class TimingWheel:
+    """Deadlines rounded up to `resolution` seconds, kept in a ring of buckets
+
+    Re-arming a key moves it between two buckets and advancing only looks at
+    the buckets whose time has come.
+    """
+
+    def __init__(self, horizon, resolution=1.0):
+        self.resolution = resolution
+        self.horizon = horizon
+        self._buckets = [set() for _ in range(math.ceil(horizon / resolution) + 2)]
+        self._deadline = {}  # key -> tick it fires at
+        self._tick = self._now_tick()
+
+    def _now_tick(self, now=None):
+        return int((time.monotonic() if now is None else now) / self.resolution)
+
+    def schedule(self, key, delay=None, now=None):
+        """(Re)arm key to fire after delay seconds (default and at most the horizon)"""
+        delay = self.horizon if delay is None else min(delay, self.horizon)
+        tick = self._now_tick(now) + max(1, math.ceil(delay / self.resolution))
+        self.cancel(key)
+        self._deadline[key] = tick
+        self._buckets[tick % len(self._buckets)].add(key)
+
+    def cancel(self, key):
+        tick = self._deadline.pop(key, None)
+        if tick is not None:
+            self._buckets[tick % len(self._buckets)].discard(key)
+
+    def advance(self, now=None):
+        """Remove and return the keys whose deadline has passed"""
+        target = self._now_tick(now)
+        fired = []
+        # after a stall longer than one turn, every bucket is visited once
+        for tick in range(max(self._tick + 1, target - len(self._buckets) + 1), target + 1):
+            bucket = self._buckets[tick % len(self._buckets)]
+            for key in [key for key in bucket if self._deadline[key] <= target]:
+                bucket.discard(key)
+                del self._deadline[key]
+                fired.append(key)
+        self._tick = max(self._tick, target)
+        return fired
+
+    def __len__(self):
+        return len(self._deadline)
+
+
+class PresenceTracker:
+    """Online status per user, and who wants to hear about it"""
+
+    def __init__(self, ttl=60.0, resolution=1.0):
+        self.ttl = ttl
+        self._wheel = TimingWheel(ttl, resolution)
+        self._sockets = {}    # sid -> (user_id, status), sockets on this node
+        self._users = {}      # user_id -> {sid: status}
+        self._remote = {}     # user_id -> {node: status} from other nodes
+        self._nodes = {}      # node -> (version, {user_id: status})
+        self._watchers = {}   # user_id -> {sid}
+        self._watching = {}   # sid -> {user_id}
+        self._reported = {}   # user_id -> status last sent to watchers (absent = offline)
+        self._announced = {}  # user_id -> local status last sent to other nodes
+        self.version = 0      # bumped whenever _announced changes
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def connect(self, sid, user_id, status='online'):
+        """Start tracking a socket (or refresh it)"""
+        status = status if status in _RANK else 'online'
+        with self._lock:
+            previous = self._sockets.get(sid)
+            if previous is not None and previous[0] != user_id:
+                self._drop(sid)
+            self._set(sid, user_id, status)
+
+    def heartbeat(self, sid, status=None):
+        """Keep a socket alive, optionally changing its status; False if unknown"""
+        with self._lock:
+            entry = self._sockets.get(sid)
+            if entry is None:
+                return False
+            user_id, current = entry
+            self._set(sid, user_id, status if status in _RANK else current)
+            return True
+
+    def disconnect(self, sid):
+        """Forget a socket and everything it subscribed to"""
+        with self._lock:
+            self._drop(sid)
+            self._unwatch(sid, None)
+
+    def expire(self, now=None):
+        """Disconnect sockets that missed their heartbeats; returns their sids"""
+        with self._lock:
+            expired = self._wheel.advance(now)
+            for sid in expired:
+                self._drop(sid, cancel=False)
+        return expired
+
+    def _set(self, sid, user_id, status):
+        self._sockets[sid] = (user_id, status)
+        self._users.setdefault(user_id, {})[sid] = status
+        self._wheel.schedule(sid)
+        self._dirty.add(user_id)
+
+    def _drop(self, sid, cancel=True):
+        entry = self._sockets.pop(sid, None)
+        if entry is None:
+            return
+        if cancel:
+            self._wheel.cancel(sid)
+        user_id = entry[0]
+        sockets = self._users.get(user_id)
+        if sockets is not None:
+            sockets.pop(sid, None)
+            if not sockets:
+                del self._users[user_id]
+        self._dirty.add(user_id)
+
+    def watch(self, sid, user_ids):
+        """Subscribe a socket to users' status changes; returns their current status"""
+        with self._lock:
+            watching = self._watching.setdefault(sid, set())
+            for user_id in user_ids:
+                watching.add(user_id)
+                self._watchers.setdefault(user_id, set()).add(sid)
+            return {user_id: self._status(user_id) for user_id in user_ids}
+
+    def unwatch(self, sid, user_ids=None):
+        """Unsubscribe from some users, or from everyone"""
+        with self._lock:
+            self._unwatch(sid, user_ids)
+
+    def _unwatch(self, sid, user_ids):
+        watching = self._watching.get(sid)
+        if not watching:
+            return
+        for user_id in list(watching if user_ids is None else user_ids):
+            watching.discard(user_id)
+            watchers = self._watchers.get(user_id)
+            if watchers is not None:
+                watchers.discard(sid)
+                if not watchers:
+                    del self._watchers[user_id]
+        if not watching:
+            del self._watching[sid]
+
+    def watch_count(self, sid):
+        return len(self._watching.get(sid, ()))
+
+    def merge_remote(self, node, version, changes):
+        """Apply another node's changes, {user_id: status or 'offline'}, unless already seen"""
+        with self._lock:
+            known_version, statuses = self._nodes.get(node, (0, {}))
+            if version <= known_version:
+                return
+            statuses = dict(statuses)
+            for user_id, status in changes.items():
+                if status in _RANK:
+                    statuses[user_id] = status
+                else:
+                    statuses.pop(user_id, None)
+            self._replace_node(node, version, statuses)
+
+    def sync_remote(self, nodes):
+        """Reconcile with the nodes' periodic announcements: {node: (version, {user_id: status})}
+
+        Nodes that are no longer listed are dropped, and a node's full state
+        replaces what we have unless a newer change already arrived.
+        """
+        with self._lock:
+            for node in self._nodes.keys() - nodes.keys():
+                self._replace_node(node, 0, None)
+            for node, (version, statuses) in nodes.items():
+                if version >= self._nodes.get(node, (0, {}))[0]:
+                    self._replace_node(node, version, statuses or {})
+
+    def _replace_node(self, node, version, statuses):
+        _, previous = self._nodes.pop(node, (0, {}))
+        if statuses is not None:
+            self._nodes[node] = (version, statuses)
+        statuses = statuses or {}
+        for user_id in previous.keys() | statuses.keys():
+            status = statuses.get(user_id)
+            if status == previous.get(user_id):
+                continue
+            nodes = self._remote.setdefault(user_id, {})
+            if status in _RANK:
+                nodes[node] = status
+            else:
+                nodes.pop(node, None)
+            if not nodes:
+                del self._remote[user_id]
+            self._dirty.add(user_id)
+
+    def _local_status(self, user_id):
+        return strongest(self._users.get(user_id, {}).values())
+
+    def _status(self, user_id):
+        return strongest([*self._users.get(user_id, {}).values(), *self._remote.get(user_id, {}).values()])
+
+    def status(self, user_id):
+        with self._lock:
+            return self._status(user_id)
+
+    def statuses(self, user_ids):
+        with self._lock:
+            return {user_id: self._status(user_id) for user_id in user_ids}
+
+    def local_statuses(self):
+        """(version, {user_id: status}) for this node as last flushed, for announcements"""
+        with self._lock:
+            return self.version, dict(self._announced)
+
+    def flush(self):
+        """Changes since the last flush as (updates, local_changes)
+
+        updates maps each subscribed sid to {user_id: status} for the users it
+        watches whose combined status changed; local_changes lists users whose
+        status on this node changed, for the other nodes (tagged with the new
+        self.version).
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            updates = {}
+            local_changes = {}
+            for user_id in dirty:
+                status = self._status(user_id)
+                if status != self._reported.get(user_id, OFFLINE):
+                    if status == OFFLINE:
+                        del self._reported[user_id]
+                    else:
+                        self._reported[user_id] = status
+                    for sid in self._watchers.get(user_id, ()):
+                        updates.setdefault(sid, {})[user_id] = status
+
+                local = self._local_status(user_id)
+                if local != self._announced.get(user_id, OFFLINE):
+                    if local == OFFLINE:
+                        del self._announced[user_id]
+                    else:
+                        self._announced[user_id] = local
+                    local_changes[user_id] = local
+            if local_changes:
+                self.version += 1
+        return updates, local_changes
+
+    def stats(self):
+        return {
+            'sockets': len(self._sockets),
+            'users': len(self._users),
+            'remote_users': len(self._remote),
+            'watchers': len(self._watching)
+        }
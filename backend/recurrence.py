@@ -0,0 +1,110 @@
+"""
+Expansion of recurring calendar events into concrete occurrences
+
+Events may carry a `recurrence` rule in a small RRULE subset, e.g.
+"FREQ=WEEKLY;INTERVAL=2;COUNT=10" or "FREQ=DAILY;UNTIL=2025-01-31T00:00:00Z".
+Only occurrences overlapping the requested window are generated.
+"""
+
+import calendar
+from datetime import datetime, timedelta, timezone
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+
+# Hard cap so an open-ended rule over a huge window cannot blow up a response
+MAX_OCCURRENCES = 1000
+
+
+def parse_datetime(value):
+    """Parse an ISO timestamp from Supabase or a query string (always tz-aware)"""
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def parse_rule(rule):
+    """Parse "FREQ=WEEKLY;INTERVAL=1;COUNT=5" into a dict; raises ValueError"""
+    parts = dict(part.split('=', 1) for part in rule.upper().split(';') if part)
+    freq = parts.get('FREQ')
+    if freq not in FREQUENCIES:
+        raise ValueError(f"Unsupported recurrence frequency: {freq}")
+
+    interval = int(parts.get('INTERVAL', 1))
+    if interval < 1:
+        raise ValueError("Recurrence interval must be positive")
+
+    return {
+        'freq': freq,
+        'interval': interval,
+        'count': int(parts['COUNT']) if 'COUNT' in parts else None,
+        'until': parse_datetime(parts['UNTIL']) if 'UNTIL' in parts else None,
+    }
+
+
+def _add_months(dt, months):
+    month = dt.month - 1 + months
+    year = dt.year + month // 12
+    month = month % 12 + 1
+    day = min(dt.day, calendar.monthrange(year, month)[1])
+    return dt.replace(year=year, month=month, day=day)
+
+
+def _occurrence_start(start, rule, index):
+    if rule['freq'] == 'MONTHLY':
+        return _add_months(start, index * rule['interval'])
+    step = timedelta(days=rule['interval'] * (7 if rule['freq'] == 'WEEKLY' else 1))
+    return start + step * index
+
+
+def _first_index(start, duration, rule, window_start):
+    """Index of the first occurrence that could end after window_start"""
+    if window_start is None or window_start <= start + duration:
+        return 0
+    if rule['freq'] == 'MONTHLY':
+        months = (window_start.year - start.year) * 12 + window_start.month - start.month
+        return max(months // rule['interval'] - 1, 0)
+    step = timedelta(days=rule['interval'] * (7 if rule['freq'] == 'WEEKLY' else 1))
+    return max(int((window_start - start - duration) / step), 0)
+
+
+def expand_event(event, window_start=None, window_end=None):
+    """Return the occurrences of event that overlap [window_start, window_end)
+
+    Recurring events are only expanded when the window has an end; otherwise
+    the series is returned as-is for the client to expand.
+    """
+    start = parse_datetime(event['start_time'])
+    end = parse_datetime(event['end_time'])
+    rule = event.get('recurrence')
+
+    if not rule or window_end is None:
+        overlaps = (window_end is None or start < window_end) and (window_start is None or end > window_start or rule)
+        return [event] if overlaps else []
+
+    rule = parse_rule(rule)
+    duration = end - start
+    occurrences = []
+
+    index = _first_index(start, duration, rule, window_start)
+    while len(occurrences) < MAX_OCCURRENCES:
+        if rule['count'] is not None and index >= rule['count']:
+            break
+        occ_start = _occurrence_start(start, rule, index)
+        if rule['until'] is not None and occ_start > rule['until']:
+            break
+        if window_end is not None and occ_start >= window_end:
+            break
+        if window_start is None or occ_start + duration > window_start:
+            occurrences.append({
+                **event,
+                'start_time': occ_start.isoformat(),
+                'end_time': (occ_start + duration).isoformat(),
+                'occurrence_index': index,
+            })
+        index += 1
+
+    return occurrences
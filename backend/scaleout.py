@@ -0,0 +1,308 @@
+"""
+Running more than one backend process behind a load balancer
+
+Socket.IO rooms only exist inside the process a client is connected to, so
+emits are relayed between processes through a message queue. Set
+SOCKETIO_MESSAGE_QUEUE to one of:
+
+    redis://host:6379/0     Redis pub/sub (needs the `redis` package)
+    local://127.0.0.1:6390  a small TCP relay for several processes on one box;
+                            the first process to start hosts it, and another one
+                            takes over if that process exits
+
+The same channel carries office presence: every node periodically announces
+the players connected to it, so `current_players` can include everyone and a
+node that dies drops out of the roster after PRESENCE_TTL. Other per-process
+state (such as cached messages) can follow along with publish()/subscribe().
+"""
+
+import base64
+import json
+import logging
+import socket
+import struct
+import threading
+import time
+from urllib.parse import urlparse
+
+import socketio
+
+log = logging.getLogger(__name__)
+
+# Binary player indexes (office_wire.py) are 16-bit; each node gets its own block
+NODE_SLOTS = 64
+SLOT_SIZE = 0x10000 // NODE_SLOTS
+
+FRAME = struct.Struct('>I')
+
+
+class BusJSON:
+    """json for bus messages that also round-trips bytes payloads"""
+
+    @staticmethod
+    def _default(value):
+        if isinstance(value, (bytes, bytearray)):
+            return {'__bytes__': base64.b64encode(bytes(value)).decode('ascii')}
+        raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+    @staticmethod
+    def _hook(value):
+        if len(value) == 1 and '__bytes__' in value:
+            return base64.b64decode(value['__bytes__'])
+        return value
+
+    @classmethod
+    def dumps(cls, data, **kwargs):
+        return json.dumps(data, default=cls._default, separators=(',', ':'))
+
+    @classmethod
+    def loads(cls, data, **kwargs):
+        return json.loads(data, object_hook=cls._hook)
+
+
+class Presence:
+    """Office players and online users on the other nodes, as last announced by each of them"""
+
+    def __init__(self, ttl=15.0):
+        self.ttl = ttl
+        self._nodes = {}
+        self._lock = threading.Lock()
+
+    def merge(self, host_id, state):
+        """Apply a node's announcement; None means the node is shutting down"""
+        with self._lock:
+            if state is None:
+                self._nodes.pop(host_id, None)
+            else:
+                self._nodes[host_id] = dict(state, seen=time.monotonic())
+
+    def expire(self):
+        """Forget nodes that stopped announcing; returns the players they had"""
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            dead = [host for host, node in self._nodes.items() if node['seen'] < cutoff]
+            return [player for host in dead for player in self._nodes.pop(host)['players']]
+
+    def players(self):
+        with self._lock:
+            return [player for node in self._nodes.values() for player in node['players']]
+
+    def slots(self):
+        with self._lock:
+            return {node.get('slot') for node in self._nodes.values()}
+
+    def nodes(self):
+        """{host_id: last announced state} of the live nodes"""
+        with self._lock:
+            return dict(self._nodes)
+
+    def __len__(self):
+        return len(self._nodes)
+
+
+class PresenceBus:
+    """Mixin for pub/sub managers: binary-safe payloads plus presence messages"""
+
+    def __init__(self, *args, presence_ttl=15.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.json = BusJSON
+        self.presence = Presence(ttl=presence_ttl)
+        self._handlers = {}
+
+    def initialize(self):
+        super().initialize()
+        # the base class switches to the server's json module here
+        self.json = BusJSON
+
+    def announce(self, state):
+        """Publish this node's presence (None when leaving the cluster)"""
+        self._publish({'method': 'presence', 'host_id': self.host_id, 'state': state})
+
+    def publish(self, kind, payload):
+        """Send payload to the `kind` handlers of every other node"""
+        self._publish({'method': 'bus', 'kind': kind, 'host_id': self.host_id, 'payload': payload})
+
+    def subscribe(self, kind, handler):
+        self._handlers[kind] = handler
+
+    def emit_local(self, event, data, room=None, namespace='/'):
+        """Emit to clients of this node only, without going through the queue"""
+        socketio.Manager.emit(self, event, data, namespace, room=room)
+
+    def _listen(self):
+        for message in super()._listen():
+            data = message
+            if not isinstance(message, dict):
+                try:
+                    data = self.json.loads(message)
+                except ValueError:
+                    continue
+            if isinstance(data, dict) and data.get('method') == 'presence':
+                if data.get('host_id') != self.host_id:
+                    self.presence.merge(data['host_id'], data.get('state'))
+                continue
+            if isinstance(data, dict) and data.get('method') == 'bus':
+                handler = self._handlers.get(data.get('kind'))
+                if handler and data.get('host_id') != self.host_id:
+                    try:
+                        handler(data.get('payload'))
+                    except Exception:
+                        log.exception("Bus handler %s failed", data.get('kind'))
+                continue
+            yield data
+
+
+class RedisBusManager(PresenceBus, socketio.RedisManager):
+    """Redis pub/sub; works across machines"""
+    name = 'redis-presence'
+
+
+class LocalSocketQueue(socketio.PubSubManager):
+    """Length-prefixed frames over a loopback TCP relay; for one box"""
+    name = 'localsocket'
+
+    def __init__(self, url='local://127.0.0.1:6390', channel='socketio', write_only=False,
+                 logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or 6390)
+        self._sock = None
+        self._lock = threading.Lock()
+        self._hub = None
+
+    def _connect(self):
+        with self._lock:
+            if self._sock is not None:
+                return self._sock
+            for _ in range(2):
+                try:
+                    self._sock = socket.create_connection(self.address, timeout=2)
+                    self._sock.settimeout(None)
+                    return self._sock
+                except OSError:
+                    # nobody is relaying yet (or the host process died): take over
+                    self._start_hub()
+            raise ConnectionError(f"Cannot reach message relay at {self.address[0]}:{self.address[1]}")
+
+    def _start_hub(self):
+        try:
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind(self.address)
+            server.listen()
+        except OSError:
+            return  # another process won the race
+        self._hub = _Relay(server)
+        threading.Thread(target=self._hub.serve, daemon=True).start()
+        log.info("Message relay listening on %s:%s", *self.address[:2])
+
+    def _drop(self, sock):
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    def _publish(self, data):
+        frame = self.json.dumps(data).encode('utf-8')
+        for attempt in range(2):
+            sock = self._connect()
+            try:
+                with self._lock:
+                    sock.sendall(FRAME.pack(len(frame)) + frame)
+                return
+            except OSError:
+                self._drop(sock)
+                if attempt:
+                    raise
+
+    def _listen(self):
+        while True:
+            try:
+                sock = self._connect()
+            except ConnectionError:
+                time.sleep(1)
+                continue
+            try:
+                while True:
+                    yield _read_frame(sock)
+            except (OSError, ConnectionError):
+                self._drop(sock)
+
+
+class LocalSocketManager(PresenceBus, LocalSocketQueue):
+    """Loopback relay plus presence; for several workers on one machine"""
+
+
+def _read_exact(sock, size):
+    buf = b''
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("relay connection closed")
+        buf += chunk
+    return buf
+
+
+def _read_frame(sock):
+    (size,) = FRAME.unpack(_read_exact(sock, FRAME.size))
+    return _read_exact(sock, size)
+
+
+class _Relay:
+    """Forwards every frame it receives to every connected process"""
+
+    def __init__(self, server):
+        self.server = server
+        self.clients = set()
+        self._lock = threading.Lock()
+
+    def serve(self):
+        while True:
+            conn, _ = self.server.accept()
+            with self._lock:
+                self.clients.add(conn)
+            threading.Thread(target=self._pump, args=(conn,), daemon=True).start()
+
+    def _pump(self, conn):
+        try:
+            while True:
+                payload = _read_frame(conn)
+                frame = FRAME.pack(len(payload)) + payload
+                with self._lock:
+                    clients = list(self.clients)
+                for client in clients:
+                    try:
+                        client.sendall(frame)
+                    except OSError:
+                        pass
+        except (OSError, ConnectionError):
+            pass
+        finally:
+            with self._lock:
+                self.clients.discard(conn)
+            conn.close()
+
+
+def make_client_manager(url, presence_ttl=15.0):
+    """Client manager for SOCKETIO_MESSAGE_QUEUE, or None for a single process"""
+    if not url:
+        return None
+    scheme = urlparse(url).scheme
+    if scheme in ('redis', 'rediss', 'unix'):
+        return RedisBusManager(url, presence_ttl=presence_ttl)
+    if scheme == 'local':
+        return LocalSocketManager(url, presence_ttl=presence_ttl)
+    raise ValueError(f"Unsupported SOCKETIO_MESSAGE_QUEUE scheme: {scheme}")
+
+
+def pick_slot(taken, preferred=None):
+    """Index block for this node's office players"""
+    if preferred is not None:
+        return preferred % NODE_SLOTS
+    for slot in range(NODE_SLOTS):
+        if slot not in taken:
+            return slot
+    raise RuntimeError("No free office index slots; raise NODE_SLOTS or run fewer nodes")
@@ -0,0 +1,27 @@
+"""
+Production entry point
+
+    ASYNC_MODE=gevent PORT=5000 python serve.py
+
+See serving.py for the available modes. Patching happens before app is
+imported so every socket, lock and sleep in the process is cooperative.
+"""
+
+import os
+
+from serving import ASYNC_MODE, is_evented, patch
+
+# Everything happens under __main__: the PDF extraction pool spawns workers
+# that re-import this module, and they must not patch or load the app
+if __name__ == "__main__":
+    patch()
+
+    from app import app, socketio
+
+    port = int(os.getenv('PORT', '5000'))
+    print(f"🚀 Office.io backend on port {port} ({ASYNC_MODE})")
+    if is_evented():
+        socketio.run(app, host='0.0.0.0', port=port)
+    else:
+        print("WARNING: ASYNC_MODE=threading uses the Werkzeug development server")
+        socketio.run(app, host='0.0.0.0', port=port, allow_unsafe_werkzeug=True)
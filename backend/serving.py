@@ -0,0 +1,46 @@
+"""
+How the backend is served
+
+    ASYNC_MODE=threading  Werkzeug development server, one OS thread per connection (default)
+    ASYNC_MODE=gevent     gevent WSGI server; every socket is a greenlet (Procfile, render.yaml)
+
+gevent needs the standard library patched before anything else is
+imported, so production starts through `python serve.py` rather than app.py.
+Once patched, Supabase and OpenAI calls wait on cooperative sockets instead of
+holding a thread. CPU-bound work in C extensions (PyMuPDF) goes through
+run_blocking, which hands it to a bounded pool of real OS threads so it cannot
+stall the event loop.
+"""
+
+import os
+
+ASYNC_MODE = os.getenv('ASYNC_MODE', 'threading')
+BLOCKING_POOL_SIZE = int(os.getenv('BLOCKING_POOL_SIZE', '4'))
+
+MODES = ('threading', 'gevent')
+
+
+def is_evented():
+    return ASYNC_MODE != 'threading'
+
+
+def patch():
+    """Monkey-patch the standard library for ASYNC_MODE; call before other imports"""
+    if ASYNC_MODE not in MODES:
+        raise ValueError(f"ASYNC_MODE must be one of {', '.join(MODES)}, got {ASYNC_MODE!r}")
+    if ASYNC_MODE == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+        import gevent
+        gevent.get_hub().threadpool.maxsize = BLOCKING_POOL_SIZE
+
+
+def run_blocking(fn, *args, **kwargs):
+    """Call fn on a native worker thread under gevent, inline otherwise
+
+    fn must not touch locks or sockets shared with the event loop.
+    """
+    if ASYNC_MODE == 'gevent':
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args, kwargs)
+    return fn(*args, **kwargs)
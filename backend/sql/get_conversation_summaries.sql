@@ -0,0 +1,84 @@
+-- Conversation list with last message, last activity and unread count per
+-- user, in one round trip. Used by GET /conversations; the backend falls back
+-- to per-conversation lookups when this function has not been installed.
+--
+-- The last message is kept on the conversation row by a trigger, so the list
+-- never scans message history; unread counts use the (conversation_id,
+-- created_at) index from each participant's last_read_at.
+--
+-- Run in the Supabase SQL editor.
+
+alter table conversations add column if not exists last_message_id uuid;
+alter table conversations add column if not exists last_message_at timestamptz;
+alter table conversation_participants add column if not exists last_read_at timestamptz;
+-- Existing history counts as read when this is installed, and new participants
+-- start from the moment they join, rather than the whole history being unread
+update conversation_participants set last_read_at = now() where last_read_at is null;
+alter table conversation_participants alter column last_read_at set default now();
+
+create index if not exists messages_conversation_created_idx on messages (conversation_id, created_at);
+create index if not exists conversation_participants_user_idx on conversation_participants (user_id, conversation_id);
+
+create or replace function touch_conversation_last_message()
+returns trigger
+language plpgsql
+as $$
+begin
+    update conversations
+    set last_message_id = new.id,
+        last_message_at = new.created_at
+    where id = new.conversation_id
+      and (last_message_at is null or last_message_at <= new.created_at);
+    return new;
+end;
+$$;
+
+drop trigger if exists messages_touch_conversation on messages;
+create trigger messages_touch_conversation
+    after insert on messages
+    for each row execute function touch_conversation_last_message();
+
+-- Backfill for conversations that already have messages
+update conversations c
+set last_message_id = m.id,
+    last_message_at = m.created_at
+from (
+    select distinct on (conversation_id) conversation_id, id, created_at
+    from messages
+    order by conversation_id, created_at desc, id desc
+) m
+where m.conversation_id = c.id and c.last_message_id is null;
+
+create or replace function get_conversation_summaries(p_user_id uuid)
+returns setof jsonb
+language sql
+stable
+as $$
+    select to_jsonb(c)
+        || jsonb_build_object(
+            'last_activity_at', coalesce(c.last_message_at, c.created_at),
+            'last_message', (
+                select jsonb_build_object(
+                    'id', m.id,
+                    'content', m.content,
+                    'sender_id', m.sender_id,
+                    'created_at', m.created_at,
+                    'users', jsonb_build_object('id', u.id, 'username', u.username, 'full_name', u.full_name, 'avatar_url', u.avatar_url)
+                )
+                from messages m
+                left join users u on u.id = m.sender_id
+                where m.id = c.last_message_id
+            ),
+            'unread_count', (
+                select count(*)
+                from messages m
+                where m.conversation_id = c.id
+                  and m.sender_id <> p_user_id
+                  and (p.last_read_at is null or m.created_at > p.last_read_at)
+            )
+        )
+    from conversation_participants p
+    join conversations c on c.id = p.conversation_id
+    where p.user_id = p_user_id
+    order by coalesce(c.last_message_at, c.created_at) desc nulls last;
+$$;
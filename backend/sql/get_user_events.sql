@@ -0,0 +1,34 @@
+-- Events visible to a user (created or attending) overlapping a time window,
+-- in one round trip. Used by GET /events; the backend falls back to two
+-- filtered queries when this function has not been installed.
+--
+-- Run in the Supabase SQL editor.
+
+alter table events add column if not exists recurrence text;
+
+create index if not exists events_created_by_start_idx on events (created_by, start_time);
+create index if not exists event_attendees_user_idx on event_attendees (user_id, event_id);
+
+create or replace function get_user_events(
+    p_user_id uuid,
+    p_from timestamptz default null,
+    p_to timestamptz default null
+)
+returns setof events
+language sql
+stable
+as $$
+    select e.*
+    from events e
+    where (
+        e.created_by = p_user_id
+        or exists (
+            select 1 from event_attendees a
+            where a.event_id = e.id and a.user_id = p_user_id
+        )
+    )
+    and (p_to is null or e.start_time < p_to)
+    -- recurring series can start before the window and still recur inside it
+    and (p_from is null or e.end_time > p_from or e.recurrence is not null)
+    order by e.start_time;
+$$;
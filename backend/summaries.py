@@ -0,0 +1,85 @@
+"""
+In-process conversation list summaries
+
+Each user's list (conversation rows with `last_message`, `last_activity_at`
+and `unread_count`) is cached after it is read from the database and then
+updated in place as messages are sent, so listing conversations normally
+costs no query at all. Sends that happen while a list is being read are
+replayed onto it when it is stored.
+"""
+
+import threading
+import time
+from collections import deque
+
+from cache import TTLCache
+
+
+def _activity(row):
+    return row.get('last_activity_at') or row.get('created_at') or ''
+
+
+class ConversationSummaries:
+    """Per-user conversation lists kept current on send and read"""
+
+    def __init__(self, maxsize=10000, ttl=300.0, replay=1000):
+        self._lists = TTLCache(maxsize=maxsize, ttl=ttl)  # user_id -> {conversation_id: row}
+        self._members = {}                                  # conversation_id -> {user_id} with a cached list
+        self._recent = deque(maxlen=replay)                 # (monotonic time, conversation_id, message)
+        self._lock = threading.Lock()
+
+    def started(self):
+        """Timestamp to pass to load(), taken before reading from the database"""
+        return time.monotonic()
+
+    def get(self, user_id):
+        """Sorted list, most recent activity first, or None"""
+        rows = self._lists.get(user_id)
+        if rows is None:
+            return None
+        with self._lock:
+            return sorted((dict(row) for row in rows.values()), key=_activity, reverse=True)
+
+    def load(self, user_id, rows, started):
+        """Cache a freshly read list and apply sends that raced with the read"""
+        with self._lock:
+            by_id = {row['id']: dict(row) for row in rows}
+            for conversation_id in by_id:
+                self._members.setdefault(conversation_id, set()).add(user_id)
+            for at, conversation_id, message in self._recent:
+                if at >= started and conversation_id in by_id:
+                    self._apply(user_id, by_id[conversation_id], message)
+        self._lists.set(user_id, by_id)
+
+    def record(self, conversation_id, message):
+        """A message was sent: bump activity and other participants' unread counts"""
+        with self._lock:
+            self._recent.append((time.monotonic(), conversation_id, message))
+            for user_id in list(self._members.get(conversation_id, ())):
+                rows = self._lists.get(user_id)
+                if rows is None or conversation_id not in rows:
+                    self._members[conversation_id].discard(user_id)
+                    continue
+                self._apply(user_id, rows[conversation_id], message)
+
+    def mark_read(self, conversation_id, user_id):
+        rows = self._lists.get(user_id)
+        if rows is not None and conversation_id in rows:
+            with self._lock:
+                rows[conversation_id]['unread_count'] = 0
+
+    def forget(self, user_id):
+        """Drop a user's list, e.g. after they join a new conversation"""
+        self._lists.pop(user_id)
+
+    @staticmethod
+    def _apply(user_id, row, message):
+        if message['created_at'] <= _activity(row):
+            return  # already reflected
+        row['last_message'] = {key: message.get(key) for key in ('id', 'content', 'sender_id', 'created_at', 'users')}
+        row['last_activity_at'] = message['created_at']
+        if message.get('sender_id') != user_id:
+            row['unread_count'] = (row.get('unread_count') or 0) + 1
+
+    def stats(self):
+        return self._lists.stats()
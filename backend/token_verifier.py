@@ -0,0 +1,181 @@
+"""
+Local verification of Supabase access tokens
+
+Tokens are checked against the project's JWT secret (HS256) or its JWKS
+endpoint (RS256/ES256) without a network round trip, and recently verified
+tokens are kept in a bounded TTL/LRU cache. Supabase is only asked directly
+when no local key source is configured or when a token is due for a
+revocation check; tokens revoked here (logout) are refused until they expire.
+"""
+
+import hashlib
+import threading
+import time
+
+import jwt
+
+from cache import TTLCache
+
+
+class AuthError(Exception):
+    """Raised when a token cannot be verified"""
+
+
+class TokenVerifier:
+    """Verify bearer tokens locally and cache the result"""
+
+    def __init__(self, remote_lookup, secret=None, jwks_url=None, audience='authenticated',
+                 cache_size=10000, cache_ttl=300.0, revalidate_after=300.0):
+        # remote_lookup(token) -> (user_id, email); raises on invalid tokens
+        self.remote_lookup = remote_lookup
+        self.secret = secret
+        self.audience = audience
+        self.revalidate_after = revalidate_after
+        self.jwks_client = jwt.PyJWKClient(jwks_url, cache_keys=True) if jwks_url else None
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        # token key -> when Supabase last vouched for it (or it was first seen);
+        # kept apart from _cache so a revocation check survives cache expiry
+        self._checked = TTLCache(maxsize=cache_size, ttl=max(cache_ttl, revalidate_after))
+        # token key -> True for logged-out tokens, each kept until its exp
+        self._revoked = TTLCache(maxsize=cache_size, ttl=max(cache_ttl, revalidate_after))
+        self._lock = threading.Lock()
+        self.local_verifications = 0
+        self.remote_verifications = 0
+        self.revalidations = 0
+        self.failures = 0
+
+    @property
+    def has_local_key(self):
+        return bool(self.secret or self.jwks_client)
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def verify(self, token):
+        """Return {'user_id', 'email'} for a valid token or raise AuthError"""
+        key = self._key(token)
+        if key in self._revoked:
+            self._count('failures')
+            raise AuthError("Token has been revoked")
+        entry = self._cache.get(key)
+
+        if entry is not None:
+            if entry['exp'] and entry['exp'] <= time.time():
+                self._cache.pop(key)
+                self._count('failures')
+                raise AuthError("Token has expired")
+        else:
+            entry = self._verify_local(token) if self.has_local_key else None
+            if entry is None:
+                entry = self._verify_remote(token)
+                self._checked.set(key, time.monotonic(), ttl=self._ttl_until(entry['exp'], self._checked.ttl))
+
+            ttl = self._ttl_until(entry['exp'], self._cache.ttl)
+            if ttl > 0:
+                self._cache.set(key, entry, ttl=ttl)
+
+        checked_at = self._checked.get(key)
+        if checked_at is None:
+            self._checked.set(key, time.monotonic(), ttl=self._ttl_until(entry['exp'], self._checked.ttl))
+        elif self.revalidate_after and time.monotonic() - checked_at > self.revalidate_after:
+            self._revalidate(key, token, entry)
+        return entry
+
+    def invalidate(self, token):
+        """Revoke a token until it expires, e.g. on logout; returns (key, exp) for revoke()"""
+        key = self._key(token)
+        entry = self._cache.get(key)
+        exp = entry['exp'] if entry else self._unverified_exp(token)
+        self.revoke(key, exp)
+        return key, exp
+
+    def revoke(self, key, exp=None):
+        """Refuse the token with this key until exp (a token revoked on another node)"""
+        self._cache.pop(key)
+        self._checked.pop(key)
+        ttl = self._ttl_until(exp, self._revoked.ttl)
+        if ttl > 0:
+            self._revoked.set(key, True, ttl=ttl)
+
+    def stats(self):
+        stats = self._cache.stats()
+        stats.update({
+            "mode": "local" if self.has_local_key else "remote",
+            "local_verifications": self.local_verifications,
+            "remote_verifications": self.remote_verifications,
+            "revalidations": self.revalidations,
+            "revoked": len(self._revoked),
+            "failures": self.failures,
+        })
+        return stats
+
+    @staticmethod
+    def _ttl_until(exp, default):
+        return exp - time.time() if exp else default
+
+    @staticmethod
+    def _unverified_exp(token):
+        try:
+            return jwt.decode(token, options={"verify_signature": False}).get('exp')
+        except jwt.InvalidTokenError:
+            return None
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _verify_local(self, token):
+        """Check signature and expiry; None means fall back to Supabase"""
+        try:
+            header = jwt.get_unverified_header(token)
+            if header.get('alg') == 'HS256':
+                if not self.secret:
+                    return None
+                signing_key, algorithms = self.secret, ['HS256']
+            else:
+                if not self.jwks_client:
+                    return None
+                signing_key = self.jwks_client.get_signing_key_from_jwt(token).key
+                algorithms = ['RS256', 'ES256']
+        except jwt.PyJWKClientError:
+            # JWKS endpoint unreachable or key not published yet
+            return None
+        except jwt.InvalidTokenError as e:
+            self._count('failures')
+            raise AuthError(str(e))
+
+        try:
+            claims = jwt.decode(token, signing_key, algorithms=algorithms, audience=self.audience)
+        except jwt.InvalidTokenError as e:
+            self._count('failures')
+            raise AuthError(str(e))
+
+        self._count('local_verifications')
+        return {
+            'user_id': claims['sub'],
+            'email': claims.get('email'),
+            'exp': claims.get('exp'),
+        }
+
+    def _verify_remote(self, token):
+        try:
+            user_id, email = self.remote_lookup(token)
+        except Exception as e:
+            self._count('failures')
+            raise AuthError(str(e))
+
+        self._count('remote_verifications')
+        return {'user_id': user_id, 'email': email, 'exp': self._unverified_exp(token)}
+
+    def _revalidate(self, key, token, entry):
+        """Ask Supabase whether a cached token has been revoked"""
+        self._count('revalidations')
+        try:
+            self.remote_lookup(token)
+        except Exception as e:
+            self._cache.pop(key)
+            self._checked.pop(key)
+            self._count('failures')
+            raise AuthError(str(e))
+        self._checked.set(key, time.monotonic(), ttl=self._ttl_until(entry['exp'], self._checked.ttl))
@@ -0,0 +1,84 @@
+"""
+Typing indicators, throttled and coalesced
+
+Clients may send `typing` on every keystroke. The server only keeps a
+start/stop state per (conversation, user): repeated starts just refresh the
+idle timer, a user who goes quiet for `idle_timeout` is stopped automatically,
+and each room receives at most one update per flush interval listing who
+started and who stopped since the last one.
+"""
+
+import threading
+import time
+
+
+class TypingTracker:
+    """Who is typing in which conversation"""
+
+    def __init__(self, idle_timeout=5.0):
+        self.idle_timeout = idle_timeout
+        self._typing = {}   # (conversation_id, user_id) -> {'username', 'sid', 'last'}
+        self._started = {}  # conversation_id -> {user_id: username} since last flush
+        self._stopped = {}  # conversation_id -> {user_id} since last flush
+        self._lock = threading.Lock()
+
+    def start(self, conversation_id, user_id, username=None, sid=None):
+        """Mark a user as typing; only the first start in a run is broadcast"""
+        key = (conversation_id, user_id)
+        with self._lock:
+            entry = self._typing.get(key)
+            if entry is not None:
+                entry['last'] = time.monotonic()
+                entry['sid'] = sid
+                return
+            self._typing[key] = {'username': username, 'sid': sid, 'last': time.monotonic()}
+            stopped = self._stopped.get(conversation_id)
+            if stopped and user_id in stopped:
+                # stopped and started again within one interval: nothing to report
+                stopped.discard(user_id)
+            else:
+                self._started.setdefault(conversation_id, {})[user_id] = username
+
+    def stop(self, conversation_id, user_id):
+        with self._lock:
+            self._stop((conversation_id, user_id))
+
+    def drop_sid(self, sid):
+        """Stop everything a disconnected socket was typing"""
+        with self._lock:
+            for key in [key for key, entry in self._typing.items() if entry['sid'] == sid]:
+                self._stop(key)
+
+    def _stop(self, key):
+        if self._typing.pop(key, None) is None:
+            return
+        conversation_id, user_id = key
+        started = self._started.get(conversation_id)
+        if started and user_id in started:
+            del started[user_id]
+        else:
+            self._stopped.setdefault(conversation_id, set()).add(user_id)
+
+    def flush(self):
+        """Expire idle typers and return {conversation_id: update} for rooms that changed"""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            for key in [key for key, entry in self._typing.items() if entry['last'] < cutoff]:
+                self._stop(key)
+            started, self._started = self._started, {}
+            stopped, self._stopped = self._stopped, {}
+
+        updates = {}
+        for conversation_id in started.keys() | stopped.keys():
+            users = started.get(conversation_id, {})
+            gone = stopped.get(conversation_id, set())
+            if users or gone:
+                updates[conversation_id] = {
+                    'conversation_id': conversation_id,
+                    'started': [{'user_id': user_id, 'username': username} for user_id, username in users.items()],
+                    'stopped': sorted(gone)
+                }
+        return updates
+
+    def __len__(self):
+        return len(self._typing)
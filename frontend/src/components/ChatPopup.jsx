@@ -8,6 +8,9 @@ const ChatPopup = () => {
   const [selectedConversation, setSelectedConversation] = useState(null);
   const [messages, setMessages] = useState([]);
   const [newMessage, setNewMessage] = useState('');
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [hasOlder, setHasOlder] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const { user } = useAuth();
 
   // Fetch conversations
@@ -30,15 +33,38 @@ const ChatPopup = () => {
   const handleConversationSelect = async (conversation) => {
     setSelectedConversation(conversation);
     setIsContactListOpen(false);
+    setConversations((prev) => prev.map((c) => (c.id === conversation.id ? { ...c, unread_count: 0 } : c)));
+    api.markConversationRead(conversation.id).catch((error) => console.error('Error marking conversation read:', error));
 
     try {
-      const data = await api.getMessages(conversation.id);
-      setMessages(data);
+      const page = await api.getMessages(conversation.id);
+      setMessages(page.messages);
+      setOlderCursor(page.prevCursor);
+      setHasOlder(page.hasMore);
     } catch (error) {
       console.error('Error fetching messages:', error);
     }
   };
 
+  // Fetch the page of messages before the oldest one shown
+  const loadOlderMessages = async () => {
+    if (!selectedConversation || !olderCursor || loadingOlder) return;
+    setLoadingOlder(true);
+    try {
+      const page = await api.getMessages(selectedConversation.id, { before: olderCursor });
+      setMessages((prev) => {
+        const shown = new Set(prev.map((m) => m.id));
+        return [...page.messages.filter((msg) => !shown.has(msg.id)), ...prev];
+      });
+      setOlderCursor(page.prevCursor);
+      setHasOlder(page.hasMore);
+    } catch (error) {
+      console.error('Error fetching older messages:', error);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   // Send a new message
   const sendMessage = async () => {
     if (!newMessage.trim() || !user || !selectedConversation) return;
@@ -83,8 +109,11 @@ const ChatPopup = () => {
               <div className="w-8 h-8 bg-brown-tint rounded-full"></div>
               <div>
                 <div className="font-medium text-text-primary">{conv.name}</div>
-                <div className="text-xs text-text-secondary">{conv.lastMessage}</div>
+                <div className="text-xs text-text-secondary">{conv.last_message?.content}</div>
               </div>
+              {conv.unread_count > 0 && (
+                <div className="ml-auto text-xs bg-primary text-white rounded-full px-2">{conv.unread_count}</div>
+              )}
             </div>
           ))}
         </div>
@@ -111,6 +140,17 @@ const ChatPopup = () => {
           </div>
 
           <div className="flex-1 p-4 space-y-3 overflow-y-auto bg-background">
+            {hasOlder && (
+              <div className="text-center">
+                <button
+                  onClick={loadOlderMessages}
+                  disabled={loadingOlder}
+                  className="text-sm text-primary hover:underline disabled:opacity-50"
+                >
+                  {loadingOlder ? 'Loading...' : 'Load older messages'}
+                </button>
+              </div>
+            )}
             {messages.map((msg, index) => (
               <div
                 key={index}
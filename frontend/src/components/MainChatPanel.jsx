@@ -7,6 +7,9 @@ const MainChatPanel = ({ conversationId }) => {
   const [messages, setMessages] = useState([]);
   const [newMessage, setNewMessage] = useState('');
   const [conversation, setConversation] = useState(null);
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [hasOlder, setHasOlder] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const { user } = useAuth();
   const { connected, joinConversation, leaveConversation, onNewMessage, offNewMessage } = useSocket();
 
@@ -31,15 +34,17 @@ const MainChatPanel = ({ conversationId }) => {
     const fetchMessages = async () => {
       if (conversationId && user) {
         try {
-          const data = await api.getMessages(conversationId);
+          const page = await api.getMessages(conversationId);
 
           // Mark messages as belonging to the current user
           setMessages(
-            data.map((msg) => ({
+            page.messages.map((msg) => ({
               ...msg,
               isCurrentUser: msg.sender_id === user.id,
             }))
           );
+          setOlderCursor(page.prevCursor);
+          setHasOlder(page.hasMore);
         } catch (error) {
           console.error('Error fetching messages:', error);
         }
@@ -49,6 +54,28 @@ const MainChatPanel = ({ conversationId }) => {
     fetchMessages();
   }, [conversationId, user]);
 
+  // Fetch the page of messages before the oldest one shown
+  const loadOlderMessages = async () => {
+    if (!olderCursor || loadingOlder) return;
+    setLoadingOlder(true);
+    try {
+      const page = await api.getMessages(conversationId, { before: olderCursor });
+      setMessages((prev) => {
+        const shown = new Set(prev.map((m) => m.id));
+        const older = page.messages
+          .filter((msg) => !shown.has(msg.id))
+          .map((msg) => ({ ...msg, isCurrentUser: msg.sender_id === user?.id }));
+        return [...older, ...prev];
+      });
+      setOlderCursor(page.prevCursor);
+      setHasOlder(page.hasMore);
+    } catch (error) {
+      console.error('Error fetching older messages:', error);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   // WebSocket: Join conversation room and listen for new messages
   useEffect(() => {
     if (conversationId && connected) {
@@ -107,6 +134,17 @@ const MainChatPanel = ({ conversationId }) => {
         </div>
       )}
       <div className="flex-1 overflow-y-auto space-y-3">
+        {hasOlder && (
+          <div className="text-center">
+            <button
+              onClick={loadOlderMessages}
+              disabled={loadingOlder}
+              className="text-sm text-blue-500 hover:underline disabled:opacity-50"
+            >
+              {loadingOlder ? 'Loading...' : 'Load older messages'}
+            </button>
+          </div>
+        )}
         {messages.map((msg, index) => (
           <div
             key={msg.id || index}
@@ -8,6 +8,12 @@ import '../css/Scheduler.css';
 
 const localizer = momentLocalizer(moment);
 
+// Visible month plus the leading/trailing days shown in month view
+const monthWindow = (date) => ({
+  from: moment(date).startOf('month').subtract(1, 'week').toISOString(),
+  to: moment(date).endOf('month').add(1, 'week').toISOString(),
+});
+
 const Scheduler = () => {
   const [dialogOpen, setDialogOpen] = useState(false);
   const [newEvent, setNewEvent] = useState({ title: '', start: new Date(), end: new Date(), person: '', description: '' });
@@ -94,11 +100,13 @@ const Scheduler = () => {
 
   // Initialize events as empty - only show DB events
   const [events, setEvents] = useState([]);
+  const [range, setRange] = useState(() => monthWindow(new Date()));
 
   useEffect(() => {
     const fetchEvents = async () => {
       try {
-        const backendEvents = await api.getEvents();
+        // The browser revalidates with the ETag, so an unchanged window is a 304
+        const backendEvents = await api.getEvents(range);
         const parsedBackendEvents = backendEvents.map(event => ({
           ...event,
           start: new Date(event.start_time || event.start),
@@ -112,7 +120,16 @@ const Scheduler = () => {
       }
     };
     fetchEvents();
-  }, []);
+  }, [range]);
+
+  const handleRangeChange = (visible) => {
+    const start = Array.isArray(visible) ? visible[0] : visible.start;
+    const end = Array.isArray(visible) ? visible[visible.length - 1] : visible.end;
+    setRange({
+      from: moment(start).startOf('day').toISOString(),
+      to: moment(end).endOf('day').toISOString(),
+    });
+  };
 
   const handleSelectSlot = (slotInfo) => {
     setNewEvent({ title: '', start: slotInfo.start, end: slotInfo.end, person: '', description: '' });
@@ -185,6 +202,7 @@ const Scheduler = () => {
         endAccessor="end"
         style={{ height: 'calc(100vh - 200px)', minHeight: '500px' }}
         onSelectSlot={handleSelectSlot}
+        onRangeChange={handleRangeChange}
         onSelectEvent={(event) => alert(event.description)}
         components={{
           event: eventRenderer,
@@ -63,6 +63,12 @@ export const AuthProvider = ({ children }) => {
     }
   };
 
+  const updateProfile = async (fields) => {
+    const updated = await api.updateProfile(fields);
+    setUser(updated);
+    return updated;
+  };
+
   const logout = async () => {
     try {
       await api.logout();
@@ -82,6 +88,7 @@ export const AuthProvider = ({ children }) => {
     login,
     signup,
     logout,
+    updateProfile,
     isAuthenticated: !!user,
   };
 
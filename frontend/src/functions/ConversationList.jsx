@@ -18,6 +18,12 @@ const ConversationList = ({ onSelectConversation, selectedConversationId }) => {
     fetchConversations();
   }, []);
 
+  const handleSelect = (convo) => {
+    setConversations((prev) => prev.map((c) => (c.id === convo.id ? { ...c, unread_count: 0 } : c)));
+    api.markConversationRead(convo.id).catch((error) => console.error('Error marking conversation read:', error));
+    onSelectConversation(convo.id);
+  };
+
   // Filter conversations based on the selected tab and conversation type
   const filteredConversations = conversations.filter((convo) => {
     if (selectedTab === "Direct") return convo.type === "direct";
@@ -51,13 +57,16 @@ const ConversationList = ({ onSelectConversation, selectedConversationId }) => {
               className={`flex items-center space-x-3 p-2 rounded-lg hover:bg-gray-100 cursor-pointer ${
                 convo.id === selectedConversationId ? 'bg-blue-100' : ''
               }`}
-              onClick={() => onSelectConversation(convo.id)}
+              onClick={() => handleSelect(convo)}
             >
               <div className="w-10 h-10 bg-gray-300 rounded-full"></div>
-              <div>
+              <div className="min-w-0 flex-grow">
                 <div className="font-medium text-gray-800">{convo.name}</div>
-                <div className="text-sm text-gray-500 truncate">{convo.lastMessage}</div>
+                <div className="text-sm text-gray-500 truncate">{convo.last_message?.content}</div>
               </div>
+              {convo.unread_count > 0 && (
+                <div className="text-xs bg-blue-500 text-white rounded-full px-2 py-0.5">{convo.unread_count}</div>
+              )}
             </div>
           ))
         ) : (
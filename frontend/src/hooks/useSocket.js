@@ -5,11 +5,14 @@ const SOCKET_URL = import.meta.env.VITE_API_URL || 'http://localhost:5000';
 
 export const useSocket = () => {
   const socketRef = useRef(null);
+  const heartbeatRef = useRef(null);
   const [connected, setConnected] = useState(false);
 
   useEffect(() => {
     // Initialize socket connection
     socketRef.current = io(SOCKET_URL, {
+      // The server only lets participants join conversation rooms
+      auth: { token: localStorage.getItem('access_token') },
       transports: ['websocket', 'polling'],
       reconnection: true,
       reconnectionDelay: 1000,
@@ -28,10 +31,16 @@ export const useSocket = () => {
 
     socketRef.current.on('connected', (data) => {
       console.log('Server says:', data);
+      // Presence: the server marks this socket offline if heartbeats stop
+      clearInterval(heartbeatRef.current);
+      heartbeatRef.current = setInterval(() => {
+        socketRef.current?.emit('heartbeat');
+      }, (data.heartbeat_interval || 20) * 1000);
     });
 
     // Cleanup on unmount
     return () => {
+      clearInterval(heartbeatRef.current);
       if (socketRef.current) {
         socketRef.current.disconnect();
       }
@@ -62,21 +71,60 @@ export const useSocket = () => {
     }
   };
 
-  const sendTyping = (conversationId, userId, username) => {
+  // Batched counterpart of new_message: { conversation_id, messages }
+  const onNewMessages = (callback) => {
+    if (socketRef.current) {
+      socketRef.current.on('new_messages', callback);
+    }
+  };
+
+  const offNewMessages = () => {
+    if (socketRef.current) {
+      socketRef.current.off('new_messages');
+    }
+  };
+
+  // Safe to call on every keystroke; the server throttles and stops idle typers itself
+  const sendTyping = (conversationId, userId, username, typing = true) => {
     if (socketRef.current && conversationId) {
-      socketRef.current.emit('typing', { conversation_id: conversationId, user_id: userId, username });
+      socketRef.current.emit('typing', { conversation_id: conversationId, user_id: userId, username, typing });
     }
   };
 
+  // callback receives { conversation_id, started: [{ user_id, username }], stopped: [user_id] }
   const onUserTyping = (callback) => {
     if (socketRef.current) {
-      socketRef.current.on('user_typing', callback);
+      socketRef.current.on('typing_update', callback);
     }
   };
 
   const offUserTyping = () => {
     if (socketRef.current) {
-      socketRef.current.off('user_typing');
+      socketRef.current.off('typing_update');
+    }
+  };
+
+  // status: 'online' | 'away' | 'busy' (the strongest across a user's tabs wins)
+  const setStatus = (status) => {
+    if (socketRef.current) {
+      socketRef.current.emit('heartbeat', { status });
+    }
+  };
+
+  // callback receives { [user_id]: status } now, then again for every change
+  const subscribePresence = (userIds, callback) => {
+    if (socketRef.current && userIds.length) {
+      socketRef.current.on('presence_update', (update) => callback(update.users));
+      socketRef.current.emit('subscribe_presence', { user_ids: userIds }, (ack) => {
+        if (ack && ack.users) callback(ack.users);
+      });
+    }
+  };
+
+  const unsubscribePresence = () => {
+    if (socketRef.current) {
+      socketRef.current.off('presence_update');
+      socketRef.current.emit('unsubscribe_presence');
     }
   };
 
@@ -87,8 +135,13 @@ export const useSocket = () => {
     leaveConversation,
     onNewMessage,
     offNewMessage,
+    onNewMessages,
+    offNewMessages,
     sendTyping,
     onUserTyping,
     offUserTyping,
+    setStatus,
+    subscribePresence,
+    unsubscribePresence,
   };
 };
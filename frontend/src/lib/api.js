@@ -68,9 +68,22 @@ class API {
     return response.data;
   }
 
+  // fields: { username, full_name, avatar_url, bio }
+  async updateProfile(fields) {
+    const response = await this.client.put('/auth/me', fields);
+    return response.data;
+  }
+
+  // Public profiles for many users in one request: returns { [id]: profile }
+  async getUsers(ids) {
+    const response = await this.client.post('/users/batch', { ids });
+    return response.data;
+  }
+
   // Events endpoints
-  async getEvents() {
-    const response = await this.client.get('/events');
+  // params: { from, to } ISO timestamps; recurring events are expanded in the window
+  async getEvents(params = {}) {
+    const response = await this.client.get('/events', { params });
     return response.data;
   }
 
@@ -80,16 +93,30 @@ class API {
   }
 
   // Conversations endpoints
+  // Sorted by activity; each has last_message, last_activity_at and unread_count
   async getConversations() {
     const response = await this.client.get('/conversations');
     return response.data;
   }
 
-  async getMessages(conversationId) {
-    const response = await this.client.get(`/conversations/${conversationId}/messages`);
+  async markConversationRead(conversationId) {
+    const response = await this.client.post(`/conversations/${conversationId}/read`);
     return response.data;
   }
 
+  // params: { limit, before, after, since } - see backend get_messages.
+  // Returns { messages, prevCursor, nextCursor, hasMore }; pass prevCursor as
+  // `before` to load the page of older messages (hasMore says if there is one)
+  async getMessages(conversationId, params = {}) {
+    const response = await this.client.get(`/conversations/${conversationId}/messages`, { params });
+    return {
+      messages: response.data,
+      prevCursor: response.headers['x-prev-cursor'] || null,
+      nextCursor: response.headers['x-next-cursor'] || null,
+      hasMore: response.headers['x-has-more'] === 'true',
+    };
+  }
+
   async sendMessage(conversationId, content) {
     const response = await this.client.post(`/conversations/${conversationId}/messages`, {
       content,
@@ -97,6 +124,19 @@ class API {
     return response.data;
   }
 
+  // messages: [{ conversation_id, content, client_id? }]; returns { messages, rejected }
+  async sendMessages(messages) {
+    const response = await this.client.post('/messages/batch', { messages });
+    return response.data;
+  }
+
+  // params: { q, conversation_id, order: 'relevance' | 'recent', limit, offset }
+  // returns { results: [message + snippet, highlights], total, has_more }
+  async searchMessages(params) {
+    const response = await this.client.get('/search', { params });
+    return response.data;
+  }
+
   // Chatbot endpoints
   async uploadPDF(file) {
     const formData = new FormData();
@@ -109,10 +149,10 @@ class API {
     return response.data;
   }
 
-  async askQuestion(question, pdfText) {
+  async askQuestion(question, sessionId) {
     const response = await this.client.post('/ask_question', {
       question,
-      pdf_text: pdfText,
+      session_id: sessionId,
     });
     return response.data;
   }
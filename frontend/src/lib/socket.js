@@ -2,29 +2,82 @@ import { io } from 'socket.io-client';
 
 const SOCKET_URL = 'http://localhost:5000';
 
+// Packed office movement, see backend/office_wire.py (little-endian)
+const SNAPSHOT_HEADER_SIZE = 7; // u8 version, u32 tick, u16 count
+const SNAPSHOT_ENTRY_SIZE = 10; // u16 index, i16 x_cm, y_cm, z_cm, rotation_mrad
+
+const decodeSnapshot = (buffer, sidForIndex) => {
+  const view = new DataView(buffer);
+  const count = view.getUint16(5, true);
+  const players = [];
+  for (let i = 0; i < count; i++) {
+    const offset = SNAPSHOT_HEADER_SIZE + i * SNAPSHOT_ENTRY_SIZE;
+    const sid = sidForIndex[view.getUint16(offset, true)];
+    if (sid) {
+      players.push([
+        sid,
+        view.getInt16(offset + 2, true),
+        view.getInt16(offset + 4, true),
+        view.getInt16(offset + 6, true),
+        view.getInt16(offset + 8, true),
+      ]);
+    }
+  }
+  return players;
+};
+
 class SocketManager {
   constructor() {
     this.socket = null;
     this.connected = false;
+    this.binary = false;
+    this.sidForIndex = {};
   }
 
-  connect(userId, username) {
+  // options.binary negotiates the compact movement encoding on join_office
+  connect(userId, username, { binary = false } = {}) {
     if (this.socket) {
       console.log('Socket already connected');
       return this.socket;
     }
 
     this.socket = io(SOCKET_URL, {
+      // Presence (join_office, heartbeat) only counts authenticated sockets
+      auth: { token: localStorage.getItem('access_token') },
       transports: ['websocket'],
       reconnection: true,
     });
+    this.binary = binary;
+
+    // Binary snapshots identify players by index instead of sid
+    this.socket.on('office_welcome', (welcome) => {
+      this.binary = welcome.encoding === 'binary';
+    });
+    this.socket.on('current_players', (players) => {
+      players.forEach((p) => { this.sidForIndex[p.index] = p.sid; });
+    });
+    this.socket.on('player_joined', (player) => {
+      this.sidForIndex[player.index] = player.sid;
+    });
 
     this.socket.on('connect', () => {
       console.log('✓ Socket connected:', this.socket.id);
       this.connected = true;
       
       // Join the office room
-      this.socket.emit('join_office', { user_id: userId, username });
+      this.socket.emit('join_office', {
+        user_id: userId,
+        username,
+        ...(binary ? { encoding: 'binary' } : {}),
+      });
+    });
+
+    // Keeps the office user online in presence (see backend presence.py)
+    this.socket.on('connected', (data) => {
+      clearInterval(this.heartbeat);
+      this.heartbeat = setInterval(() => {
+        this.socket?.emit('heartbeat');
+      }, (data.heartbeat_interval || 20) * 1000);
     });
 
     this.socket.on('disconnect', () => {
@@ -36,6 +89,7 @@ class SocketManager {
   }
 
   disconnect() {
+    clearInterval(this.heartbeat);
     if (this.socket) {
       this.socket.emit('leave_office');
       this.socket.disconnect();
@@ -46,7 +100,16 @@ class SocketManager {
 
   emitPlayerMove(position, rotation) {
     if (this.socket && this.connected) {
-      this.socket.emit('player_move', { position, rotation });
+      if (this.binary) {
+        const view = new DataView(new ArrayBuffer(8));
+        view.setInt16(0, Math.round(position.x * 100), true);
+        view.setInt16(2, Math.round(position.y * 100), true);
+        view.setInt16(4, Math.round(position.z * 100), true);
+        view.setInt16(6, Math.round(rotation * 1000), true);
+        this.socket.emit('player_move', view.buffer);
+      } else {
+        this.socket.emit('player_move', { position, rotation });
+      }
     }
   }
 
@@ -65,6 +128,21 @@ class SocketManager {
   onPlayerMoved(callback) {
     if (this.socket) {
       this.socket.on('player_moved', callback);
+      // The server batches moves into one snapshot per tick:
+      // { t, p: [[sid, x_cm, y_cm, z_cm, rotation_mrad], ...] }
+      const applySnapshot = (players) => {
+        players.forEach(([sid, x, y, z, rotation]) => {
+          callback({
+            sid,
+            position: { x: x / 100, y: y / 100, z: z / 100 },
+            rotation: rotation / 1000,
+          });
+        });
+      };
+      this.socket.on('players_snapshot', (snapshot) => applySnapshot(snapshot.p));
+      this.socket.on('players_snapshot_bin', (buffer) => {
+        applySnapshot(decodeSnapshot(buffer, this.sidForIndex));
+      });
     }
   }
 
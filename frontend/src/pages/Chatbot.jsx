@@ -2,6 +2,28 @@ import React, { useState, useEffect, useRef } from "react";
 import Navbar from "../components/Navbar";
 import { FaSpinner, FaPaperPlane, FaFilePdf } from 'react-icons/fa';
 
+// Parse a text/event-stream response body, calling onEvent(event, data) per frame
+const readEventStream = async (response, onEvent) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      const event = frame.match(/^event: (.*)$/m)?.[1];
+      const data = frame.match(/^data: (.*)$/m)?.[1];
+      if (event && data) onEvent(event, JSON.parse(data));
+    }
+  }
+};
+
 const Chatbot = () => {
   const [messages, setMessages] = useState([]);
   const [inputMessage, setInputMessage] = useState("");
@@ -89,7 +111,7 @@ const Chatbot = () => {
     setLoading(true);
 
     try {
-      const response = await fetch("http://localhost:5000/ask_question", {
+      const response = await fetch("http://localhost:5000/ask_question?stream=1", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -100,6 +122,22 @@ const Chatbot = () => {
         }),
       });
 
+      if (response.ok && response.headers.get("Content-Type")?.startsWith("text/event-stream")) {
+        // Show the answer token by token as the server streams it
+        setMessages(prev => [...prev, { role: "assistant", content: "", timestamp: new Date().toISOString() }]);
+        setLoading(false);
+        await readEventStream(response, (event, data) => {
+          if (event === "token" || event === "error") {
+            const text = event === "token" ? data.text : data.error;
+            setMessages(prev => {
+              const last = prev[prev.length - 1];
+              return [...prev.slice(0, -1), { ...last, content: last.content + text }];
+            });
+          }
+        });
+        return;
+      }
+
       const data = await response.json();
 
       if (response.ok) {